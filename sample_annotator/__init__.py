@@ -3,6 +3,8 @@ import os
 MAIN_MODEL_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), "model")
 MAIN_SCHEMA_DIR = os.path.join(MAIN_MODEL_DIR, "schema")
 MIXS_SCHEMA = os.path.join(MAIN_SCHEMA_DIR, "mixs.json")
+CACHE_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), "cache")
+MIXS_SNAPSHOT = os.path.join(CACHE_DIR, "mixs.snapshot")
 
 from .sample_annotator import SampleAnnotator
 from .geolocation.geotools import GeoEngine
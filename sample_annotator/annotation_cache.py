@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from diskcache import Cache
+
+from .report_model import AnnotationReport, SAMPLE, STUDY
+
+# bump whenever a change to the annotator alters the reports it produces
+ANNOTATOR_VERSION = 2
+
+
+def canonical_digest(obj: Any) -> str:
+    """
+    sha256 of the canonical JSON form of an object, so key order and whitespace do not matter
+    """
+    text = json.dumps(obj, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+@dataclass
+class AnnotationCache:
+    """
+    On-disk cache of annotation reports, keyed by a hash of the input sample and study
+
+    namespace identifies everything else the report depends on (schema, annotator version
+    and configuration). Each namespace is stored in its own subdirectory, so annotators
+    configured differently can share a directory without evicting each other's reports.
+    Reports are stored without their input, which is restored from the sample being looked up
+    """
+    directory: str
+    namespace: str = None
+    hits: int = 0
+    misses: int = 0
+    store: Cache = None
+
+    def __post_init__(self):
+        if self.store is None:
+            self.store = Cache(self.namespace_directory())
+
+    def __getstate__(self) -> Dict:
+        # the sqlite connection is reopened in each process
+        state = self.__dict__.copy()
+        state['store'] = None
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self.store = Cache(self.namespace_directory())
+
+    def namespace_directory(self) -> str:
+        return os.path.join(self.directory, canonical_digest(self.namespace)[:16])
+
+    @staticmethod
+    def key(sample: SAMPLE, study: STUDY = None) -> str:
+        return canonical_digest([sample, study])
+
+    def get(self, sample: SAMPLE, study: STUDY = None) -> Optional[AnnotationReport]:
+        report = self.store.get(self.key(sample, study), None)
+        if report is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        report.input = sample
+        return report
+
+    def set(self, sample: SAMPLE, study: STUDY, report: AnnotationReport) -> None:
+        input = report.input
+        report.input = None
+        try:
+            self.store[self.key(sample, study)] = report
+        finally:
+            report.input = input
+
+    def clear(self) -> None:
+        self.store.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.store)}
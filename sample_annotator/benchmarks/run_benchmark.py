@@ -0,0 +1,139 @@
+import json
+import logging
+import platform
+import sys
+import time
+from typing import Dict, List, Optional
+
+import click
+
+from sample_annotator.geolocation.offline import OfflineGeoEngine
+from sample_annotator.parallel import DEFAULT_CHUNK_SIZE
+from sample_annotator.sample_annotator import SampleAnnotator
+from sample_annotator.benchmarks.synthetic import SyntheticSampleGenerator
+
+
+def peak_rss_mb(children: bool = False) -> Optional[float]:
+    """
+    Peak resident set size of this process, or of the largest of its finished children,
+    in MB; None where the resource module is not available (Windows)
+    """
+    if sys.platform == 'win32':
+        return None
+    import resource
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return usage / (1024 * 1024) if sys.platform == 'darwin' else usage / 1024
+
+
+def run_benchmark(generator: SyntheticSampleGenerator, n: int, workers: int = 1,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE) -> Dict:
+    """
+    Annotate n synthetic samples with annotate_all, returning throughput, stage timings
+    and the peak memory of this process and of its worker processes
+    """
+    samples = generator.samples(n)
+    annotator = SampleAnnotator(geoengine=OfflineGeoEngine())
+    annotator.warm_up()
+    start = time.perf_counter()
+    amsr = annotator.annotate_all(samples, workers=workers, chunk_size=chunk_size)
+    seconds = time.perf_counter() - start
+    return {'samples': n,
+            'workers': workers,
+            'seconds': seconds,
+            'samples_per_sec': n / seconds if seconds > 0 else None,
+            'messages': sum(len(r.messages) for r in amsr.reports),
+            'stages': {row.pop('stage'): row for row in amsr.timings.summary()},
+            'peak_rss_mb': peak_rss_mb(),
+            'children_peak_rss_mb': peak_rss_mb(children=True)}
+
+
+def compare(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """
+    Describe each result whose throughput is more than tolerance below the baseline run
+    with the same number of samples and workers
+    """
+    regressions = []
+    baseline_runs = {(b['samples'], b['workers']): b for b in baseline}
+    for r in results:
+        b = baseline_runs.get((r['samples'], r['workers']), None)
+        if b is None or not b.get('samples_per_sec') or not r.get('samples_per_sec'):
+            continue
+        ratio = r['samples_per_sec'] / b['samples_per_sec']
+        logging.info(f'{r["samples"]} samples, {r["workers"]} workers: {ratio:.2f}x baseline')
+        if ratio < 1 - tolerance:
+            regressions.append(f'{r["samples"]} samples, {r["workers"]} workers: '
+                               f'{r["samples_per_sec"]:.0f} samples/sec vs {b["samples_per_sec"]:.0f} in baseline')
+    return regressions
+
+
+@click.command()
+@click.option("--sizes", default="1000,10000", show_default=True,
+              help="comma separated numbers of samples to benchmark, e.g. 1000,10000,100000,1000000")
+@click.option("--workers", "-w", default=1, show_default=True,
+              help="number of worker processes to annotate with")
+@click.option("--chunk-size", default=DEFAULT_CHUNK_SIZE, show_default=True,
+              help="number of samples sent to a worker at a time")
+@click.option("--seed", default=0, show_default=True,
+              help="random seed for the synthetic samples")
+@click.option("--alias-rate", default=0.2, show_default=True,
+              help="fraction of samples with a key written as an alias")
+@click.option("--null-rate", default=0.2, show_default=True,
+              help="fraction of samples with a null-ish value")
+@click.option("--enum-rate", default=0.3, show_default=True,
+              help="fraction of samples with an enumerated field")
+@click.option("--measurement-rate", default=0.5, show_default=True,
+              help="fraction of samples with a measurement field")
+@click.option("--output", "-o",
+              help="JSON file to write results to")
+@click.option("--baseline", "-b", type=click.Path(),
+              help="JSON results of an earlier run to compare against")
+@click.option("--tolerance", default=0.2, show_default=True,
+              help="fraction below baseline throughput that counts as a regression")
+@click.option("--fail-on-regression/--no-fail-on-regression", default=False, show_default=True,
+              help="exit with an error if there is a regression")
+def cli(sizes: str, workers: int, chunk_size: int, seed: int, alias_rate: float, null_rate: float,
+        enum_rate: float, measurement_rate: float, output: str, baseline: str, tolerance: float,
+        fail_on_regression: bool):
+    """
+Benchmark annotate_all on synthetic samples, with offline geolocation
+
+Samples are generated from examples/gold.json and tests/inputs, so this runs from a
+source checkout rather than an installed package
+    """
+    generator = SyntheticSampleGenerator(seed=seed, alias_rate=alias_rate, null_rate=null_rate,
+                                         enum_rate=enum_rate, measurement_rate=measurement_rate)
+    results = []
+    for n in [int(size) for size in sizes.split(',')]:
+        result = run_benchmark(generator, n, workers=workers, chunk_size=chunk_size)
+        message = f'{n} samples: {result["samples_per_sec"]:.0f} samples/sec'
+        if result['peak_rss_mb'] is not None:
+            message += f', peak RSS {result["peak_rss_mb"]:.0f} MB'
+            if workers > 1:
+                message += f' (largest worker {result["children_peak_rss_mb"]:.0f} MB)'
+        click.echo(message, err=True)
+        results.append(result)
+    doc = {'python': platform.python_version(),
+           'platform': platform.platform(),
+           'rates': {'alias': alias_rate, 'null': null_rate, 'enum': enum_rate, 'measurement': measurement_rate},
+           'results': results}
+    if output is not None:
+        with open(output, 'w') as stream:
+            json.dump(doc, stream, indent=2)
+    else:
+        click.echo(json.dumps(doc, indent=2))
+    if baseline is not None:
+        with open(baseline) as stream:
+            baseline_doc = json.load(stream)
+        if baseline_doc.get('platform') != doc['platform'] or baseline_doc.get('python') != doc['python']:
+            click.echo(f'Baseline was recorded on {baseline_doc.get("platform")}, Python {baseline_doc.get("python")}; '
+                       f'regenerate it on this machine for a like-for-like comparison', err=True)
+        regressions = compare(results, baseline_doc['results'], tolerance)
+        for regression in regressions:
+            click.echo(f'REGRESSION: {regression}', err=True)
+        if regressions and fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    cli()
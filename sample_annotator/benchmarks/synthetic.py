@@ -0,0 +1,109 @@
+import json
+import os
+import random
+from dataclasses import dataclass, field
+from typing import Iterator, List
+
+import yaml
+
+from sample_annotator.metadata.sample_schema import SampleSchema, MIXS_LEGACY_SYNONYMS
+from sample_annotator.report_model import SAMPLE
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+GOLD_EXAMPLES = os.path.join(ROOT, 'examples', 'gold.json')
+TEST_SAMPLES = os.path.join(ROOT, 'tests', 'inputs', 'test_sample_info.yaml')
+
+# values tidy_nulls removes, and null-ish values it currently leaves alone
+NULL_VALUES = [None, '', ' ', [], 'missing', 'not applicable', 'NA']
+
+MEASUREMENT_VALUES = ['2m', '0.5 m', '12.5 Celsius', '3-5 m', '10 to 20 cm', '-4 degree Celsius',
+                      '7.2', '35 ppt', '1013 millibar', '1.2 kg', 'about 5 meters']
+
+
+def load_seed_samples(paths: List[str] = None) -> List[SAMPLE]:
+    """
+    Example samples to base synthetic samples on: a JSON array of samples, or a test
+    yaml file whose tests each have a sample
+
+    The default seeds are the repository's examples and test inputs, which are not part
+    of the installed package, so they are only found in a source checkout
+    """
+    if paths is None:
+        paths = [GOLD_EXAMPLES, TEST_SAMPLES]
+        missing = [path for path in paths if not os.path.exists(path)]
+        if missing:
+            raise FileNotFoundError(f'Seed samples not found: {", ".join(missing)}; '
+                                    f'benchmarks run from a source checkout of sample-annotator')
+    seeds = []
+    for path in paths:
+        with open(path) as stream:
+            if path.endswith('.json'):
+                seeds.extend(json.load(stream))
+            else:
+                seeds.extend(t['sample'] for t in yaml.safe_load(stream).get('tests', []))
+    return seeds
+
+
+@dataclass
+class SyntheticSampleGenerator:
+    """
+    Generates MIxS-like samples from seed samples, with controllable rates of the
+    things the annotator has to repair
+
+    Each rate is the probability that a sample gets one such field: a key written as a
+    schema alias or legacy name, a null-ish value, an enumerated field (half of them
+    with a value outside the enumeration) and a measurement field. Every sample gets its
+    own lat_lon near its seed's. Output is deterministic for a given seed.
+    """
+    seeds: List[SAMPLE] = field(default_factory=load_seed_samples)
+    schema: SampleSchema = field(default_factory=SampleSchema)
+    seed: int = 0
+    alias_rate: float = 0.2
+    null_rate: float = 0.2
+    enum_rate: float = 0.3
+    measurement_rate: float = 0.5
+
+    def __post_init__(self):
+        schema = self.schema
+        schema.build_alias_index()
+        slots = schema.slotdict()
+        self.aliases = sorted(a for a, s in schema.slot_dict_by_alias.items() if a not in slots and '/' not in a)
+        self.aliases.extend(sorted(MIXS_LEGACY_SYNONYMS))
+        self.enum_fields = {}
+        for k in sorted(slots):
+            enum = schema.get_enumerations(k)
+            if enum is not None and enum.get('permissible_values'):
+                self.enum_fields[k] = sorted(enum['permissible_values'])
+        self.measurement_fields = sorted(k for k in slots if schema.is_measurement_field(k))
+
+    def iter_samples(self, n: int) -> Iterator[SAMPLE]:
+        rng = random.Random(self.seed)
+        enum_fields = list(self.enum_fields)
+        for i in range(n):
+            sample = dict(rng.choice(self.seeds))
+            sample['id'] = f'SYNTH:{i}'
+            sample['lat_lon'] = self.lat_lon(rng, sample.get('lat_lon', None))
+            if rng.random() < self.alias_rate:
+                sample[rng.choice(self.aliases)] = 'synthetic value'
+            if rng.random() < self.null_rate:
+                sample[rng.choice(self.measurement_fields)] = rng.choice(NULL_VALUES)
+            if rng.random() < self.enum_rate:
+                k = rng.choice(enum_fields)
+                sample[k] = rng.choice(self.enum_fields[k]) if rng.random() < 0.5 else 'not a permissible value'
+            if rng.random() < self.measurement_rate:
+                sample[rng.choice(self.measurement_fields)] = rng.choice(MEASUREMENT_VALUES)
+            yield sample
+
+    def samples(self, n: int) -> List[SAMPLE]:
+        return list(self.iter_samples(n))
+
+    @staticmethod
+    def lat_lon(rng: random.Random, ll_str: str = None) -> str:
+        try:
+            lat, lon = [float(x) for x in ll_str.split(' ')]
+        except (AttributeError, ValueError):
+            lat, lon = rng.uniform(-60, 70), rng.uniform(-180, 180)
+        lat = max(-90.0, min(90.0, lat + rng.uniform(-1, 1)))
+        lon = (lon + rng.uniform(-1, 1) + 180) % 360 - 180
+        return f'{lat:.4f} {lon:.4f}'
+
@@ -0,0 +1,301 @@
+import time
+from collections import defaultdict
+from functools import partial
+from itertools import chain
+from typing import Any, Dict, List, Tuple, TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+
+from .report_model import AnnotationReport, AnnotationMultiSampleReport, Message, Category, SAMPLE, STUDY
+from .timings import StageTimings
+
+if TYPE_CHECKING:
+    from .sample_annotator import SampleAnnotator
+
+# the stages that tidy fields, in order; annotate_frame performs them a column at a time
+NULLS_STAGE = 'tidy_nulls'
+KEYS_STAGE = 'tidy_keys'
+ENUMERATIONS_STAGE = 'tidy_enumerations'
+MEASUREMENTS_STAGE = 'tidy_measurements'
+TIDY_STAGES = [NULLS_STAGE, KEYS_STAGE, ENUMERATIONS_STAGE, MEASUREMENTS_STAGE]
+
+# the two passes of tidy_keys that rename keys, as bits of a moved mask
+UNDERSCORE_PASS = 1
+ALIAS_PASS = 2
+
+
+def frame_records(table: Any) -> List[SAMPLE]:
+    """
+    Rows of a pandas DataFrame or a pyarrow Table as sample dicts, with missing values
+    (NaN, None, NA) as None
+    """
+    if hasattr(table, 'to_pylist'):
+        import pyarrow.types
+        records = table.to_pylist()
+        # Arrow keeps NaN in floating point columns, where pandas treats it as missing
+        floats = [f.name for f in table.schema if pyarrow.types.is_floating(f.type)]
+        for record in records:
+            for name in floats:
+                v = record[name]
+                if v is not None and v != v:
+                    record[name] = None
+        return records
+    frame = table.astype(object)
+    frame = frame.where(frame.notna(), None)
+    columns = list(frame.columns)
+    return [dict(zip(columns, row)) for row in frame.to_numpy().tolist()]
+
+
+def null_mask(values: pd.Series) -> np.ndarray:
+    """
+    Vectorized form of the nulls tidy rule: None, blank strings and empty lists
+    """
+    text = values.astype(str)
+    mask = (values.isna() | text.str.strip().eq('')).to_numpy(dtype=bool, copy=True)
+    maybe_list = text.eq('[]').to_numpy(dtype=bool)
+    if maybe_list.any():
+        mask[maybe_list] |= [v == [] for v in values[maybe_list]]
+    return mask
+
+
+def memo_key(v: Any) -> Any:
+    """
+    Key for caching a per-value result, or None if v is unhashable; the type is part of
+    the key since e.g. 5 and 5.0 are equal but reported differently
+    """
+    try:
+        hash(v)
+    except TypeError:
+        return None
+    return type(v), v
+
+
+class ValueResults:
+    """
+    Tidied value and messages of one per-value rule, computed once per distinct value
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.results: Dict[Any, Tuple[Any, List[Message]]] = {}
+
+    def get(self, v: Any) -> Tuple[Any, List[Message]]:
+        key = memo_key(v)
+        result = None if key is None else self.results.get(key, None)
+        if result is None:
+            scratch = AnnotationReport(messages=[])
+            result = self.fn(v, scratch), scratch.messages
+            if key is not None:
+                self.results[key] = result
+        return result
+
+
+class ColumnPlan:
+    """
+    What tidy_keys does with one column: its renames and their messages, which are the
+    same for every row; and from the plan of the final key, whether its values are
+    checked as an enumeration or parsed as measurements
+    """
+
+    def __init__(self, annotator: "SampleAnnotator", key: str, index: int):
+        self.index = index
+        self.moved = 0
+        self.targets = []
+        plan = annotator.get_field_plan(key)
+        self.underscore_message = None
+        if plan.needs_underscoring:
+            self.underscore_message = Message('Key not underscored: {}', params=(key,), was_repaired=True)
+            key = plan.underscored
+            self.targets.append(key)
+            self.moved |= 1 << UNDERSCORE_PASS
+            plan = annotator.get_field_plan(key)
+        self.alias_message = None
+        if plan.is_unknown:
+            self.alias_message = Message('Invalid field: {}', params=(key,), category=Category.UnknownField)
+        elif plan.is_alias:
+            self.alias_message = Message('Alias used: {} => {}', params=(key, plan.slot_name), was_repaired=True)
+            key = plan.slot_name
+            self.targets.append(key)
+            self.moved |= 1 << ALIAS_PASS
+            plan = annotator.get_field_plan(key)
+        self.key = key
+        self.plan = plan
+
+
+def tidy_group(annotator: "SampleAnnotator", layout: Tuple[str, ...], samples: List[SAMPLE],
+               reports: List[AnnotationReport], enum_results: Dict[str, ValueResults],
+               measurement_results: ValueResults, timings: StageTimings) -> List[SAMPLE]:
+    """
+    Tidy samples that all have the keys in layout, a column at a time
+
+    Returns the tidied samples; messages are added to the reports in the order the tidy
+    stages would add them to each sample on its own. The time spent on each stage's part
+    of the work is recorded under its name
+    """
+    n = len(samples)
+    start = time.perf_counter()
+    values = [list(column) for column in zip(*(s.values() for s in samples))]
+    # one vectorized null check over the whole group, as a columns x rows grid
+    flat = pd.Series(list(chain.from_iterable(values)), dtype=object)
+    present = ~null_mask(flat).reshape(len(layout), n)
+    timings.record(NULLS_STAGE, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    columns = [ColumnPlan(annotator, k, i) for i, k in enumerate(layout)]
+    # rows in which two fields would end up with the same key are tidied on their own; a
+    # null field is dropped before any renaming, so only fields with values can collide
+    collides = np.zeros(n, dtype=bool)
+    position = {k: i for i, k in enumerate(layout)}
+    owners = defaultdict(list)
+    for c in columns:
+        for target in c.targets:
+            if target in position:
+                collides |= present[c.index] & present[position[target]]
+            owners[target].append(c.index)
+    for indexes in owners.values():
+        if len(indexes) > 1:
+            collides |= present[indexes].sum(axis=0) > 1
+    present_rows = present & ~collides
+    keys_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    enum_messages = {}
+    for c in columns:
+        rows = np.flatnonzero(present_rows[c.index])
+        if not c.plan.is_enum or not len(rows):
+            continue
+        column = values[c.index]
+        results = enum_results.get(c.plan.enum_name, None)
+        if results is None:
+            results = ValueResults(partial(annotator.check_enumeration, c.plan))
+            enum_results[c.plan.enum_name] = results
+        index = annotator.schema.get_enum_index(c.plan.enum_name)
+        valid = pd.Series([column[r] for r in rows], dtype=object).isin(index.values).to_numpy(dtype=bool)
+        messages = {}
+        for r in rows[~valid].tolist():
+            column[r], messages[r] = results.get(column[r])
+        enum_messages[c.index] = messages
+    timings.record(ENUMERATIONS_STAGE, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    measurement_messages = {}
+    for c in columns:
+        rows = np.flatnonzero(present_rows[c.index])
+        if not c.plan.is_measurement or not len(rows):
+            continue
+        column = values[c.index]
+        messages = {}
+        for r in rows.tolist():
+            qv, messages[r] = measurement_results.get(column[r])
+            # results are shared between rows, so each row gets its own copy
+            column[r] = dict(qv) if type(qv) is dict else qv
+        measurement_messages[c.index] = messages
+    timings.record(MEASUREMENTS_STAGE, time.perf_counter() - start)
+
+    tidied = [None] * n
+    for r in np.flatnonzero(collides).tolist():
+        sample = samples[r]
+        annotator.perform_stages(TIDY_STAGES, sample, reports[r], timings)
+        tidied[r] = sample
+
+    # each pass sees the fields in the order the earlier passes left them in: renamed
+    # fields move to the end
+    start = time.perf_counter()
+
+    def indexes(cs) -> np.ndarray:
+        return np.array([c.index for c in cs], dtype=np.intp)
+
+    underscored = indexes(c for c in columns if c.underscore_message is not None)
+    aliased = indexes(sorted((c for c in columns if c.alias_message is not None),
+                             key=lambda c: (c.moved & (1 << UNDERSCORE_PASS), c.index)))
+    order = indexes(sorted(columns, key=lambda c: (c.moved, c.index)))
+    keys = [c.key for c in columns]
+    by_row = present.T
+    for r in np.flatnonzero(~collides).tolist():
+        row = by_row[r]
+        messages = [columns[i].underscore_message for i in underscored[row[underscored]].tolist()]
+        messages.extend(columns[i].alias_message for i in aliased[row[aliased]].tolist())
+        fields = order[row[order]].tolist()
+        for results in (enum_messages, measurement_messages):
+            for i in fields:
+                if i in results:
+                    messages.extend(results[i].get(r, ()))
+        if messages:
+            reports[r].add_messages(messages)
+        tidied[r] = {keys[i]: values[i][r] for i in fields}
+    timings.record(KEYS_STAGE, keys_time + time.perf_counter() - start)
+    return tidied
+
+
+def tidy_columns(annotator: "SampleAnnotator", samples: List[SAMPLE], reports: List[AnnotationReport],
+                 timings: StageTimings) -> List[SAMPLE]:
+    """
+    Columnar form of the tidy stages (TIDY_STAGES) over many samples
+
+    Samples are grouped by their keys (in a table, usually one group), and each group is
+    tidied a column at a time
+    """
+    groups = defaultdict(list)
+    for r, sample in enumerate(samples):
+        groups[tuple(sample)].append(r)
+    tidied = [None] * len(samples)
+    enum_results = {}
+    measurement_results = ValueResults(lambda v, report: annotator.measurement_engine.repair(v, report=report))
+    for layout, rows in groups.items():
+        group = tidy_group(annotator, layout, [samples[r] for r in rows], [reports[r] for r in rows],
+                           enum_results, measurement_results, timings)
+        for r, sample in zip(rows, group):
+            tidied[r] = sample
+    return tidied
+
+
+def can_tidy_columns(annotator: "SampleAnnotator", stages: List[str]) -> bool:
+    """
+    Whether the active stages include the tidy stages, one after another and not overridden,
+    so that tidy_columns gives the same result
+    """
+    from .sample_annotator import SampleAnnotator
+    if NULLS_STAGE not in stages:
+        return False
+    first = stages.index(NULLS_STAGE)
+    if stages[first:first + len(TIDY_STAGES)] != TIDY_STAGES:
+        return False
+    return all(getattr(type(annotator), stage) is getattr(SampleAnnotator, stage) for stage in TIDY_STAGES)
+
+
+def annotate_frame(annotator: "SampleAnnotator", table: Any, study: STUDY = None) -> AnnotationMultiSampleReport:
+    """
+    Annotate the rows of a pandas DataFrame or pyarrow Table
+
+    Reports are the same as annotate_all over frame_records(table). The other stages
+    run a row at a time, but the tidy stages run a column at a time: keys are resolved once
+    per column, nulls found with vectorized string operations, enumerations checked with
+    isin, and each distinct enumeration miss or measurement value is only checked or
+    parsed once. If only some of the tidy stages are selected, a subclass overrides them,
+    or there is an annotation cache, rows are annotated with annotate_all
+    """
+    records = frame_records(table)
+    stages = annotator.active_stages()
+    if not can_tidy_columns(annotator, stages) or annotator.annotation_cache is not None:
+        return annotator.annotate_all(records, study=study)
+    amsr = AnnotationMultiSampleReport(reports=[], timings=StageTimings())
+    timings = amsr.timings
+    annotator.prefetch_geo(records, timings)
+    first = stages.index(NULLS_STAGE)
+    before = stages[:first]
+    after = stages[first + len(TIDY_STAGES):]
+    samples = []
+    for record in records:
+        report = AnnotationReport()
+        report.messages = []
+        report.input = record
+        sample = record.copy()
+        annotator.perform_stages(before, sample, report, timings)
+        amsr.reports.append(report)
+        samples.append(sample)
+    samples = tidy_columns(annotator, samples, amsr.reports, timings)
+    for sample, report in zip(samples, amsr.reports):
+        annotator.perform_stages(after, sample, report, timings)
+        report.output = sample
+    return amsr
@@ -0,0 +1,118 @@
+import hashlib
+import math
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..metadata.schema_snapshot import file_digest
+
+TILE_KEY = Tuple[int, int]
+
+
+def tile_name(key: TILE_KEY) -> str:
+    """
+    SRTM-style name of the tile whose south-west corner is at (lat, lon), e.g. N27E086
+    """
+    lat, lon = key
+    return f'{"N" if lat >= 0 else "S"}{abs(lat):02d}{"E" if lon >= 0 else "W"}{abs(lon):03d}'
+
+
+def format_elevation(value: float) -> str:
+    """
+    Render an elevation the way the ORNL service reports it, e.g. '8752'
+    """
+    if float(value).is_integer():
+        return str(int(value))
+    return str(float(value))
+
+
+@dataclass
+class ElevationTiles:
+    """
+    Offline elevation lookup from a directory of local DEM tiles
+
+    Each tile is a .npy array covering tile_size degrees, named after its south-west
+    corner (e.g. N27E086.npy) and stored north-up, with rows running from the north edge
+    to the south edge and columns from the west edge to the east edge. GeoTIFF or .hgt
+    tiles need to be converted to .npy first. Tiles are memory-mapped; at most
+    max_open_tiles are kept open, least recently used first out.
+    """
+    tile_dir: str
+    tile_size: int = 1
+    nodata: float = -32768
+    max_open_tiles: int = 64
+    open_tiles: Dict[TILE_KEY, Optional[np.ndarray]] = field(default_factory=OrderedDict)
+
+    def __getstate__(self) -> Dict:
+        # worker processes open their own tiles
+        state = self.__dict__.copy()
+        state['open_tiles'] = OrderedDict()
+        return state
+
+    def digest(self) -> str:
+        """
+        sha256 of the names and contents of the tiles, to tell whether lookups would give
+        the same answers
+        """
+        digest = hashlib.sha256(repr(self.tile_size).encode())
+        for name in sorted(n for n in os.listdir(self.tile_dir) if n.endswith('.npy')):
+            digest.update(name.encode())
+            digest.update(file_digest(os.path.join(self.tile_dir, name)))
+        return digest.hexdigest()[:16]
+
+    def tile_key(self, lat: float, lon: float) -> TILE_KEY:
+        size = self.tile_size
+        return math.floor(lat / size) * size, math.floor(lon / size) * size
+
+    def get_tile(self, key: TILE_KEY) -> Optional[np.ndarray]:
+        """
+        Memory-mapped tile, or None if there is no tile for this area
+        """
+        tiles = self.open_tiles
+        if key in tiles:
+            tiles.move_to_end(key)
+            return tiles[key]
+        path = os.path.join(self.tile_dir, tile_name(key) + '.npy')
+        tile = np.load(path, mmap_mode='r') if os.path.exists(path) else None
+        tiles[key] = tile
+        if len(tiles) > self.max_open_tiles:
+            tiles.popitem(last=False)
+        return tile
+
+    def lookup(self, latlons: Sequence[Tuple[float, float]]) -> np.ndarray:
+        """
+        Elevation of each point as floats, NaN where there is no data
+        """
+        result = np.full(len(latlons), np.nan)
+        if len(latlons) == 0:
+            return result
+        points = np.asarray(latlons, dtype=float)
+        lats = points[:, 0]
+        lons = points[:, 1]
+        size = self.tile_size
+        tile_lats = np.floor(lats / size).astype(np.int64) * size
+        tile_lons = np.floor(lons / size).astype(np.int64) * size
+        keys = np.stack([tile_lats, tile_lons], axis=1)
+        unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        for i, (tile_lat, tile_lon) in enumerate(unique_keys):
+            tile = self.get_tile((int(tile_lat), int(tile_lon)))
+            if tile is None:
+                continue
+            idx = np.nonzero(inverse == i)[0]
+            nrows, ncols = tile.shape
+            rows = np.floor((tile_lat + size - lats[idx]) / size * nrows).astype(np.int64)
+            cols = np.floor((lons[idx] - tile_lon) / size * ncols).astype(np.int64)
+            values = tile[np.clip(rows, 0, nrows - 1), np.clip(cols, 0, ncols - 1)].astype(float)
+            values[values == self.nodata] = np.nan
+            result[idx] = values
+        return result
+
+    def get_elevations(self, latlons: Sequence[Tuple[float, float]]) -> List[Optional[str]]:
+        return [None if math.isnan(v) else format_elevation(v) for v in self.lookup(latlons)]
+
+    def get_elevation(self, latlon: Tuple[float, float]) -> Optional[str]:
+        return self.get_elevations([latlon])[0]
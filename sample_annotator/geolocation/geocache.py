@@ -0,0 +1,47 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Tuple, Hashable
+
+from diskcache import Cache
+
+CELL = Tuple[int, int]
+
+# returned by GeoCache.get when nothing is cached (None is a valid cached value)
+MISSING = object()
+
+
+@dataclass
+class GeoCache:
+    """
+    Cache of geo lookups keyed by layer and grid cell
+
+    If directory is set this is a persistent diskcache shared by every process using
+    the same directory, otherwise an in-memory dict
+    """
+    directory: str = None
+    hits: int = 0
+    misses: int = 0
+    store: Any = None
+
+    def __post_init__(self):
+        if self.store is None:
+            self.store = Cache(self.directory) if self.directory else {}
+
+    def get(self, layer: str, cell: Hashable) -> Any:
+        value = self.store.get((layer, cell), MISSING)
+        if value is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, layer: str, cell: Hashable, value: Any) -> None:
+        self.store[(layer, cell)] = value
+
+    def __contains__(self, key: Tuple[str, Hashable]) -> bool:
+        return key in self.store
+
+    def clear(self) -> None:
+        self.store.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.store)}
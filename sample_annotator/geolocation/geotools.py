@@ -1,15 +1,59 @@
 import googlemaps
 from datetime import datetime
-from typing import Optional, List, Set, Any, Tuple
+from typing import Optional, List, Set, Any, Tuple, Iterable, Dict
 from dataclasses import dataclass
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import math
+import numpy as np
 import requests
+from requests.adapters import HTTPAdapter
 import xml.etree.ElementTree as ET
-import csv
-from git_root import git_root
+
+from .geocache import GeoCache, MISSING, CELL
+from .soil_raster import ZoblerSoilRaster, load_zobler_lookup
+from .elevation_tiles import ElevationTiles, format_elevation
+from .google_elevation import GoogleElevation
+from .regions import RegionIndex
+from .wms_tiles import CoverageTile, TILE_KEY, coverage_params, parse_ascii_grid, plan_tiles, tile_bbox, tile_key
 
 LATLON = Tuple[float, float]
 
+GOOGLEMAPS_ERRORS = (googlemaps.exceptions.ApiError, googlemaps.exceptions.HTTPError,
+                     googlemaps.exceptions.Timeout, googlemaps.exceptions.TransportError)
+
+# a failed request, or a response that is not the XML document expected, e.g. an error page
+FETCH_ERRORS = (requests.RequestException, ET.ParseError, IndexError, AttributeError, ValueError)
+
+ORNL_WMS_URL = 'https://webmap.ornl.gov/ogcbroker/wms'
+ORNL_MAPSERV_URL = 'https://webmap.ornl.gov/cgi-bin/mapserv'
+ORNL_WCS_URL = 'https://webmap.ornl.gov/ogcbroker/wcs'
+
+ELEVATION_LAYER = '10003_1'
+ELEVATION_CELL_SIZE = 0.008333333333333
+ELEVATION_TILE_LAYER = 'tile:' + ELEVATION_LAYER
+GOOGLE_ELEVATION_LAYER = 'google_elevation'
+REGION_LAYER = 'region'
+SOIL_LAYER = '540_1_band1'
+SOIL_CELL_SIZE = 0.5
+
+
+def parse_lat_lon(ll_str: str) -> LATLON:
+    """
+    Parse a MIxS lat_lon value, e.g. '68.3534 19.0472'
+    """
+    return tuple([float(x.strip()) for x in ll_str.split(' ')])
+
+
+def grid_cell(latlon: LATLON, cell_size: float) -> CELL:
+    """
+    Index of the grid cell of size cell_size degrees that contains a point
+    """
+    lat = latlon[0]
+    lon = latlon[1]
+    return math.floor((lon + 180) / cell_size), math.floor((lat + 90) / cell_size)
+
 
 @dataclass
 class GeoEngine():
@@ -20,9 +64,50 @@ class GeoEngine():
     (API KEY required)
 
     In future this will wrap ORNL Identify
+
+    Lookups are cached by layer and grid cell (the resolution of the underlying
+    layer), so nearby and repeated points only query a service once; set cache_dir
+    to persist the cache across runs
+
+    If soil_raster is set, soil types are read from a local copy of the Zobler grid
+    instead of the ORNL WMS; likewise elevation_tiles for local DEM tiles
+
+    Remote requests share a pooled, keep-alive HTTP session; prefetch resolves a
+    batch with up to concurrency requests in flight
+
+    If tile_size is set, elevation is read from tile_size degree coverage tiles
+    instead of one GetFeatureInfo request per point: a batch is clustered into tiles,
+    each tile is fetched once from coverage_url and cached, and every point in it is
+    sampled from the tile array
+
+    If google_elevation is set, elevation comes from the Google Maps Elevation API
+    instead, cached per distinct point; prefetch packs a batch into as few requests as
+    the API allows
+
+    If regions is set, get_region reverse geocodes a point offline to the name of
+    the country or region polygon containing it
     """
     googlemaps_api_key: str = None
     client = None
+    cache_dir: str = None
+    cache: GeoCache = None
+    soil_raster: ZoblerSoilRaster = None
+    elevation_tiles: ElevationTiles = None
+    google_elevation: GoogleElevation = None
+    regions: RegionIndex = None
+    elevation_url: str = ORNL_WMS_URL
+    soil_url: str = ORNL_MAPSERV_URL
+    coverage_url: str = ORNL_WCS_URL
+    tile_size: float = None
+    timeout: float = 30.0
+    concurrency: int = 8
+    session: requests.Session = None
+
+    def __getstate__(self) -> Dict:
+        # sessions hold open connections; each process makes its own
+        state = self.__dict__.copy()
+        state['session'] = None
+        return state
 
     def load_key(self, path: str) -> None:
         with open(path) as stream:
@@ -36,7 +121,181 @@ class GeoEngine():
             self.client = googlemaps.Client(key=self.googlemaps_api_key)
         return self.client
 
+    def get_cache(self) -> GeoCache:
+        if self.cache is None:
+            self.cache = GeoCache(directory=self.cache_dir)
+        return self.cache
+
+    def get_session(self) -> requests.Session:
+        if self.session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.concurrency)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            self.session = session
+        return self.session
+
+    def prefetch(self, latlons: Iterable[LATLON]) -> None:
+        """
+        Look up elevation and soil type for a batch of points, once per distinct grid cell
+
+        Requests run concurrently; see prefetch_async
+        """
+        latlons = list(latlons)
+        if not latlons:
+            return
+        if self.regions is not None:
+            self.prefetch_regions(latlons)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(self.prefetch_async(latlons))
+            return
+        # called from inside an event loop (e.g. a notebook): run the batch on its own loop
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(asyncio.run, self.prefetch_async(latlons)).result()
+
+    async def prefetch_async(self, latlons: List[LATLON]) -> None:
+        """
+        Fetch every uncached grid cell of a batch, with at most concurrency requests in flight
+
+        Blocking requests run in worker threads over the shared session. A failed cell is
+        logged and left uncached, so it is retried when the sample is annotated
+        """
+        cache = self.get_cache()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch_cell(layer, cell, fetch, latlon):
+            async with semaphore:
+                try:
+                    value = await asyncio.to_thread(fetch, latlon)
+                except FETCH_ERRORS as e:
+                    logging.warning(f'Prefetch of {layer} at {latlon} failed: {e}')
+                    return
+            if value is not MISSING:
+                cache.set(layer, cell, value)
+
+        async def fetch_tile(key, cells):
+            async with semaphore:
+                try:
+                    tile = await asyncio.to_thread(self.get_elevation_tile, key)
+                except requests.RequestException as e:
+                    logging.warning(f'Prefetch of elevation tile {key} failed: {e}')
+                    return
+            if tile is not None:
+                for (cell, _), value in zip(cells, self.sample_elevation_tile(tile, [latlon for _, latlon in cells])):
+                    cache.set(ELEVATION_LAYER, cell, value)
+
+        async def fetch_google_elevations(todo):
+            try:
+                elevations = await asyncio.to_thread(self.google_elevation.lookup, todo)
+            except GOOGLEMAPS_ERRORS as e:
+                logging.warning(f'Prefetch of Google elevations failed: {e}')
+                return
+            for latlon, value in elevations.items():
+                cache.set(GOOGLE_ELEVATION_LAYER, latlon, value)
+
+        tasks = []
+        layers = []
+        if self.elevation_tiles is None and self.google_elevation is not None:
+            points = list(dict.fromkeys(tuple(latlon) for latlon in latlons))
+            todo = [latlon for latlon in points if (GOOGLE_ELEVATION_LAYER, latlon) not in cache]
+            logging.info(f'Prefetching {len(todo)} of {len(points)} points from the Google Elevation API')
+            if todo:
+                tasks.append(fetch_google_elevations(todo))
+        elif self.elevation_tiles is None and self.tile_size is not None:
+            cells = {}
+            for latlon in latlons:
+                cells.setdefault(grid_cell(latlon, ELEVATION_CELL_SIZE), latlon)
+            todo = [(cell, latlon) for cell, latlon in cells.items() if (ELEVATION_LAYER, cell) not in cache]
+            plan = plan_tiles([latlon for _, latlon in todo], self.tile_size)
+            logging.info(f'Prefetching {len(todo)} of {len(cells)} cells for layer {ELEVATION_LAYER} '
+                         f'from {len(plan)} tiles')
+            tasks.extend(fetch_tile(key, [todo[i] for i in idxs]) for key, idxs in plan.items())
+        elif self.elevation_tiles is None:
+            layers.append((ELEVATION_LAYER, ELEVATION_CELL_SIZE, self.fetch_elevation))
+        if self.soil_raster is None:
+            layers.append((SOIL_LAYER, SOIL_CELL_SIZE, self.fetch_fao_soil_type))
+        for layer, cell_size, fetch in layers:
+            cells = {}
+            for latlon in latlons:
+                cells.setdefault(grid_cell(latlon, cell_size), latlon)
+            todo = [(cell, latlon) for cell, latlon in cells.items() if (layer, cell) not in cache]
+            logging.info(f'Prefetching {len(todo)} of {len(cells)} cells for layer {layer}')
+            tasks.extend(fetch_cell(layer, cell, fetch, latlon) for cell, latlon in todo)
+        await asyncio.gather(*tasks)
+
+    def prefetch_regions(self, latlons: List[LATLON]) -> None:
+        """
+        Reverse geocode every uncached point of a batch in one vectorized lookup
+        """
+        cache = self.get_cache()
+        layer = self.region_layer()
+        points = list(dict.fromkeys(tuple(latlon) for latlon in latlons))
+        todo = [latlon for latlon in points if (layer, latlon) not in cache]
+        for latlon, region in zip(todo, self.regions.lookup(todo)):
+            cache.set(layer, latlon, region)
+
+    def region_layer(self) -> str:
+        """
+        Cache layer of region lookups; keyed on the regions loaded, so a persistent
+        cache is not shared between GeoJSON files
+        """
+        return f'{REGION_LAYER}:{self.regions.digest or self.regions.source}'
+
+    def get_region(self, latlon: LATLON) -> Optional[str]:
+        """
+        Name of the country or region containing a point, None if unknown
+        """
+        if self.regions is None:
+            return None
+        cache = self.get_cache()
+        layer = self.region_layer()
+        region = cache.get(layer, tuple(latlon))
+        if region is MISSING:
+            region = self.regions.get_region(latlon)
+            cache.set(layer, tuple(latlon), region)
+        return region
+
+    def get_elevations(self, latlons: List[LATLON]) -> List[Optional[str]]:
+        """
+        Elevations of a batch of points; vectorized if local DEM tiles are used
+        """
+        if self.elevation_tiles is not None:
+            return self.elevation_tiles.get_elevations(latlons)
+        return [self.get_elevation(latlon) for latlon in latlons]
+
     def get_elevation(self, latlon: LATLON) -> str:
+        if self.elevation_tiles is not None:
+            return self.elevation_tiles.get_elevation(latlon)
+        cache = self.get_cache()
+        if self.google_elevation is not None:
+            results = cache.get(GOOGLE_ELEVATION_LAYER, tuple(latlon))
+            if results is MISSING:
+                try:
+                    results = self.google_elevation.get_elevation(latlon)
+                except GOOGLEMAPS_ERRORS as e:
+                    logging.warning(f'Google elevation lookup at {latlon} failed: {e}')
+                    return None
+                cache.set(GOOGLE_ELEVATION_LAYER, tuple(latlon), results)
+            return results
+        cell = grid_cell(latlon, ELEVATION_CELL_SIZE)
+        results = cache.get(ELEVATION_LAYER, cell)
+        if results is MISSING:
+            if self.tile_size is not None:
+                tile = self.get_elevation_tile(tile_key(latlon, self.tile_size))
+                results = MISSING if tile is None else self.sample_elevation_tile(tile, [latlon])[0]
+            else:
+                results = self.fetch_elevation(latlon)
+            if results is MISSING:
+                return 'failed'
+            cache.set(ELEVATION_LAYER, cell, results)
+        return results
+
+    def fetch_elevation(self, latlon: LATLON) -> Any:
+        """
+        Query the ORNL WMS for elevation; returns MISSING if the request failed
+        """
         lat = latlon[0]
         lon = latlon[1]
         remX = (lon + 180) % 0.008333333333333
@@ -61,17 +320,75 @@ class GeoEngine():
                       'BBOX': BBOX
 
                       }
-        response = requests.get('https://webmap.ornl.gov/ogcbroker/wms', params=elevparams)
+        response = self.get_session().get(self.elevation_url, params=elevparams, timeout=self.timeout)
         if response.status_code == 200:
             elevxml = response.content.decode('utf-8')
             root = ET.fromstring(elevxml)
             results = (root[3].text)
             return results
         else:
-            results = 'failed'
-            return results
+            return MISSING
+
+    def get_elevation_tile(self, key: TILE_KEY) -> Optional[CoverageTile]:
+        """
+        Cached elevation coverage tile, or None if it could not be fetched
+        """
+        cache = self.get_cache()
+        tile = cache.get(ELEVATION_TILE_LAYER, (key, self.tile_size))
+        if tile is MISSING:
+            tile = self.fetch_elevation_tile(key)
+            if tile is MISSING:
+                return None
+            cache.set(ELEVATION_TILE_LAYER, (key, self.tile_size), tile)
+        return tile
+
+    def fetch_elevation_tile(self, key: TILE_KEY) -> Any:
+        """
+        Fetch one tile_size degree elevation tile as a WCS GetCoverage ASCII grid;
+        returns MISSING if the request failed
+        """
+        params = coverage_params(ELEVATION_LAYER, tile_bbox(key, self.tile_size), ELEVATION_CELL_SIZE)
+        response = self.get_session().get(self.coverage_url, params=params, timeout=self.timeout)
+        if response.status_code != 200:
+            return MISSING
+        try:
+            return parse_ascii_grid(response.content.decode('utf-8'))
+        except (KeyError, ValueError) as e:
+            # e.g. an XML ServiceException instead of a grid
+            logging.warning(f'Could not read elevation tile {key}: {e}')
+            return MISSING
+
+    @staticmethod
+    def sample_elevation_tile(tile: CoverageTile, latlons: List[LATLON]) -> List[Optional[str]]:
+        points = np.asarray(latlons, dtype=float)
+        values = tile.sample(points[:, 0], points[:, 1])
+        return [None if math.isnan(v) else format_elevation(v) for v in values]
+
+    def get_fao_soil_types(self, latlons: List[LATLON]) -> List[Optional[str]]:
+        """
+        Soil types of a batch of points; vectorized if a local soil raster is used
+        """
+        if self.soil_raster is not None:
+            return self.soil_raster.get_fao_soil_types(latlons)
+        return [self.get_fao_soil_type(latlon) for latlon in latlons]
 
     def get_fao_soil_type(self, latlon: LATLON) -> str:
+        if self.soil_raster is not None:
+            return self.soil_raster.get_fao_soil_type(latlon)
+        cache = self.get_cache()
+        cell = grid_cell(latlon, SOIL_CELL_SIZE)
+        results = cache.get(SOIL_LAYER, cell)
+        if results is MISSING:
+            results = self.fetch_fao_soil_type(latlon)
+            if results is MISSING:
+                return None
+            cache.set(SOIL_LAYER, cell, results)
+        return results
+
+    def fetch_fao_soil_type(self, latlon: LATLON) -> Any:
+        """
+        Query the ORNL WMS for the Zobler soil type; returns MISSING if the request failed
+        """
         # Routine to calculate the locations from lat/long
         lat = latlon[0]
         lon = latlon[1]
@@ -82,11 +399,6 @@ class GeoEngine():
         minY = lat - remY
         maxY = lat - remY + 0.5
 
-        # Read in the mapping file note need to get this path right
-        with open(git_root('sample_annotator/geolocation/zobler_540_MixS_lookup.csv')) as mapper:
-            mapping = csv.reader(mapper)
-            map = list(mapping)
-
         BBoxstring = str(minX) + ',' + str(minY) + ',' + str(maxX) + ',' + str(maxY)
 
         faosoilparams = {'INFO_FORMAT': 'text/xml',
@@ -103,14 +415,30 @@ class GeoEngine():
                          'SERVICE': 'WMS',
                          'QUERY_LAYERS': '540_1_band1',
                          'map': '/sdat/config/mapfile//540/540_1_wms.map'}
-        response = requests.get('https://webmap.ornl.gov/cgi-bin/mapserv', params=faosoilparams)
+        response = self.get_session().get(self.soil_url, params=faosoilparams, timeout=self.timeout)
         if response.status_code == 200:
             faosoilxml = response.content.decode('utf-8')
             root = ET.fromstring(faosoilxml)
             results = (root[5].text)
             results = results.split(':')
             results = results[1].strip()
-            for res in map:
-                if res[0] == results:
-                    results = res[1]
-                    return results
+            return load_zobler_lookup().get(results, None)
+        return MISSING
+
+    def config(self) -> Dict[str, Any]:
+        """
+        The settings that decide which backend answers each lookup, e.g. to tell whether
+        stored annotations were made with the same ones; local data is identified by a
+        digest of its contents rather than its path
+        """
+        return {'soil_raster': None if self.soil_raster is None else self.soil_raster.digest(),
+                'elevation_tiles': None if self.elevation_tiles is None else self.elevation_tiles.digest(),
+                'google_elevation': self.google_elevation is not None,
+                'regions': None if self.regions is None else self.regions.digest,
+                'tile_size': self.tile_size,
+                'elevation_url': self.elevation_url,
+                'soil_url': self.soil_url,
+                'coverage_url': self.coverage_url}
+
+    def cache_stats(self) -> Dict[str, int]:
+        return self.get_cache().stats()
@@ -0,0 +1,79 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .elevation_tiles import format_elevation
+
+LATLON = Tuple[float, float]
+
+# the Elevation API accepts at most 512 locations per request
+MAX_LOCATIONS = 512
+
+
+@dataclass
+class GoogleElevation:
+    """
+    Batched elevation lookup using the Google Maps Elevation API
+
+    Identical points are only requested once, each request carries up to max_locations
+    points, and requests are spaced to stay within queries_per_second, across all the
+    threads using it. client is a googlemaps.Client, or anything with the same
+    elevation(locations) method
+    """
+    client: Any
+    max_locations: int = MAX_LOCATIONS
+    queries_per_second: float = 10.0
+    requests_made: int = 0
+    last_request: float = None
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def __getstate__(self) -> Dict:
+        # locks cannot be pickled; each process has its own
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def throttle(self) -> None:
+        """
+        Wait for this request's slot; threads take turns, so their requests are spaced too
+        """
+        with self.lock:
+            if self.last_request is not None and self.queries_per_second:
+                wait = self.last_request + 1.0 / self.queries_per_second - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+            self.last_request = time.monotonic()
+            self.requests_made += 1
+
+    def lookup(self, latlons: Sequence[LATLON]) -> Dict[LATLON, Optional[str]]:
+        """
+        Elevation of each distinct point, None where the API has no result
+        """
+        points = list(dict.fromkeys(tuple(latlon) for latlon in latlons))
+        elevations = {}
+        for start in range(0, len(points), self.max_locations):
+            batch = points[start:start + self.max_locations]
+            self.throttle()
+            results = self.client.elevation(batch)
+            if len(results) != len(batch):
+                logging.warning(f'Expected {len(batch)} elevations, got {len(results)}')
+            # results come back in the order the locations were sent
+            for latlon, result in zip(batch, results):
+                value = result.get('elevation', None)
+                elevations[latlon] = None if value is None else format_elevation(value)
+        for latlon in points:
+            elevations.setdefault(latlon, None)
+        return elevations
+
+    def get_elevations(self, latlons: Sequence[LATLON]) -> List[Optional[str]]:
+        elevations = self.lookup(latlons)
+        return [elevations[tuple(latlon)] for latlon in latlons]
+
+    def get_elevation(self, latlon: LATLON) -> Optional[str]:
+        return self.get_elevations([latlon])[0]
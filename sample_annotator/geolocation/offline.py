@@ -0,0 +1,22 @@
+from typing import Any
+
+from .geocache import MISSING
+from .geotools import GeoEngine, LATLON
+from .soil_raster import load_zobler_table
+
+
+class OfflineGeoEngine(GeoEngine):
+    """
+    GeoEngine whose remote lookups are answered locally, so that benchmarks and tests
+    measure the annotator (including prefetch and the geo cache) rather than the network
+    """
+
+    def fetch_elevation(self, latlon: LATLON) -> Any:
+        return str(int(abs(latlon[0]) * 100 + abs(latlon[1])))
+
+    def fetch_fao_soil_type(self, latlon: LATLON) -> Any:
+        table = load_zobler_table()
+        return table[int(abs(latlon[0] * latlon[1])) % len(table)][1]
+
+    def fetch_elevation_tile(self, key) -> Any:
+        return MISSING
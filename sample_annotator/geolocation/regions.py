@@ -0,0 +1,187 @@
+import csv
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+LATLON = Tuple[float, float]
+
+# properties holding the region name in common country/region GeoJSON files
+NAME_PROPERTIES = ('name', 'NAME', 'ADMIN', 'admin', 'country')
+# properties holding an ISO 3166 alpha-3 (or Natural Earth ADM0_A3) country code
+CODE_PROPERTIES = ('ISO_A3', 'iso_a3', 'ISO3', 'iso3', 'ADM0_A3', 'adm0_a3')
+
+INSDC_COUNTRIES = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'insdc_countries.csv')
+
+
+@lru_cache()
+def load_insdc_countries(path: str = INSDC_COUNTRIES) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    INSDC country names by country code, and country codes by lower case INSDC name
+
+    Rows are (INSDC name, code); the first name given for a code is the one INSDC uses
+    now, later ones are former names and common variants
+    """
+    names = {}
+    codes = {}
+    with open(path) as stream:
+        for row in csv.reader(stream):
+            if len(row) >= 2:
+                names.setdefault(row[1], row[0])
+                codes.setdefault(row[0].lower(), row[1])
+    return names, codes
+
+
+def insdc_country(name: str) -> str:
+    """
+    The current INSDC name of a country, given any name for it in the INSDC table;
+    other names are returned unchanged
+    """
+    names, codes = load_insdc_countries()
+    code = codes.get(name.strip().lower())
+    return name if code is None else names[code]
+
+
+def feature_country_code(properties: Dict) -> Optional[str]:
+    """
+    The first valid country code of a feature; Natural Earth uses -99 where there is none
+    """
+    for key in CODE_PROPERTIES:
+        code = properties.get(key)
+        if isinstance(code, str) and code and not code.startswith('-'):
+            return code.upper()
+    return None
+
+
+def points_in_ring(xs: np.ndarray, ys: np.ndarray, ring: np.ndarray, block_size: int = 1 << 20) -> np.ndarray:
+    """
+    Even-odd ray casting test of many points against one closed ring of (lon, lat) vertices
+
+    Points are tested against blocks of edges at a time, keeping each points x edges
+    block under block_size elements
+    """
+    crossings = np.zeros(len(xs), dtype=np.int64)
+    x1 = ring[:-1, 0]
+    y1 = ring[:-1, 1]
+    x2 = ring[1:, 0]
+    y2 = ring[1:, 1]
+    step = max(1, block_size // max(1, len(xs)))
+    px = xs[:, None]
+    py = ys[:, None]
+    for start in range(0, len(x1), step):
+        ex1 = x1[start:start + step]
+        ey1 = y1[start:start + step]
+        ex2 = x2[start:start + step]
+        ey2 = y2[start:start + step]
+        straddles = (ey1 > py) != (ey2 > py)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xcross = ex1 + (py - ey1) * (ex2 - ex1) / (ey2 - ey1)
+        crossings += (straddles & (px < xcross)).sum(axis=1)
+    return crossings % 2 == 1
+
+
+def polygon_parts(geometry: Dict) -> List[List[np.ndarray]]:
+    """
+    Rings of each polygon of a GeoJSON Polygon or MultiPolygon; the first ring is the exterior
+    """
+    if geometry is None:
+        return []
+    if geometry['type'] == 'Polygon':
+        polygons = [geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        polygons = geometry['coordinates']
+    else:
+        return []
+    parts = []
+    for polygon in polygons:
+        rings = []
+        for ring in polygon:
+            ring = np.asarray(ring, dtype=float)[:, :2]
+            if len(ring) and not np.array_equal(ring[0], ring[-1]):
+                ring = np.vstack([ring, ring[:1]])
+            rings.append(ring)
+        if rings:
+            parts.append(rings)
+    return parts
+
+
+@dataclass
+class RegionIndex:
+    """
+    Offline reverse geocoding: which country or region polygon contains a point
+
+    Polygons are read once from a GeoJSON FeatureCollection. A feature with a country
+    code (CODE_PROPERTIES) in the INSDC table is named with its INSDC country name, so
+    e.g. "United States of America" is "USA"; others are named by the first of
+    NAME_PROPERTIES they have. Lookups are vectorized: the batch is sorted by
+    longitude, each polygon's bounding box selects its candidate points by binary
+    search and a latitude mask, and only candidates are ray cast. Where polygons
+    overlap, the first feature in the file wins
+    """
+    names: List[str] = field(default_factory=list)
+    parts: List[Tuple[int, List[np.ndarray]]] = field(default_factory=list)
+    bboxes: np.ndarray = None
+    source: str = None
+    digest: str = None
+
+    @classmethod
+    def load(cls, path: str, name_property: str = None) -> 'RegionIndex':
+        with open(path, 'rb') as stream:
+            data = stream.read()
+        collection = json.loads(data)
+        # identifies the regions a name came from, for caching lookups
+        digest = hashlib.sha256(data)
+        digest.update(repr(name_property).encode())
+        with open(INSDC_COUNTRIES, 'rb') as stream:
+            digest.update(stream.read())
+        index = cls(source=path, digest=digest.hexdigest()[:16])
+        insdc_names, _ = load_insdc_countries()
+        for feature in collection.get('features', []):
+            properties = feature.get('properties') or {}
+            keys = [name_property] if name_property else NAME_PROPERTIES
+            name = next((properties[k] for k in keys if properties.get(k)), None)
+            name = insdc_names.get(feature_country_code(properties), name)
+            if name is None:
+                continue
+            parts = polygon_parts(feature.get('geometry'))
+            if not parts:
+                continue
+            index.names.append(name)
+            index.parts.extend((len(index.names) - 1, rings) for rings in parts)
+        index.bboxes = np.array([[rings[0][:, 0].min(), rings[0][:, 1].min(),
+                                  rings[0][:, 0].max(), rings[0][:, 1].max()]
+                                 for _, rings in index.parts]).reshape(-1, 4)
+        return index
+
+    def lookup(self, latlons: Sequence[LATLON]) -> List[Optional[str]]:
+        """
+        Name of the region containing each point, None if it is in none of them
+        """
+        if len(latlons) == 0:
+            return []
+        found = np.full(len(latlons), -1, dtype=np.int64)
+        points = np.asarray(latlons, dtype=float)
+        order = np.argsort(points[:, 1], kind='stable')
+        lons = points[order, 1]
+        lats = points[order, 0]
+        for (region, rings), (minx, miny, maxx, maxy) in zip(self.parts, self.bboxes):
+            start = np.searchsorted(lons, minx, side='left')
+            end = np.searchsorted(lons, maxx, side='right')
+            if start >= end:
+                continue
+            idx = np.arange(start, end)
+            idx = idx[(lats[idx] >= miny) & (lats[idx] <= maxy) & (found[order[idx]] < 0)]
+            if len(idx) == 0:
+                continue
+            inside = points_in_ring(lons[idx], lats[idx], rings[0])
+            for hole in rings[1:]:
+                inside &= ~points_in_ring(lons[idx], lats[idx], hole)
+            found[order[idx[inside]]] = region
+        return [None if i < 0 else self.names[i] for i in found]
+
+    def get_region(self, latlon: LATLON) -> Optional[str]:
+        return self.lookup([latlon])[0]
@@ -0,0 +1,130 @@
+import csv
+import hashlib
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..metadata.schema_snapshot import file_digest
+
+ZOBLER_LOOKUP = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'zobler_540_MixS_lookup.csv')
+
+# the Zobler 540 grid: 0.5 degree cells, north-up, starting at 90N 180W
+ZOBLER_CELL_SIZE = 0.5
+ZOBLER_SHAPE = (360, 720)
+
+
+@lru_cache()
+def load_zobler_table(path: str = ZOBLER_LOOKUP) -> Tuple[Tuple[str, str], ...]:
+    """
+    Rows of (Zobler soil unit name, MIxS soil type)
+    """
+    with open(path) as stream:
+        return tuple((row[0], row[1]) for row in csv.reader(stream) if len(row) >= 2)
+
+
+@lru_cache()
+def load_zobler_lookup(path: str = ZOBLER_LOOKUP) -> Dict[str, str]:
+    """
+    Map of Zobler soil unit names (e.g. CALCIC CAMBISOL) to MIxS soil types
+    """
+    lookup = {}
+    for name, term in load_zobler_table(path):
+        lookup.setdefault(name, term)
+    return lookup
+
+
+def load_legend(path: str) -> Dict[int, str]:
+    """
+    Read a two column (code, Zobler soil unit name) legend
+    """
+    legend = {}
+    with open(path) as stream:
+        for row in csv.reader(stream):
+            if len(row) >= 2 and row[0].strip().isdigit():
+                legend[int(row[0])] = row[1].strip()
+    return legend
+
+
+def grid_indexes(lats: np.ndarray, lons: np.ndarray, cell_size: float,
+                 shape: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Row and column of each point in a north-up global grid starting at 90N 180W
+    """
+    rows = shape[0] - 1 - np.floor((lats + 90) / cell_size).astype(np.int64)
+    cols = np.floor((lons + 180) / cell_size).astype(np.int64)
+    return np.clip(rows, 0, shape[0] - 1), np.clip(cols, 0, shape[1] - 1)
+
+
+@dataclass
+class ZoblerSoilRaster:
+    """
+    Offline lookup of MIxS soil types from a local copy of the Zobler 540 half-degree grid
+
+    The grid is a .npy array of integer soil unit codes of shape (360, 720), which is
+    memory-mapped. If legend_path is given it maps codes to Zobler soil unit names;
+    otherwise a code n is the n-th (1-based) row of the MIxS lookup table and 0 is no data.
+    """
+    raster_path: str
+    legend_path: str = None
+    raster: np.ndarray = None
+    terms: np.ndarray = None
+
+    def __post_init__(self):
+        self.load()
+
+    def __getstate__(self) -> Dict:
+        # worker processes re-map the file instead of receiving a copy of the grid
+        state = self.__dict__.copy()
+        state['raster'] = None
+        state['terms'] = None
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self.load()
+
+    def load(self) -> None:
+        self.raster = np.load(self.raster_path, mmap_mode='r')
+        if self.raster.shape != ZOBLER_SHAPE:
+            raise ValueError(f'Expected a {ZOBLER_SHAPE} grid in {self.raster_path}, got {self.raster.shape}')
+        if self.legend_path is not None:
+            lookup = load_zobler_lookup()
+            legend = load_legend(self.legend_path)
+            code_terms = {code: lookup.get(name, None) for code, name in legend.items()}
+        else:
+            code_terms = {i + 1: term for i, (_, term) in enumerate(load_zobler_table())}
+        # dense code => MIxS term array, so a lookup is a single fancy index
+        terms = np.empty(max(max(code_terms, default=0), int(self.raster.max())) + 1, dtype=object)
+        for code, term in code_terms.items():
+            terms[code] = term
+        self.terms = terms
+
+    def digest(self) -> str:
+        """
+        sha256 of the grid and legend files, to tell whether lookups would give the same answers
+        """
+        digest = hashlib.sha256(file_digest(self.raster_path))
+        if self.legend_path is not None:
+            digest.update(file_digest(self.legend_path))
+        return digest.hexdigest()[:16]
+
+    def get_fao_soil_types(self, latlons: Sequence[Tuple[float, float]]) -> List[Optional[str]]:
+        """
+        MIxS soil type of each point, or None where the grid has no data
+        """
+        if len(latlons) == 0:
+            return []
+        points = np.asarray(latlons, dtype=float)
+        rows, cols = grid_indexes(points[:, 0], points[:, 1], ZOBLER_CELL_SIZE, ZOBLER_SHAPE)
+        codes = self.raster[rows, cols].astype(np.int64)
+        # codes outside the table, e.g. a negative no data value, have no soil type
+        known = (codes >= 0) & (codes < len(self.terms))
+        terms = np.full(len(codes), None, dtype=object)
+        terms[known] = self.terms[codes[known]]
+        return terms.tolist()
+
+    def get_fao_soil_type(self, latlon: Tuple[float, float]) -> Optional[str]:
+        return self.get_fao_soil_types([latlon])[0]
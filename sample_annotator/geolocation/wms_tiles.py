@@ -0,0 +1,105 @@
+"""
+Tile planning for answering many point lookups with a few coverage requests
+
+Points are clustered into tile_size degree tiles; each tile is fetched once as a
+WCS GetCoverage raster (ESRI ASCII grid) at the native resolution of the layer, and
+point values are then read from the tile array.
+"""
+import io
+import math
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+TILE_KEY = Tuple[int, int]
+BBOX = Tuple[float, float, float, float]
+
+
+@dataclass
+class CoverageTile:
+    """
+    A north-up raster returned for one tile
+    """
+    xllcorner: float
+    yllcorner: float
+    cellsize: float
+    values: np.ndarray
+    nodata: float = None
+
+    def sample(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        """
+        Value at each point, NaN for no data or points outside the tile
+        """
+        nrows, ncols = self.values.shape
+        rows = np.floor((self.yllcorner + nrows * self.cellsize - lats) / self.cellsize).astype(np.int64)
+        cols = np.floor((lons - self.xllcorner) / self.cellsize).astype(np.int64)
+        inside = (rows >= 0) & (rows < nrows) & (cols >= 0) & (cols < ncols)
+        result = np.full(len(lats), np.nan)
+        result[inside] = self.values[rows[inside], cols[inside]]
+        if self.nodata is not None:
+            result[result == self.nodata] = np.nan
+        return result
+
+
+def parse_ascii_grid(text: str) -> CoverageTile:
+    """
+    Parse an ESRI ASCII grid (AAIGrid)
+    """
+    header = {}
+    lines = text.splitlines()
+    i = 0
+    while i < len(lines):
+        parts = lines[i].split()
+        if len(parts) != 2 or not parts[0][0].isalpha():
+            break
+        header[parts[0].lower()] = float(parts[1])
+        i += 1
+    nrows = int(header['nrows'])
+    ncols = int(header['ncols'])
+    cellsize = header['cellsize']
+    if 'xllcorner' in header:
+        xll, yll = header['xllcorner'], header['yllcorner']
+    else:
+        xll, yll = header['xllcenter'] - cellsize / 2, header['yllcenter'] - cellsize / 2
+    values = np.loadtxt(io.StringIO('\n'.join(lines[i:])), dtype=float, ndmin=2).reshape(nrows, ncols)
+    return CoverageTile(xllcorner=xll, yllcorner=yll, cellsize=cellsize, values=values,
+                        nodata=header.get('nodata_value', None))
+
+
+def tile_key(latlon: Tuple[float, float], tile_size: float) -> TILE_KEY:
+    return math.floor(latlon[1] / tile_size), math.floor(latlon[0] / tile_size)
+
+
+def tile_bbox(key: TILE_KEY, tile_size: float) -> BBOX:
+    minx = key[0] * tile_size
+    miny = key[1] * tile_size
+    return minx, miny, minx + tile_size, miny + tile_size
+
+
+def plan_tiles(latlons: Sequence[Tuple[float, float]], tile_size: float) -> Dict[TILE_KEY, List[int]]:
+    """
+    Cluster points into tiles; returns the indexes of the points in each tile
+    """
+    plan = {}
+    for i, latlon in enumerate(latlons):
+        plan.setdefault(tile_key(latlon, tile_size), []).append(i)
+    return plan
+
+
+def coverage_params(coverage: str, bbox: BBOX, cell_size: float, output_format: str = 'AAIGrid') -> Dict:
+    """
+    WCS 1.0.0 GetCoverage parameters for a bbox at the given resolution
+    """
+    width = max(1, round((bbox[2] - bbox[0]) / cell_size))
+    height = max(1, round((bbox[3] - bbox[1]) / cell_size))
+    return {'originator': 'QAQCIdentify',
+            'SERVICE': 'WCS',
+            'VERSION': '1.0.0',
+            'REQUEST': 'GetCoverage',
+            'COVERAGE': coverage,
+            'CRS': 'EPSG:4326',
+            'BBOX': ','.join(str(x) for x in bbox),
+            'WIDTH': str(width),
+            'HEIGHT': str(height),
+            'FORMAT': output_format}
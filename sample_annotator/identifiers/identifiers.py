@@ -0,0 +1,161 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Iterable, Pattern
+import logging
+import re
+
+import bioregistry
+
+from sample_annotator.report_model import AnnotationReport, Category
+
+
+@dataclass
+class IdentifierCheck:
+    """
+    Result of checking a single identifier
+    """
+    id: str
+    is_curie: bool = False
+    num_parts: int = 0
+    prefix: str = None
+    normalized_prefix: str = None
+    pattern: str = None
+    matches_pattern: bool = None
+
+    @property
+    def is_valid(self) -> bool:
+        return self.is_curie and self.num_parts == 2 and self.normalized_prefix is not None \
+            and self.matches_pattern is not False
+
+
+@dataclass
+class PrefixStats:
+    """
+    Counts of identifiers sharing a prefix, as written in the input
+    """
+    prefix: str
+    normalized_prefix: str = None
+    count: int = 0
+    valid: int = 0
+    renormalized: int = 0
+    pattern_mismatches: int = 0
+    syntax_errors: int = 0
+
+
+@dataclass
+class IdentifierBatchReport:
+    """
+    Results of validating a column of identifiers
+    """
+    checks: List[IdentifierCheck] = field(default_factory=list)
+    prefix_stats: Dict[str, PrefixStats] = field(default_factory=OrderedDict)
+    non_curies: int = 0
+
+    def normalized_ids(self) -> List[str]:
+        return [c.id for c in self.checks]
+
+    def num_valid(self) -> int:
+        return sum(s.valid for s in self.prefix_stats.values())
+
+
+@dataclass
+class IdentifierEngine():
+    """
+    Validates CURIEs against bioregistry
+
+    Prefix normalization and the compiled pattern of each prefix are looked up
+    once and memoized
+    """
+    normalized_prefixes: Dict[str, Optional[str]] = field(default_factory=dict)
+    patterns: Dict[str, Optional[Pattern]] = field(default_factory=dict)
+
+    def normalize_prefix(self, prefix: str) -> Optional[str]:
+        if prefix not in self.normalized_prefixes:
+            self.normalized_prefixes[prefix] = bioregistry.normalize_prefix(prefix)
+        return self.normalized_prefixes[prefix]
+
+    def get_pattern(self, normalized_prefix: str) -> Optional[Pattern]:
+        if normalized_prefix not in self.patterns:
+            pattern = bioregistry.get_pattern(normalized_prefix)
+            self.patterns[normalized_prefix] = re.compile(pattern) if pattern is not None else None
+        return self.patterns[normalized_prefix]
+
+    def check(self, id: str) -> IdentifierCheck:
+        """
+        Check the syntax, prefix and pattern of an identifier
+
+        The returned id uses the normalized prefix. Bioregistry patterns describe
+        the local part of an identifier, so that is what is matched
+        """
+        c = IdentifierCheck(id=id)
+        if ':' not in id:
+            return c
+        c.is_curie = True
+        parts = id.split(':')
+        c.num_parts = len(parts)
+        c.prefix = parts[0]
+        local_id = parts[1]
+        c.normalized_prefix = self.normalize_prefix(c.prefix)
+        if c.normalized_prefix is not None:
+            if c.normalized_prefix != c.prefix:
+                c.id = id.replace(c.prefix, c.normalized_prefix)
+            pattern = self.get_pattern(c.normalized_prefix)
+            if pattern is not None:
+                logging.debug(f'Testing {local_id} against {pattern.pattern}')
+                c.pattern = pattern.pattern
+                c.matches_pattern = pattern.match(local_id) is not None
+        return c
+
+    def validate(self, id: str, report: AnnotationReport) -> str:
+        """
+        Check an identifier, adding messages to the report; returns the normalized id
+        """
+        c = self.check(id)
+        if not c.is_curie:
+            report.add_message('ID is not a CURIE')
+            return c.id
+        if c.num_parts > 2:
+            report.add_message('Invalid CURIE syntax; multiple parts = {}', params=(id.split(':'),),
+                               severity=2,
+                               category=Category.Identifier)
+        if c.normalized_prefix is None:
+            report.add_message('No such prefix: {}', params=(c.normalized_prefix,),
+                               severity=2,
+                               category=Category.Identifier)
+        else:
+            if c.normalized_prefix != c.prefix:
+                report.add_message('Normalizing prefix {} => {}', params=(c.prefix, c.normalized_prefix),
+                                   severity=1,
+                                   was_repaired=True,
+                                   category=Category.Identifier)
+            if c.matches_pattern is False:
+                report.add_message('ID {} does not match {}', params=(c.id, c.pattern),
+                                   severity=1,
+                                   category=Category.Identifier)
+        return c.id
+
+    def validate_all(self, ids: Iterable[str]) -> IdentifierBatchReport:
+        """
+        Validate a column of identifiers, collecting per-prefix statistics
+        """
+        batch = IdentifierBatchReport()
+        for id in ids:
+            c = self.check(id)
+            batch.checks.append(c)
+            if not c.is_curie:
+                batch.non_curies += 1
+                continue
+            stats = batch.prefix_stats.get(c.prefix, None)
+            if stats is None:
+                stats = PrefixStats(prefix=c.prefix, normalized_prefix=c.normalized_prefix)
+                batch.prefix_stats[c.prefix] = stats
+            stats.count += 1
+            if c.num_parts > 2:
+                stats.syntax_errors += 1
+            if c.normalized_prefix is not None and c.normalized_prefix != c.prefix:
+                stats.renormalized += 1
+            if c.matches_pattern is False:
+                stats.pattern_mismatches += 1
+            if c.is_valid:
+                stats.valid += 1
+        return batch
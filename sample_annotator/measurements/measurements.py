@@ -1,5 +1,6 @@
 from dataclasses import dataclass
-from typing import List, Any
+from typing import List, Any, Optional, Tuple, Dict
+import re
 
 from nmdc_schema.nmdc import QuantityValue
 # import pint
@@ -10,6 +11,42 @@ from sample_annotator.report_model import AnnotationReport
 
 LoQ = List[Quantity]
 
+# unit surface forms that quantulum3 resolves unambiguously, mapped to the
+# name of the quantulum3 unit they resolve to
+FAST_UNITS = {}
+for _name, _surfaces in {
+    'metre': ['m', 'meter', 'meters', 'metre', 'metres'],
+    'centimetre': ['cm', 'centimeter', 'centimeters', 'centimetre', 'centimetres'],
+    'millimetre': ['mm', 'millimeter', 'millimeters', 'millimetre', 'millimetres'],
+    'kilometre': ['km', 'kilometer', 'kilometers', 'kilometre', 'kilometres'],
+    'micrometre': ['µm', 'micrometer'],
+    'foot': ['ft', 'foot', 'feet'],
+    'gram': ['g', 'gram', 'grams'],
+    'milligram': ['mg', 'milligram', 'milligrams'],
+    'microgram': ['µg', 'microgram', 'micrograms'],
+    'kilogram': ['kg', 'kilogram', 'kilograms'],
+    'litre': ['L', 'l', 'liter', 'liters', 'litre', 'litres'],
+    'cubic centimetre': ['ml', 'mL'],
+    'percentage': ['%', 'percent'],
+    'parts-per-million': ['ppm'],
+    'degree Celsius': ['degree Celsius', 'degrees Celsius', 'degree celsius', 'degrees celsius',
+                       'Celsius', 'celsius', '°C'],
+    'second': ['s', 'sec'],
+    'minute': ['min'],
+    'hour': ['h', 'hr', 'hour', 'hours'],
+    'day': ['day', 'days'],
+    'year': ['year', 'years'],
+    'millivolt': ['mV'],
+    'standard atmosphere': ['atm'],
+}.items():
+    for _surface in _surfaces:
+        FAST_UNITS[_surface] = _name
+
+_NUMBER = r'(?:\d+(?:\.\d+)?|\.\d+)'
+# a value or range, an optional space, then a unit, e.g. 10 cm, 2.5m, 0-10 cm, 1 to 3 m
+FAST_MEASUREMENT = re.compile(rf'^(?:(?P<low>{_NUMBER})(?: ?- ?| to )(?P<high>{_NUMBER})|(?P<value>-?{_NUMBER})) ?'
+                              rf'(?P<unit>\S.*)$')
+
 
 def make_QuantityValue(unit: str, value: Any, verbatim: str = None) -> dict:
     d = {'has_unit': unit, 'has_numeric_value': value}
@@ -20,6 +57,20 @@ def make_QuantityValue(unit: str, value: Any, verbatim: str = None) -> dict:
 
 @dataclass
 class MeasurementEngine():
+    """
+    Parses measurement strings into QuantityValue dicts
+
+    Common value/unit forms are parsed by a precompiled grammar (the fast path),
+    giving the same result quantulum3 would; anything else goes to quantulum3
+    """
+    fast_path_hits: int = 0
+    fallback_parses: int = 0
+
+    def warm_up(self) -> None:
+        """
+        Force quantulum3 to load its unit tables and classifier
+        """
+        q_parser.parse('1 m')
 
     def repair(self, measurement_verbatim: Any, default_unit: str = None,
                report: AnnotationReport = None) -> QuantityValue:
@@ -34,22 +85,59 @@ class MeasurementEngine():
             if qv.has_unit is None and qv.has_numeric_value is None:
                 measurement_verbatim = qv.has_raw_value
             else:
-                report.add_message(f'Incomplete info: {qv}')
+                report.add_message('Incomplete info: {}', params=(qv,))
                 measurement_verbatim = qv.has_raw_value
         if isinstance(measurement_verbatim, int) or isinstance(measurement_verbatim, float):
             if default_unit is None:
-                report.add_message(f'Missing unit {measurement_verbatim}')
+                report.add_message('Missing unit {}', params=(measurement_verbatim,))
             else:
-                report.add_message(f'Adding default unit {measurement_verbatim} => {default_unit}',
+                report.add_message('Adding default unit {} => {}', params=(measurement_verbatim, default_unit),
                                    was_repaired=True)
             return make_QuantityValue(default_unit,
                                       measurement_verbatim,
                                       verbatim=str(measurement_verbatim))
-        m = q_parser.parse(measurement_verbatim)
-        if len(m) == 0:
-            return None
-        q = m[0]
-        report.add_message(f'Parsed unit-value: {q.value} {q.unit.name}')
-        return make_QuantityValue(q.unit.name,
-                                  q.value,
+        parsed = self.parse_fast(measurement_verbatim)
+        if parsed is not None:
+            self.fast_path_hits += 1
+            value, unit_name = parsed
+        else:
+            self.fallback_parses += 1
+            m = q_parser.parse(measurement_verbatim)
+            if len(m) == 0:
+                return None
+            q = m[0]
+            value, unit_name = q.value, q.unit.name
+        report.add_message('Parsed unit-value: {} {}', params=(value, unit_name))
+        return make_QuantityValue(unit_name,
+                                  value,
                                   verbatim=measurement_verbatim)
+
+    def parse_fast(self, text: Any) -> Optional[Tuple[float, str]]:
+        """
+        Parse simple measurements such as '10 cm' or '0-10 cm' without quantulum3
+
+        Returns (value, unit name) as quantulum3 would, with ranges giving their
+        midpoint, or None if the text is not in a form the fast path handles
+        """
+        if not isinstance(text, str):
+            return None
+        m = FAST_MEASUREMENT.match(text.strip())
+        if m is None:
+            return None
+        unit_name = FAST_UNITS.get(m.group('unit'), None)
+        if unit_name is None:
+            return None
+        if m.group('value') is not None:
+            value = float(m.group('value'))
+            if value == 0 and m.group('value').startswith('-'):
+                return None
+            return value, unit_name
+        low = float(m.group('low'))
+        high = float(m.group('high'))
+        if low > high:
+            return None
+        return (low + high) / 2, unit_name
+
+    def stats(self) -> Dict[str, int]:
+        return {'fast_path_hits': self.fast_path_hits,
+                'fallback_parses': self.fallback_parses}
@@ -0,0 +1,104 @@
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+# whitespace, punctuation and underscores, which enum matching ignores
+ENUM_SEPARATORS = re.compile(r'[\W_]+')
+
+NGRAM_SIZE = 3
+MAX_SUGGESTIONS = 3
+# minimum Dice similarity of character n-grams for a permissible value to be suggested
+MIN_SIMILARITY = 0.4
+
+
+def normalize_enum_value(v: str) -> str:
+    """
+    Case, whitespace and punctuation insensitive form of an enum value
+
+    e.g. ' Obligate-Anaerobe.' => 'obligate anaerobe'
+    """
+    return ENUM_SEPARATORS.sub(' ', v).strip().casefold()
+
+
+def ngrams(normalized: str, n: int = NGRAM_SIZE) -> Set[str]:
+    """
+    Character n-grams of a normalized value, padded so that short values have some
+    """
+    padded = f' {normalized} '
+    return {padded[i:i + n] for i in range(max(1, len(padded) - n + 1))}
+
+
+@dataclass
+class EnumIndex:
+    """
+    Precompiled lookups for one enumeration's permissible values
+
+    Exact matching is a frozenset lookup; normalized_match finds the permissible value
+    a value differs from only in case, whitespace or punctuation, and suggest the
+    closest ones by character n-grams
+    """
+    name: str
+    values: FrozenSet[str]
+    ordered: Tuple[str, ...]
+    by_normalized: Dict[str, Tuple[str, ...]]
+    postings: Dict[str, Tuple[int, ...]]
+    ngram_counts: Tuple[int, ...]
+
+    @classmethod
+    def build(cls, name: str, permissible_values: Iterable[str]) -> "EnumIndex":
+        ordered = tuple(permissible_values)
+        by_normalized = defaultdict(list)
+        postings = defaultdict(list)
+        ngram_counts = []
+        for i, pv in enumerate(ordered):
+            normalized = normalize_enum_value(pv)
+            by_normalized[normalized].append(pv)
+            grams = ngrams(normalized)
+            ngram_counts.append(len(grams))
+            for g in grams:
+                postings[g].append(i)
+        return cls(name=name,
+                   values=frozenset(ordered),
+                   ordered=ordered,
+                   by_normalized={k: tuple(v) for k, v in by_normalized.items()},
+                   postings={k: tuple(v) for k, v in postings.items()},
+                   ngram_counts=tuple(ngram_counts))
+
+    def __contains__(self, value: Any) -> bool:
+        try:
+            return value in self.values
+        except TypeError:
+            # unhashable, e.g. a list
+            return False
+
+    def __len__(self) -> int:
+        return len(self.ordered)
+
+    def normalized_match(self, value: Any) -> Optional[str]:
+        """
+        The permissible value with the same normalized form, if there is exactly one
+        """
+        if not isinstance(value, str):
+            return None
+        matches = self.by_normalized.get(normalize_enum_value(value), ())
+        return matches[0] if len(matches) == 1 else None
+
+    def suggest(self, value: Any, limit: int = MAX_SUGGESTIONS) -> List[str]:
+        """
+        Up to limit permissible values closest to value, most similar first
+        """
+        if not isinstance(value, str):
+            return []
+        grams = ngrams(normalize_enum_value(value))
+        shared = defaultdict(int)
+        for g in grams:
+            for i in self.postings.get(g, ()):
+                shared[i] += 1
+        scored = []
+        for i, n in shared.items():
+            score = 2 * n / (len(grams) + self.ngram_counts[i])
+            if score >= MIN_SIMILARITY:
+                scored.append((-score, i))
+        scored.sort()
+        return [self.ordered[i] for _, i in scored[:limit]]
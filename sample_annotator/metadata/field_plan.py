@@ -0,0 +1,61 @@
+from dataclasses import dataclass, asdict
+from typing import Optional, Dict
+
+from sample_annotator.metadata.sample_schema import SampleSchema, underscore
+
+
+@dataclass
+class FieldPlan:
+    """
+    How the annotator treats a given sample key
+
+    Plans depend only on the key and the schema, so they are compiled once per
+    distinct key and reused for every sample in a run
+    """
+    key: str
+    underscored: str = None
+    slot_name: Optional[str] = None
+    is_alias: bool = False
+    is_measurement: bool = False
+    enum_name: Optional[str] = None
+    permissible_values: Optional[Dict] = None
+
+    @property
+    def is_unknown(self) -> bool:
+        return self.slot_name is None
+
+    @property
+    def needs_underscoring(self) -> bool:
+        return self.underscored != self.key
+
+    @property
+    def is_enum(self) -> bool:
+        return self.permissible_values is not None
+
+    def as_dict(self) -> Dict:
+        d = asdict(self)
+        if self.permissible_values is not None:
+            d['permissible_values'] = list(self.permissible_values.keys())
+        return d
+
+
+def compile_field_plan(schema: SampleSchema, key: str) -> FieldPlan:
+    """
+    Classify a key: canonical slot, alias repair, measurement, enumeration or unknown
+
+    The enumeration and measurement attributes apply to the key as given; for an alias,
+    the plan of its slot_name describes the repaired field
+    """
+    plan = FieldPlan(key=key, underscored=underscore(key))
+    slot = schema.get_slot(plan.underscored)
+    if slot is None:
+        slot = schema.get_slot(plan.underscored, use_aliases=True)
+        plan.is_alias = slot is not None
+    if slot is not None:
+        plan.slot_name = slot.get('name')
+    plan.is_measurement = schema.is_measurement_field(key)
+    enum = schema.get_enumerations(key)
+    if enum is not None:
+        plan.enum_name = enum.get('name')
+        plan.permissible_values = enum.get('permissible_values', {})
+    return plan
@@ -1,5 +1,7 @@
 from linkml.generators.yamlgen import load_raw_schema, YAMLGenerator
-from sample_annotator import MIXS_SCHEMA
+from sample_annotator import MIXS_SCHEMA, MIXS_SNAPSHOT
+from sample_annotator.metadata.schema_snapshot import load_compiled_schema
+from sample_annotator.metadata.enum_index import EnumIndex
 import yaml
 import json
 
@@ -7,12 +9,32 @@ from datetime import datetime
 from typing import Optional, List, Set, Any, Dict
 from dataclasses import dataclass
 import logging
+import re
+
+# field names used by older MIxS versions (as still found in e.g. GOLD exports)
+# mapped to their current MIxS 6 slot name
+MIXS_LEGACY_SYNONYMS = {
+    'env_biome': 'env_broad_scale',
+    'env_feature': 'env_local_scale',
+    'env_material': 'env_medium',
+}
+
+NAME_SEPARATORS = re.compile(r'[\s_\-]+')
 
 
 def underscore(t: str) -> str:
     return t.replace(' ', '_')
 
 
+def normalize_name(t: str) -> str:
+    """
+    Case, space, hyphen and underscore insensitive form of a field name
+
+    e.g. 'Total  Particulate-Carbon' => 'total_particulate_carbon'
+    """
+    return NAME_SEPARATORS.sub('_', t).strip('_').lower()
+
+
 @dataclass
 class SampleSchema:
     """
@@ -20,38 +42,98 @@ class SampleSchema:
     """
 
     object: Dict = None
-    slot_dict_by_alias = None
+    use_snapshot: bool = True
+    snapshot_path: str = MIXS_SNAPSHOT
+    slot_dict_by_alias: Dict[str, Dict] = None
+    slot_dict_by_normalized_name: Dict[str, Dict] = None
+    enum_indexes: Dict[str, EnumIndex] = None
 
     def load(self, force=False) -> Dict:
         """
         Load the schema from config folded
+
+        By default this is the compiled snapshot (slots and enums only) of mixs.json,
+        which is rebuilt whenever mixs.json changes; set use_snapshot to False to
+        load the full schema document
         """
         if self.object and not force:
             return self.object
+        self.slot_dict_by_alias = None
+        self.slot_dict_by_normalized_name = None
+        self.enum_indexes = None
+        if self.use_snapshot:
+            self.object = load_compiled_schema(MIXS_SCHEMA, self.snapshot_path)
+            return self.object
         with open(MIXS_SCHEMA) as stream:
             self.object = json.load(stream)
             return self.object
 
+    def __getstate__(self) -> Dict:
+        # do not ship the parsed schema to worker processes; it is reloaded on demand
+        state = self.__dict__.copy()
+        state['object'] = None
+        state['slot_dict_by_alias'] = None
+        state['slot_dict_by_normalized_name'] = None
+        state['enum_indexes'] = None
+        return state
+
     def slotdict(self) -> Dict:
         return self.load()['slots']
 
     def enumdict(self) -> Dict:
         return self.load()['enums']
 
+    def build_alias_index(self) -> None:
+        """
+        Index slots by alias and by normalized name, so alias lookups do not scan all slots
+
+        slot_dict_by_alias holds the underscored aliases as written in the schema;
+        slot_dict_by_normalized_name holds the normalized form of every slot name, alias
+        and legacy MIxS synonym. Where two slots share a key, the first one in the schema wins.
+        """
+        sd = self.slotdict()
+        by_alias = {}
+        by_normalized_name = {}
+        for s in sd.values():
+            by_normalized_name.setdefault(normalize_name(s['name']), s)
+        for s in sd.values():
+            for a in s.get('aliases', []):
+                by_alias.setdefault(underscore(a), s)
+                by_normalized_name.setdefault(normalize_name(a), s)
+        for legacy_name, name in MIXS_LEGACY_SYNONYMS.items():
+            if name in sd:
+                by_normalized_name.setdefault(normalize_name(legacy_name), sd[name])
+        # get_slot only checks slot_dict_by_alias, so it is assigned last
+        self.slot_dict_by_normalized_name = by_normalized_name
+        self.slot_dict_by_alias = by_alias
+
+    def build_indexes(self) -> None:
+        """
+        Build the alias index and every enumeration's index up front, e.g. before the
+        schema is shared between threads
+        """
+        self.build_alias_index()
+        for name in self.enumdict():
+            self.get_enum_index(name)
+
     def get_slot(self, name: str, class_name: str = None, use_aliases=False) -> Dict:
         """
         Return a slot object by name
 
-        If use_aliases is True, then also look at aliases
+        If use_aliases is True, then also look at aliases, then at case/space/underscore
+        insensitive variants of names and aliases, and at older MIxS names
         """
         name = underscore(name)
         sd = self.slotdict()
         if name in sd:
             return sd[name]
         if use_aliases:
-            for s in sd.values():
-                if name in [underscore(a) for a in s.get('aliases', [])]:
-                    return s
+            if self.slot_dict_by_alias is None:
+                self.build_alias_index()
+            s = self.slot_dict_by_alias.get(name, None)
+            if s is None:
+                s = self.slot_dict_by_normalized_name.get(normalize_name(name), None)
+            return s
         return None
 
     def is_measurement_field(self, k: str) -> bool:
@@ -68,6 +150,22 @@ class SampleSchema:
         range = self.get_range(k)
         return self.enumdict().get(range, None)
 
+    def get_enum_index(self, name: str) -> Optional[EnumIndex]:
+        """
+        Return the (memoized) index of an enumeration's permissible values, by enum name
+        """
+        enums = self.enumdict()
+        if self.enum_indexes is None:
+            self.enum_indexes = {}
+        index = self.enum_indexes.get(name, None)
+        if index is None:
+            enum = enums.get(name, None)
+            if enum is None:
+                return None
+            index = EnumIndex.build(name, enum.get('permissible_values', {}).keys())
+            self.enum_indexes[name] = index
+        return index
+
     def get_range(self, k) -> str:
         slot = self.get_slot(k)
         if slot is not None:
@@ -0,0 +1,101 @@
+"""
+Compiled, binary snapshot of the parts of the MIxS schema used for annotation
+
+The snapshot holds only slots (name, range, aliases and a few constraints) and enums,
+pickled behind a small header that records the sha256 of the mixs.json it was compiled
+from. Unpickling it is much faster than parsing the 3 MB JSON document. A snapshot that
+cannot be read, e.g. a truncated one, is recompiled.
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+from typing import Dict, Optional
+
+MAGIC = b'MIXSSNAP1\n'
+DIGEST_SIZE = hashlib.sha256().digest_size
+HEADER_SIZE = len(MAGIC) + DIGEST_SIZE
+
+# permissions of a written snapshot, less the umask
+SNAPSHOT_MODE = 0o644
+
+# os.umask can only be read by setting it, which would race with files being created in
+# other threads, so it is read once, at import
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+SNAPSHOT_SLOT_KEYS = ['name', 'range', 'aliases', 'pattern', 'required', 'multivalued']
+SNAPSHOT_ENUM_KEYS = ['name', 'permissible_values']
+
+
+def file_digest(path: str) -> bytes:
+    h = hashlib.sha256()
+    with open(path, 'rb') as stream:
+        for block in iter(lambda: stream.read(1 << 20), b''):
+            h.update(block)
+    return h.digest()
+
+
+def compile_schema(obj: Dict) -> Dict:
+    """
+    Reduce a full MIxS schema document to the slots and enums the annotator uses
+    """
+    slots = {k: {sk: s[sk] for sk in SNAPSHOT_SLOT_KEYS if sk in s}
+             for k, s in obj.get('slots', {}).items()}
+    enums = {k: {ek: e[ek] for ek in SNAPSHOT_ENUM_KEYS if ek in e}
+             for k, e in obj.get('enums', {}).items()}
+    return {'slots': slots, 'enums': enums}
+
+
+def write_snapshot(path: str, digest: bytes, payload: Dict) -> bool:
+    """
+    Atomically write a snapshot; returns False if the location is not writable
+    """
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as stream:
+            stream.write(MAGIC)
+            stream.write(digest)
+            pickle.dump(payload, stream, protocol=pickle.HIGHEST_PROTOCOL)
+        # mkstemp makes the file private; other users of a shared install need to read it
+        os.chmod(tmp_path, SNAPSHOT_MODE & ~UMASK)
+        os.replace(tmp_path, path)
+        return True
+    except OSError as e:
+        logging.warning(f'Could not write schema snapshot {path}: {e}')
+        return False
+
+
+def read_snapshot(path: str, digest: bytes) -> Optional[Dict]:
+    """
+    Load a snapshot, or None if it is missing, unreadable or was compiled from a different schema
+    """
+    try:
+        with open(path, 'rb') as stream:
+            header = stream.read(HEADER_SIZE)
+            if header[:len(MAGIC)] != MAGIC or header[len(MAGIC):] != digest:
+                logging.info(f'Schema snapshot {path} is stale')
+                return None
+            return pickle.load(stream)
+    except FileNotFoundError:
+        return None
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, TypeError) as e:
+        # a corrupt snapshot, or one pickled by a version whose classes have since changed
+        logging.warning(f'Could not read schema snapshot {path}: {e}')
+        return None
+
+
+def load_compiled_schema(schema_path: str, snapshot_path: str) -> Dict:
+    """
+    Return the compiled schema, rebuilding the snapshot if schema_path has changed
+    """
+    digest = file_digest(schema_path)
+    payload = read_snapshot(snapshot_path, digest)
+    if payload is None:
+        logging.info(f'Compiling schema snapshot {snapshot_path} from {schema_path}')
+        with open(schema_path) as stream:
+            payload = compile_schema(json.load(stream))
+        write_snapshot(snapshot_path, digest, payload)
+    return payload
@@ -0,0 +1,111 @@
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import List, Iterator, Iterable, Tuple, TYPE_CHECKING
+import logging
+
+from .report_model import AnnotationReport, SAMPLE, STUDY
+from .timings import StageTimings
+
+if TYPE_CHECKING:
+    from .sample_annotator import SampleAnnotator
+
+DEFAULT_CHUNK_SIZE = 100
+
+# annotator held by each worker process; set once by the pool initializer
+_worker_annotator: "SampleAnnotator" = None
+
+
+def _init_worker(annotator: "SampleAnnotator") -> None:
+    """
+    Pool initializer: keep a warm annotator in the worker process
+    """
+    global _worker_annotator
+    _worker_annotator = annotator
+    annotator.warm_up()
+
+
+def _annotate_chunk(samples: List[SAMPLE], study: STUDY = None) -> Tuple[List[AnnotationReport], StageTimings]:
+    timings = StageTimings()
+    # a worker's in-memory geo cache is its own, so it prefetches for its chunk itself
+    _worker_annotator.prefetch_geo(samples, timings)
+    return [_worker_annotator.annotate(sample, study=study, timings=timings) for sample in samples], timings
+
+
+def chunked(samples: Iterable[SAMPLE], chunk_size: int) -> Iterator[List[SAMPLE]]:
+    """
+    Split an iterable of samples into lists of at most chunk_size
+    """
+    chunk = []
+    for sample in samples:
+        chunk.append(sample)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def make_pool(annotator: "SampleAnnotator", workers: int) -> ProcessPoolExecutor:
+    """
+    Create a process pool where each worker holds its own copy of the annotator
+    """
+    return ProcessPoolExecutor(max_workers=workers,
+                               initializer=_init_worker,
+                               initargs=(annotator,))
+
+
+def warm_pool(executor: Executor, workers: int) -> None:
+    """
+    Start the workers of a pool made by make_pool, so that they load their annotators
+    before the first real chunk arrives
+    """
+    for future in [executor.submit(_annotate_chunk, []) for _ in range(workers)]:
+        future.result()
+
+
+def iter_annotate_parallel(annotator: "SampleAnnotator", samples: Iterable[SAMPLE], study: STUDY = None,
+                           workers: int = 2, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                           executor: Executor = None, timings: StageTimings = None) -> Iterator[AnnotationReport]:
+    """
+    Annotate samples in chunks across worker processes, yielding reports in input order
+
+    At most 2 * workers chunks are in flight, so samples can be consumed lazily from a stream.
+    If an executor is passed it is used as-is (and not shut down), otherwise a pool of size
+    workers is created for this call. Stage timings from the workers are merged into timings.
+    """
+
+    def results(future) -> List[AnnotationReport]:
+        reports, chunk_timings = future.result()
+        if timings is not None:
+            timings.merge(chunk_timings)
+        return reports
+
+    own_executor = executor is None
+    if own_executor:
+        executor = make_pool(annotator, workers)
+    pending = deque()
+    try:
+        for chunk in chunked(samples, chunk_size):
+            pending.append(executor.submit(_annotate_chunk, chunk, study))
+            if len(pending) >= 2 * workers:
+                yield from results(pending.popleft())
+        while pending:
+            yield from results(pending.popleft())
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown()
+
+
+def annotate_parallel(annotator: "SampleAnnotator", samples: Iterable[SAMPLE], study: STUDY = None,
+                      workers: int = 2, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                      executor: Executor = None, timings: StageTimings = None) -> List[AnnotationReport]:
+    """
+    Annotate samples in chunks across worker processes
+
+    Reports are returned in input order.
+    """
+    logging.info(f'Annotating using {workers} workers, chunk size {chunk_size}')
+    return list(iter_annotate_parallel(annotator, samples, study=study, workers=workers,
+                                       chunk_size=chunk_size, executor=executor, timings=timings))
@@ -1,9 +1,12 @@
-from typing import Optional, List, Set, Any, Dict
-from dataclasses import dataclass
+import sys
+from array import array
+from typing import Optional, List, Set, Any, Dict, Iterable
+from dataclasses import dataclass, field
 from enum import Enum, unique
 from collections import defaultdict
 
 import logging
+import numpy as np
 import pandas as pd
 
 from nmdc_schema.nmdc import Biosample, GeolocationValue
@@ -11,6 +14,7 @@ from nmdc_schema.nmdc import slots as nmdc_slots
 
 from .geolocation.geotools import GeoEngine
 from .metadata.sample_schema import SampleSchema, underscore
+from .timings import StageTimings
 
 from linkml_runtime.linkml_model.meta import ClassDefinition, SchemaDefinition, SlotDefinition, Definition
 
@@ -41,6 +45,10 @@ class Category(Enum):
         return list(map(lambda c: c.value, Category))
 
 
+CATEGORIES = list(Category)
+CATEGORY_CODES = {c: i for i, c in enumerate(CATEGORIES)}
+
+
 @dataclass
 class PackageCombo:
     """
@@ -50,27 +58,69 @@ class PackageCombo:
     checklist: str = None
 
 
-@dataclass
 class Message:
     """
     Individual report message
+
+    The description is stored as a template and its parameters, and only formatted when
+    read; templates are interned, so the many messages that share one share its string.
+    Category is stored as its index in CATEGORIES
     """
-    description: str = None
-    severity: int = 1
-    was_repaired: bool = None
-    category: Category = Category.Unclassified
-    field: str = None
+    __slots__ = ('template', 'params', 'severity', 'was_repaired', 'category_code', 'field')
 
     __cols__ = ['description', 'severity', 'field', 'was_repaired', 'category']
 
+    def __init__(self, description: str = None, severity: int = 1, was_repaired: bool = None,
+                 category: Category = Category.Unclassified, field: str = None, params: tuple = None):
+        self.template = description if description is None else sys.intern(description)
+        if params is not None:
+            # anything but simple values is formatted now, in case it changes later
+            params = tuple(p if type(p) in (str, int, float, bool) else format(p) for p in params)
+            if len(params) == 1:
+                # a lone parameter is stored without its tuple
+                params = params[0]
+        self.params = params
+        self.severity = severity
+        self.was_repaired = was_repaired
+        self.category_code = CATEGORY_CODES[category]
+        self.field = field
+
+    @property
+    def description(self) -> str:
+        params = self.params
+        if params is None:
+            return self.template
+        if type(params) is tuple:
+            return self.template.format(*params)
+        return self.template.format(params)
+
+    @property
+    def category(self) -> Category:
+        return CATEGORIES[self.category_code]
+
     def as_dict(self) -> Dict:
-        return {v: self.__getattribute__(v) for v in vars(self)}
+        return {'description': self.description,
+                'severity': self.severity,
+                'was_repaired': self.was_repaired,
+                'category': self.category,
+                'field': self.field}
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Message):
+            return NotImplemented
+        return self.as_dict() == other.as_dict()
+
+    def __repr__(self) -> str:
+        return 'Message(' + ', '.join(f'{k}={v!r}' for k, v in self.as_dict().items()) + ')'
 
 
 @dataclass
 class AnnotationReport:
     """
     Annotation report for a single sample
+
+    Severities and category codes of the messages are also kept as byte columns, with
+    the maximum severity and the messages by category maintained as messages are added
     """
     messages: List[Message] = None
     package: PackageCombo = None
@@ -78,46 +128,153 @@ class AnnotationReport:
     output: SAMPLE = None
     sample_id: str = None
     annotation_sufficiency_score = 0.0
+    severities: array = field(default=None, repr=False, compare=False)
+    categories: array = field(default=None, repr=False, compare=False)
+    highest_severity: int = field(default=None, repr=False, compare=False)
+    by_category: Dict[str, List[Message]] = field(default=None, repr=False, compare=False)
+    indexed: List[Message] = field(default=None, repr=False, compare=False)
 
     def add_message(self, *args, **kwargs):
         m = Message(*args, **kwargs)
-        if not self.messages:
+        if self.messages is None:
             self.messages = []
+        self.index_messages()
         self.messages.append(m)
+        self.index_message(m)
+
+    def add_messages(self, messages: Iterable[Message]) -> None:
+        """
+        Append messages that have already been made, e.g. collected while tidying
+        """
+        if self.messages is None:
+            self.messages = []
+        self.index_messages()
+        for m in messages:
+            self.messages.append(m)
+            self.index_message(m)
+
+    def index_messages(self) -> None:
+        """
+        (Re)build the columns, unless they are in step with messages
+
+        They fall out of step if messages is assigned or appended to directly
+        """
+        messages = self.messages
+        if self.indexed is messages and messages is not None and len(self.severities) == len(messages):
+            return
+        self.indexed = messages
+        self.severities = array('b')
+        self.categories = array('b')
+        self.highest_severity = None
+        self.by_category = None
+        for m in messages or []:
+            self.index_message(m)
+
+    def index_message(self, m: Message) -> None:
+        self.severities.append(m.severity)
+        self.categories.append(m.category_code)
+        if self.highest_severity is None or m.severity > self.highest_severity:
+            self.highest_severity = m.severity
+        if self.by_category is not None:
+            self.by_category[m.category.value].append(m)
 
     def as_dataframe(self):
         items = [m.as_dict() for m in self.messages]
         return pd.DataFrame(items, columns=Message.__cols__)
 
     def max_severity(self):
-        return max([m.severity for m in self.messages])
+        """
+        Highest severity of any message, 0 if there are none
+        """
+        self.index_messages()
+        return 0 if self.highest_severity is None else self.highest_severity
 
     def passes(self):
         return self.max_severity() == 0
 
     def messages_by_category(self) -> Dict:
-        res = defaultdict(list)
-        for m in self.messages:
-            res[m.category.value].append(m)
-        return res
+        self.index_messages()
+        if self.by_category is None:
+            # built on first use, then kept up to date by add_message
+            self.by_category = defaultdict(list)
+            for m in self.messages or []:
+                self.by_category[m.category.value].append(m)
+        return self.by_category
+
+
+class ReportColumns:
+    """
+    Report messages as columns, one row per message, built without per-message dicts
+
+    Severity and category are byte columns (category as its index in CATEGORIES)
+    """
+    __cols__ = ['sample_id'] + Message.__cols__
+
+    def __init__(self):
+        self.sample_id = []
+        self.description = []
+        self.severity = array('b')
+        self.field = []
+        self.was_repaired = []
+        self.category = array('b')
+
+    def __len__(self) -> int:
+        return len(self.severity)
+
+    def add(self, report: AnnotationReport) -> None:
+        messages = report.messages or []
+        self.sample_id.extend([report.sample_id] * len(messages))
+        for m in messages:
+            self.description.append(m.description)
+            self.severity.append(m.severity)
+            self.field.append(m.field)
+            self.was_repaired.append(m.was_repaired)
+            self.category.append(m.category_code)
+
+    def as_dataframe(self, categorical: bool = False) -> pd.DataFrame:
+        """
+        DataFrame of the columns
+
+        By default this is the same frame as the one built from Message.as_dict(); if
+        categorical is True, sample_id, description, field and category (as its value,
+        e.g. 'geo') are pandas categoricals, i.e. dictionary encoded
+        """
+        if categorical:
+            columns = {'sample_id': pd.Categorical(self.sample_id),
+                       'description': pd.Categorical(self.description),
+                       'severity': np.frombuffer(self.severity, dtype=np.int8),
+                       'field': pd.Categorical(self.field),
+                       'was_repaired': pd.array(self.was_repaired, dtype='boolean'),
+                       'category': pd.Categorical.from_codes(np.frombuffer(self.category, dtype=np.int8),
+                                                             categories=Category.list())}
+        else:
+            columns = {'sample_id': self.sample_id,
+                       'description': self.description,
+                       'severity': pd.Series(self.severity.tolist(), dtype='int64'),
+                       'field': pd.Series(self.field, dtype=object),
+                       'was_repaired': pd.Series(self.was_repaired, dtype=object),
+                       'category': pd.Series([CATEGORIES[c] for c in self.category], dtype=object)}
+        return pd.DataFrame(columns, columns=self.__cols__)
 
 
 @dataclass
 class AnnotationMultiSampleReport:
     """
     Multi-report of a set of samples
+
+    timings holds the time spent in each annotation stage, if recorded
     """
     reports: List[AnnotationReport] = None
+    timings: StageTimings = None
 
-    def as_dataframe(self):
-        items = []
-        cols = ['sample_id'] + Message.__cols__
+    def as_columns(self) -> ReportColumns:
+        columns = ReportColumns()
         for r in self.reports:
-            for m in r.messages:
-                item = m.as_dict()
-                item['sample_id'] = r.sample_id
-                items.append(item)
-        return pd.DataFrame(items, columns=cols)
+            columns.add(r)
+        return columns
+
+    def as_dataframe(self, categorical: bool = False):
+        return self.as_columns().as_dataframe(categorical=categorical)
 
     def all_outputs(self) -> List[SAMPLE]:
         return [r.output for r in self.reports]
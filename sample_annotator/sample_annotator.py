@@ -1,25 +1,44 @@
-import json
 import logging
-import re
 import sys
+import time
+from concurrent.futures import Executor
+from contextlib import ExitStack
 from dataclasses import dataclass, field
-from typing import List
+from typing import Any, List, Iterable, Iterator, Dict
 
-import bioregistry
 import click
 from linkml_runtime.linkml_model.meta import ClassDefinition
 from nmdc_schema.nmdc import slots as nmdc_slots
 
-from sample_annotator.geolocation.geotools import GeoEngine
+from sample_annotator.geolocation.geotools import GeoEngine, LATLON, parse_lat_lon
+from sample_annotator.geolocation.soil_raster import ZoblerSoilRaster
+from sample_annotator.geolocation.elevation_tiles import ElevationTiles
+from sample_annotator.geolocation.google_elevation import GoogleElevation
+from sample_annotator.geolocation.regions import RegionIndex, insdc_country
 from sample_annotator.metadata.sample_schema import SampleSchema
 from .measurements.measurements import MeasurementEngine
-from .metadata.sample_schema import underscore
+from .identifiers.identifiers import IdentifierEngine
+from .metadata.field_plan import FieldPlan, compile_field_plan
+from .frame_annotator import annotate_frame
+from .parallel import annotate_parallel, iter_annotate_parallel, chunked, make_pool, DEFAULT_CHUNK_SIZE
+from .sample_io import FORMATS, REPORT_FORMATS, TSV_FORMAT, guess_format, guess_report_format, \
+    read_samples, sample_writer, ReportTSVWriter, ReportArrowWriter, WRITE_BLOCK_SIZE
+from .timings import StageTimings
+from .stages import AnnotationStage, DEFAULT_STAGES, COST_CLASSES, resolve_stages
+from .annotation_cache import AnnotationCache, ANNOTATOR_VERSION, canonical_digest
+from .metadata.schema_snapshot import file_digest
+from . import MIXS_SCHEMA
 from .report_model import AnnotationReport, PackageCombo, AnnotationMultiSampleReport, Category, SAMPLE, STUDY
 
 KEY_ENV_PACKAGE = nmdc_slots.env_package.name
 KEY_CHECKLIST = 'checklist'
 KEY_LAT_LON = nmdc_slots.lat_lon.name
 KEY_ELEV = nmdc_slots.elev.name
+KEY_GEO_LOC_NAME = nmdc_slots.geo_loc_name.name
+
+# the tidy activities of SampleAnnotator.annotate, in the order they are performed
+ANNOTATION_STAGES = [s.name for s in DEFAULT_STAGES]
+GEOLOCATION_STAGE = 'perform_geolocation_inference'
 
 
 @dataclass
@@ -31,44 +50,246 @@ class SampleAnnotator():
     target_class: ClassDefinition = None
     geoengine: GeoEngine = field(default_factory=GeoEngine)
     measurement_engine: MeasurementEngine = field(default_factory=MeasurementEngine)
+    identifier_engine: IdentifierEngine = field(default_factory=IdentifierEngine)
 
     schema: SampleSchema = field(default_factory=SampleSchema)
+    field_plans: Dict[str, FieldPlan] = field(default_factory=dict)
+    stages: List[AnnotationStage] = field(default_factory=lambda: list(DEFAULT_STAGES))
+    selected_stages: List[str] = None
+    annotation_cache: AnnotationCache = None
 
-    def annotate_all(self, samples: List[SAMPLE], study: STUDY = None) -> AnnotationMultiSampleReport:
+    def annotate_all(self, samples: List[SAMPLE], study: STUDY = None,
+                     workers: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                     executor: Executor = None) -> AnnotationMultiSampleReport:
         """
         Annotate a list of samples
+
+        If workers > 1, chunks of chunk_size samples are annotated in a pool of worker
+        processes (executor, if passed, otherwise one made for this call); the merged
+        report is in input order and identical to the serial one
+
+        The time spent in each stage, across all samples, is in the report's timings
+
+        Geo lookups are prefetched for the whole batch, or with workers > 1 by each worker
+        for its chunks, as worker processes do not share an in-memory geo cache. With an
+        annotation_cache, only samples not in the cache are prefetched and annotated
         """
-        reports = []
-        amsr = AnnotationMultiSampleReport(reports=[])
+        amsr = AnnotationMultiSampleReport(reports=[], timings=StageTimings())
+        if self.annotation_cache is not None:
+            amsr.reports = self.annotate_cached(samples, study=study, workers=workers, chunk_size=chunk_size,
+                                                timings=amsr.timings, prefetch=True, executor=executor)
+            return amsr
+        if workers > 1:
+            amsr.reports = annotate_parallel(self, samples, study=study,
+                                             workers=workers, chunk_size=chunk_size,
+                                             executor=executor, timings=amsr.timings)
+            return amsr
+        self.prefetch_geo(samples, amsr.timings)
         for sample in samples:
-            amsr.reports.append(self.annotate(sample, study=study))
+            amsr.reports.append(self.annotate(sample, study=study, timings=amsr.timings))
         return amsr
 
-    def annotate(self, sample: SAMPLE, study: STUDY = None) -> AnnotationReport:
+    def annotate_iter(self, samples: Iterable[SAMPLE], study: STUDY = None,
+                      workers: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                      timings: StageTimings = None, executor: Executor = None) -> Iterator[AnnotationReport]:
+        """
+        Lazily annotate a stream of samples, yielding one report per sample in input order
+
+        Unlike annotate_all, no reports are retained, so memory does not grow with the input.
+        Samples are taken a block of workers * chunk_size at a time, and the geo lookups of
+        each block are prefetched before it is annotated
+        """
+        if self.annotation_cache is not None:
+            yield from self.iter_annotate_cached(samples, study=study, workers=workers,
+                                                 chunk_size=chunk_size, timings=timings, executor=executor)
+            return
+        if workers > 1:
+            yield from iter_annotate_parallel(self, samples, study=study,
+                                              workers=workers, chunk_size=chunk_size,
+                                              executor=executor, timings=timings)
+            return
+        for block in chunked(samples, chunk_size):
+            self.prefetch_geo(block, timings)
+            for sample in block:
+                yield self.annotate(sample, study=study, timings=timings)
+
+    def annotate_frame(self, table: Any, study: STUDY = None) -> AnnotationMultiSampleReport:
+        """
+        Annotate the rows of a pandas DataFrame or pyarrow Table, one sample per row
+
+        The reports are the same as annotate_all over the rows, but fields are tidied a
+        column at a time; see frame_annotator.annotate_frame
+        """
+        return annotate_frame(self, table, study=study)
+
+    def annotate_cached(self, samples: List[SAMPLE], study: STUDY = None,
+                        workers: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                        timings: StageTimings = None, prefetch: bool = False,
+                        executor: Executor = None) -> List[AnnotationReport]:
+        """
+        Reports for a batch of samples, taken from the annotation cache where possible
+
+        The remaining samples are annotated (prefetching their geo lookups first if
+        prefetch is set; with workers > 1 the workers do that) and their reports stored
+        in the cache
+        """
+        cache = self.annotation_cache
+        reports = [cache.get(sample, study) for sample in samples]
+        misses = [sample for sample, report in zip(samples, reports) if report is None]
+        logging.info(f'Annotation cache: {len(samples) - len(misses)} of {len(samples)} samples unchanged')
+        if not misses:
+            return reports
+        if prefetch and workers <= 1:
+            self.prefetch_geo(misses, timings)
+        if workers > 1:
+            new_reports = iter(annotate_parallel(self, misses, study=study, workers=workers, chunk_size=chunk_size,
+                                                 executor=executor, timings=timings))
+        else:
+            new_reports = (self.annotate(sample, study=study, timings=timings) for sample in misses)
+        for i, sample in enumerate(samples):
+            if reports[i] is None:
+                reports[i] = next(new_reports)
+                cache.set(sample, study, reports[i])
+        return reports
+
+    def iter_annotate_cached(self, samples: Iterable[SAMPLE], study: STUDY = None,
+                             workers: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                             timings: StageTimings = None, executor: Executor = None) -> Iterator[AnnotationReport]:
+        """
+        Streaming form of annotate_cached, a block of workers * chunk_size samples at a time
+        """
+        own_executor = executor is None and workers > 1
+        if own_executor:
+            executor = make_pool(self, workers)
+        try:
+            for block in chunked(samples, chunk_size * max(1, workers)):
+                yield from self.annotate_cached(block, study=study, workers=workers, chunk_size=chunk_size,
+                                                timings=timings, prefetch=True, executor=executor)
+        finally:
+            if own_executor:
+                executor.shutdown()
+
+    def cache_namespace(self) -> str:
+        """
+        Digest of everything besides the sample that an annotation depends on: the MIxS
+        schema, the annotator version, the stages performed and the geolocation backends
+        """
+        return canonical_digest({'schema': file_digest(MIXS_SCHEMA).hex(),
+                                 'annotator_version': ANNOTATOR_VERSION,
+                                 'stages': self.active_stages(),
+                                 'geo': self.geoengine.config()})
+
+    def use_annotation_cache(self, directory: str) -> AnnotationCache:
+        """
+        Reuse reports stored in directory for unchanged samples
+
+        Call this once the annotator is configured, since the configuration is part of
+        the cache namespace
+        """
+        self.annotation_cache = AnnotationCache(directory, namespace=self.cache_namespace())
+        return self.annotation_cache
+
+    def collect_lat_lons(self, samples: List[SAMPLE]) -> List[LATLON]:
+        """
+        Parseable lat_lon values of a batch of samples, for prefetching geo lookups
+        """
+        lat_lons = []
+        for sample in samples:
+            ll_str = sample.get(KEY_LAT_LON, None)
+            if ll_str is None:
+                continue
+            try:
+                lat_lon = parse_lat_lon(ll_str)
+            except Exception:
+                continue
+            if len(lat_lon) >= 2:
+                lat_lons.append(lat_lon)
+        return lat_lons
+
+    def get_field_plan(self, k: str) -> FieldPlan:
+        """
+        Return the (memoized) plan for how a sample key is tidied
+        """
+        plan = self.field_plans.get(k, None)
+        if plan is None:
+            plan = compile_field_plan(self.schema, k)
+            self.field_plans[k] = plan
+        return plan
+
+    def warm_up(self) -> None:
+        """
+        Load the schema, its alias and enumeration indexes and the measurement parser up
+        front, e.g. in a fresh worker process or before serving requests
+        """
+        self.schema.load()
+        self.schema.build_indexes()
+        self.measurement_engine.warm_up()
+
+    def register_stage(self, stage: AnnotationStage) -> None:
+        """
+        Add a stage, performed after the existing ones by the annotator method of its name
+        """
+        if not callable(getattr(self, stage.name, None)):
+            raise ValueError(f'No annotator method for stage {stage.name}')
+        missing = set(stage.depends_on) - {s.name for s in self.stages}
+        if missing:
+            raise ValueError(f'Stage {stage.name} depends on unregistered stages: {", ".join(sorted(missing))}')
+        self.stages.append(stage)
+
+    def select_stages(self, stages: List[str] = None, skip: List[str] = None) -> List[str]:
+        """
+        Choose the stages annotate performs, by stage name or cost class (see resolve_stages)
+
+        e.g. select_stages(skip=['remote', 'model']) for quick checks, and
+        select_stages(['remote']) for a later enrichment pass over the same samples
+        """
+        self.selected_stages = resolve_stages(self.stages, stages, skip)
+        return self.selected_stages
+
+    def active_stages(self) -> List[str]:
+        if self.selected_stages is not None:
+            return self.selected_stages
+        return [s.name for s in self.stages]
+
+    def prefetch_geo(self, samples: List[SAMPLE], timings: StageTimings = None) -> None:
+        """
+        Batch the remote geolocation lookups for samples, if the geolocation stage is to be performed
+        """
+        if GEOLOCATION_STAGE not in self.active_stages():
+            return
+        start = time.perf_counter()
+        self.geoengine.prefetch(self.collect_lat_lons(samples))
+        if timings is not None:
+            timings.record('geo_prefetch', time.perf_counter() - start)
+
+    def annotate(self, sample: SAMPLE, study: STUDY = None, timings: StageTimings = None) -> AnnotationReport:
         """
         Annotate a sample
 
         Returns an AnnotationReport object that includes a transformed sample representation,
         plus reports of all errors/warnings found, and repairs made
 
-        Performs a sequential series of tidy activities. Each report
+        Performs a sequential series of tidy activities (the registered stages, or those
+        chosen with select_stages). Each report
+
+        If timings is passed, the duration of each stage is recorded in it
         """
         report = AnnotationReport()
         report.messages = []
         report.input = sample
         sample = sample.copy()
-        self.validate_identifier(sample, report)
-        self.infer_package(sample, report)
-        self.tidy_nulls(sample, report)
-        self.tidy_keys(sample, report)
-        self.tidy_enumerations(sample, report)
-        self.tidy_measurements(sample, report)
-        self.perform_text_mining(sample, report)
-        self.perform_geolocation_inference(sample, report)
-        self.perform_inference(sample, report)
+        self.perform_stages(self.active_stages(), sample, report, timings)
         report.output = sample
         return report
 
+    def perform_stages(self, stages: List[str], sample: SAMPLE, report: AnnotationReport,
+                       timings: StageTimings = None) -> None:
+        for stage in stages:
+            start = time.perf_counter()
+            getattr(self, stage)(sample, report)
+            if timings is not None:
+                timings.record(stage, time.perf_counter() - start)
+
     def validate_identifier(self, sample: SAMPLE, report: AnnotationReport):
         id_fields = ['id', 'source_mat_id', 'identifier']
         id = None
@@ -79,40 +300,11 @@ class SampleAnnotator():
                     id = sample.get(f)
                     id_field = f
                 else:
-                    report.add_message(f'Multiple ID fields: {f}={sample.get(f)} already set to {id}')
+                    report.add_message('Multiple ID fields: {}={} already set to {}', params=(f, sample.get(f), id))
         if id is None:
-            report.add_message(f'No identifier set', severity=2, category=Category.Identifier)
+            report.add_message('No identifier set', severity=2, category=Category.Identifier)
         else:
-            if ':' in id:
-                parts = id.split(':')
-                if len(parts) > 2:
-                    report.add_message(f'Invalid CURIE syntax; multiple parts = {parts}',
-                                       severity=2,
-                                       category=Category.Identifier)
-                prefix = parts[0]
-                local_id = parts[1]
-                # TODO: cache to avoid multiple calls
-                normalized_prefix = bioregistry.normalize_prefix(prefix)
-                if normalized_prefix is None:
-                    report.add_message(f'No such prefix: {normalized_prefix}',
-                                       severity=2,
-                                       category=Category.Identifier)
-                else:
-                    if normalized_prefix != prefix:
-                        report.add_message(f'Normalizing prefix {prefix} => {normalized_prefix}',
-                                           severity=1,
-                                           was_repaired=True,
-                                           category=Category.Identifier)
-                        id = id.replace(prefix, normalized_prefix)
-                    pattern = bioregistry.get_pattern(normalized_prefix)
-                    if pattern is not None:
-                        logging.debug(f'Testing {id} against {pattern}')
-                        if not re.match(pattern, id):
-                            report.add_message(f'ID {id} does not match {pattern}',
-                                               severity=1,
-                                               category=Category.Identifier)
-            else:
-                report.add_message(f'ID is not a CURIE')
+            id = self.identifier_engine.validate(id, report)
             report.sample_id = id
             sample['id'] = id
 
@@ -124,9 +316,9 @@ class SampleAnnotator():
         package = sample.get(KEY_ENV_PACKAGE, None)
         checklist = sample.get(KEY_CHECKLIST, None)
         if package is None:
-            report.add_message(f'No package specified', category=Category.MissingCore)
+            report.add_message('No package specified', category=Category.MissingCore)
         if checklist is None:
-            report.add_message(f'No checklist specified')
+            report.add_message('No checklist specified')
         report.package = PackageCombo(environmental_package=package,
                                       checklist=checklist)
 
@@ -148,52 +340,66 @@ class SampleAnnotator():
          - uses mappings, e.g. between MIxS5 vs 6
          - performs case normalization
         """
-        schema = self.schema
         for orig_k, v in sample.copy().items():
-            k = underscore(orig_k)
-            if k != orig_k:
-                report.add_message(f'Key not underscored: {orig_k}', was_repaired=True)
+            plan = self.get_field_plan(orig_k)
+            if plan.needs_underscoring:
+                k = plan.underscored
+                report.add_message('Key not underscored: {}', params=(orig_k,), was_repaired=True)
                 sample[k] = v
                 del sample[orig_k]
         for k, v in sample.copy().items():
-            slot = schema.get_slot(k)
-            if slot is None:
-                slot = schema.get_slot(k, use_aliases=True)
-                if slot is None:
-                    report.add_message(f'Invalid field: {k}', category=Category.UnknownField)
-                else:
-                    new_k = slot.get('name')
-                    report.add_message(f'Alias used: {k} => {new_k}', was_repaired=True)
-                    sample[new_k] = v
-                    del sample[k]
+            plan = self.get_field_plan(k)
+            if plan.is_unknown:
+                report.add_message('Invalid field: {}', params=(k,), category=Category.UnknownField)
+            elif plan.is_alias:
+                new_k = plan.slot_name
+                report.add_message('Alias used: {} => {}', params=(k, new_k), was_repaired=True)
+                sample[new_k] = v
+                del sample[k]
 
     def tidy_measurements(self, sample: SAMPLE, report: AnnotationReport):
         """
         Tidies measurement fields
         """
         me = self.measurement_engine
-        schema = self.schema
         for k, v in sample.copy().items():
-            if schema.is_measurement_field(k):
+            if self.get_field_plan(k).is_measurement:
                 qv = me.repair(v, report=report)
                 sample[k] = qv
 
     def tidy_enumerations(self, sample: SAMPLE, report: AnnotationReport):
         """
-        Tidies measurement fields
+        Tidies enumerated fields
         """
-        schema = self.schema
         for k, v in sample.items():
-            enum = schema.get_enumerations(k)
-            if enum is not None:
-                pvs = enum.get('permissible_values', {})
-                if v not in pvs.keys():
-                    report.add_message(f'Value {v} is not in enum: {pvs.keys()}',
-                                       category=Category.ControlledVocabulary)
-                    # TODO: use basic NER to repair
-                else:
-                    pv = pvs.get(v)
-                    # TODO: use meaning field
+            plan = self.get_field_plan(k)
+            if plan.is_enum:
+                sample[k] = self.check_enumeration(plan, v, report)
+
+    def check_enumeration(self, plan: FieldPlan, v: Any, report: AnnotationReport) -> Any:
+        """
+        Checks a value against the enumeration of its field, returning the value to keep
+
+        A value that differs from exactly one permissible value only in case, whitespace or
+        punctuation is repaired to it; otherwise the closest permissible values are suggested
+        """
+        index = self.schema.get_enum_index(plan.enum_name)
+        if v in index:
+            return v
+        pv = index.normalized_match(v)
+        if pv is not None:
+            report.add_message('Enum value repaired: {} => {}', params=(v, pv), was_repaired=True,
+                               category=Category.ControlledVocabulary)
+            return pv
+        suggestions = index.suggest(v)
+        if suggestions:
+            report.add_message('Value {} is not in enum {}; closest: {}',
+                               params=(v, plan.enum_name, ', '.join(suggestions)),
+                               category=Category.ControlledVocabulary)
+        else:
+            report.add_message('Value {} is not in enum {}', params=(v, plan.enum_name),
+                               category=Category.ControlledVocabulary)
+        return v
 
     def perform_text_mining(self, sample: SAMPLE, report: AnnotationReport):
         """
@@ -209,30 +415,58 @@ class SampleAnnotator():
         # TODO: Stan to populate
         ll_str = sample.get(KEY_LAT_LON, None)
         if ll_str is None:
-            report.add_message(f'No lat_long specified',
+            report.add_message('No lat_long specified',
                                severity=3,
                                category=Category.MissingCore)
             return
         try:
-            lat_lon = tuple([float(x.strip()) for x in ll_str.split(' ')])
+            lat_lon = parse_lat_lon(ll_str)
         except:
-            report.add_message(f'Incorrect format for lat_lon: {ll_str}', severity=3)
+            report.add_message('Incorrect format for lat_lon: {}', params=(ll_str,), severity=3)
             return
         sample[KEY_LAT_LON] = {'latitude': lat_lon[0], 'longitude': lat_lon[1]}
 
         ge = self.geoengine
         soiltype = ge.get_fao_soil_type(lat_lon)
-        report.add_message('Soil type is ' + soiltype, severity=0)
+        if soiltype is not None:
+            report.add_message('Soil type is {}', params=(soiltype,), severity=0)
 
         logging.info('Using geoengine')
         elev = ge.get_elevation(lat_lon)
-        if len(elev) > 0:
-            report.add_message(f'Filling in missing value for elevation {elev}',
+        if elev is not None and len(elev) > 0:
+            report.add_message('Filling in missing value for elevation {}', params=(elev,),
                                was_repaired=True)
             sample[KEY_ELEV] = {'has_unit': 'meter',
                                 'has_numeric_value': elev}
+        self.check_geo_loc_name(sample, lat_lon, report)
         return
 
+    def check_geo_loc_name(self, sample: SAMPLE, lat_lon: LATLON, report: AnnotationReport):
+        """
+        Checks the country of geo_loc_name (the part before ':') against the region
+        containing lat_lon, filling it in if missing. Former INSDC country names, e.g.
+        Swaziland, match the region's current one
+
+        Only done if the geoengine has regions to reverse geocode with
+        """
+        region = self.geoengine.get_region(lat_lon)
+        if region is None:
+            return
+        geo_loc_name = sample.get(KEY_GEO_LOC_NAME, None)
+        if isinstance(geo_loc_name, dict):
+            geo_loc_name = geo_loc_name.get('has_raw_value', None)
+        if geo_loc_name is None or str(geo_loc_name).strip() == '':
+            report.add_message('Filling in missing value for geo_loc_name {}', params=(region,),
+                               was_repaired=True,
+                               category=Category.Geo)
+            sample[KEY_GEO_LOC_NAME] = region
+            return
+        country = str(geo_loc_name).split(':')[0].strip()
+        if insdc_country(country).lower() != region.lower():
+            report.add_message('geo_loc_name {} does not match lat_lon, which is in {}', params=(geo_loc_name, region),
+                               severity=2,
+                               category=Category.Geo)
+
     def perform_inference(self, sample: SAMPLE, report: AnnotationReport):
         """
         Performs Machine Learning inference
@@ -241,6 +475,43 @@ class SampleAnnotator():
         ...
 
 
+def make_annotator(googlemaps_api_key_path: str = None, geo_cache_dir: str = None,
+                   soil_raster: str = None, elevation_tiles: str = None, geo_concurrency: int = 8,
+                   geo_tile_size: float = None, google_elevation: bool = False, google_qps: float = 10.0,
+                   regions: str = None, cache_dir: str = None, stages: str = None,
+                   skip_stages: str = None) -> SampleAnnotator:
+    """
+    An annotator set up from command line options; stages and skip_stages are comma separated
+    """
+    annotator = SampleAnnotator()
+    if googlemaps_api_key_path:
+        annotator.geoengine = GeoEngine()
+        annotator.geoengine.load_key(googlemaps_api_key_path)
+    annotator.geoengine.cache_dir = geo_cache_dir
+    annotator.geoengine.concurrency = geo_concurrency
+    annotator.geoengine.tile_size = geo_tile_size
+    if soil_raster is not None:
+        annotator.geoengine.soil_raster = ZoblerSoilRaster(soil_raster)
+    if elevation_tiles is not None:
+        annotator.geoengine.elevation_tiles = ElevationTiles(elevation_tiles)
+    if google_elevation:
+        if not googlemaps_api_key_path:
+            raise click.UsageError('--google-elevation requires --googlemaps-api-key-path')
+        annotator.geoengine.google_elevation = GoogleElevation(annotator.geoengine.get_client(),
+                                                               queries_per_second=google_qps)
+    if regions is not None:
+        annotator.geoengine.regions = RegionIndex.load(regions)
+    if stages is not None or skip_stages is not None:
+        try:
+            annotator.select_stages(stages.split(',') if stages else None,
+                                    skip_stages.split(',') if skip_stages else None)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+    if cache_dir is not None:
+        annotator.use_annotation_cache(cache_dir)
+    return annotator
+
+
 @click.command()
 @click.option("--validateonly/--generate", "-v/-g", default=False,
               help="Just validate / generate output (default: generate)")
@@ -248,38 +519,106 @@ class SampleAnnotator():
               help="JSON for tidied samples")
 @click.option("--report-file", "-R",
               help="report file")
+@click.option("--report-format", type=click.Choice(REPORT_FORMATS),
+              help="report format; parquet and arrow need pyarrow (default: guessed from file name)")
 @click.option("--googlemaps-api-key-path", "-G",
               help="path to file containing google maps API KEY")
 @click.option("--bioportal-api-key-path", "-B",
               help="path to file containing bioportal API KEY")
+@click.option("--workers", "-w", default=1, show_default=True,
+              help="number of worker processes to annotate with")
+@click.option("--chunk-size", default=DEFAULT_CHUNK_SIZE, show_default=True,
+              help="number of samples sent to a worker at a time")
+@click.option("--input-format", "-I", type=click.Choice(FORMATS),
+              help="input format (default: guessed from file name)")
+@click.option("--output-format", "-O", type=click.Choice(FORMATS),
+              help="output format (default: guessed from file name)")
+@click.option("--geo-cache-dir",
+              help="directory for a persistent cache of geolocation lookups")
+@click.option("--soil-raster", type=click.Path(exists=True),
+              help="local Zobler 540 soil type grid (.npy) to use instead of the ORNL service")
+@click.option("--elevation-tiles", type=click.Path(exists=True, file_okay=False),
+              help="directory of local DEM tiles (.npy) to use instead of the ORNL service")
+@click.option("--geo-concurrency", default=8, show_default=True,
+              help="maximum number of concurrent geolocation requests")
+@click.option("--geo-tile-size", type=float,
+              help="fetch ORNL elevation as coverage tiles of this many degrees instead of per point")
+@click.option("--google-elevation/--no-google-elevation", default=False, show_default=True,
+              help="look up elevation with the Google Maps Elevation API (requires -G)")
+@click.option("--google-qps", default=10.0, show_default=True,
+              help="maximum Google Maps Elevation API requests per second")
+@click.option("--regions", type=click.Path(exists=True),
+              help="GeoJSON of country/region polygons to check and fill in geo_loc_name with")
+@click.option("--cache-dir",
+              help="directory for a persistent cache of annotations; unchanged samples are not re-annotated")
+@click.option("--timings/--no-timings", "show_timings", default=False, show_default=True,
+              help="print the time spent in each annotation stage")
+@click.option("--stages",
+              help=f"comma separated stages or cost classes to perform, along with the stages they "
+                   f"depend on (default: all). Stages: {', '.join(ANNOTATION_STAGES)}; "
+                   f"cost classes: {', '.join(COST_CLASSES)}")
+@click.option("--skip-stages",
+              help="comma separated stages or cost classes not to perform, e.g. remote,model")
 @click.argument("samplefile")
-def cli(samplefile: str, output: str = None, report_file: str = None,
+def cli(samplefile: str, output: str = None, report_file: str = None, report_format: str = None,
         validateonly: bool = False,
-        googlemaps_api_key_path: str = None, bioportal_api_key_path: str = None):
+        googlemaps_api_key_path: str = None, bioportal_api_key_path: str = None,
+        workers: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE,
+        input_format: str = None, output_format: str = None, geo_cache_dir: str = None,
+        soil_raster: str = None, elevation_tiles: str = None, geo_concurrency: int = 8,
+        geo_tile_size: float = None, google_elevation: bool = False, google_qps: float = 10.0,
+        regions: str = None, cache_dir: str = None, show_timings: bool = False, stages: str = None,
+        skip_stages: str = None):
     """
 Annotate a file of samples, producing a "repaired"/enhanced sample file as output, together
 with a report
 
-The input file must be a JSON fine containing an array of dicts
+The input file must be a JSON file containing an array of dicts, or a JSON Lines file
+with one dict per line. Samples are streamed: each is read, annotated and written in turn,
+with output files written in blocks by a background thread
     """
-    annotator = SampleAnnotator()
-    if googlemaps_api_key_path:
-        annotator.geoengine = GeoEngine()
-        annotator.geoengine.load_key(googlemaps_api_key_path)
-    with open(samplefile) as stream:
-        samples = json.load(stream)
-    report = annotator.annotate_all(samples)
-    df = report.as_dataframe()
-    if report_file is not None:
-        df.to_csv(report_file, sep='\t', index=False)
-    else:
-        sys.stderr.write(df.to_csv(sep='\t', index=False))
-    out_json = json.dumps(report.all_outputs(), indent=4, sort_keys=True)
-    if output is not None:
-        with open(output, 'w') as stream:
-            stream.write(out_json)
-    else:
-        # print(out_json)
+    annotator = make_annotator(googlemaps_api_key_path=googlemaps_api_key_path, geo_cache_dir=geo_cache_dir,
+                               soil_raster=soil_raster, elevation_tiles=elevation_tiles,
+                               geo_concurrency=geo_concurrency, geo_tile_size=geo_tile_size,
+                               google_elevation=google_elevation, google_qps=google_qps, regions=regions,
+                               cache_dir=cache_dir, stages=stages, skip_stages=skip_stages)
+    timings = StageTimings() if show_timings else None
+    if input_format is None:
+        input_format = guess_format(samplefile)
+    if output_format is None:
+        output_format = guess_format(output)
+    with ExitStack() as stack:
+        in_stream = stack.enter_context(open(samplefile))
+        if report_format is None:
+            report_format = guess_report_format(report_file)
+        if report_format != TSV_FORMAT:
+            if report_file is None:
+                raise click.UsageError(f'A {report_format} report needs --report-file')
+            report_writer = stack.enter_context(ReportArrowWriter(report_file, report_format))
+        else:
+            if report_file is not None:
+                report_stream = stack.enter_context(open(report_file, 'w', newline=''))
+                report_writer = stack.enter_context(ReportTSVWriter(report_stream, block_size=WRITE_BLOCK_SIZE,
+                                                                    background=True))
+            else:
+                # rows written to stderr show up as they are produced
+                report_writer = ReportTSVWriter(sys.stderr)
+        if output is not None:
+            out_stream = stack.enter_context(open(output, 'w'))
+            output_writer = stack.enter_context(sample_writer(out_stream, output_format, background=True))
+        else:
+            output_writer = None
+        samples = read_samples(in_stream, input_format)
+        for report in annotator.annotate_iter(samples, workers=workers, chunk_size=chunk_size, timings=timings):
+            report_writer.write(report)
+            if output_writer is not None:
+                output_writer.write(report.output)
+    if timings is not None:
+        click.echo(timings.format(), err=True)
+    if annotator.annotation_cache is not None:
+        stats = annotator.annotation_cache.stats()
+        click.echo(f'Annotation cache: {stats["hits"]} hits, {stats["misses"]} misses', err=True)
+    if output is None:
         print('Done')
 
 
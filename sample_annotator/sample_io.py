@@ -0,0 +1,365 @@
+import csv
+import json
+import queue
+import threading
+from types import SimpleNamespace
+from typing import Iterator, Iterable, TextIO, List, Any
+
+from .report_model import AnnotationReport, Message, ReportColumns, CATEGORIES, SAMPLE
+
+JSON_FORMAT = 'json'
+JSONL_FORMAT = 'jsonl'
+FORMATS = [JSON_FORMAT, JSONL_FORMAT]
+
+READ_BLOCK_SIZE = 1 << 16
+# characters buffered before a block is handed to the stream
+WRITE_BLOCK_SIZE = 1 << 20
+# blocks waiting for the background writer thread before write() blocks
+WRITE_QUEUE_BLOCKS = 4
+REPORT_COLUMNS = ['sample_id'] + Message.__cols__
+
+TSV_FORMAT = 'tsv'
+PARQUET_FORMAT = 'parquet'
+ARROW_FORMAT = 'arrow'
+REPORT_FORMATS = [TSV_FORMAT, PARQUET_FORMAT, ARROW_FORMAT]
+
+# messages per parquet row group / arrow record batch
+REPORT_BATCH_SIZE = 1 << 16
+
+
+def guess_format(path: str) -> str:
+    """
+    Guess json/jsonl from a file name
+    """
+    if path is not None and (path.endswith('.jsonl') or path.endswith('.ndjson')):
+        return JSONL_FORMAT
+    return JSON_FORMAT
+
+
+def guess_report_format(path: str) -> str:
+    """
+    Guess tsv/parquet/arrow from a report file name
+    """
+    if path is not None:
+        if path.endswith('.parquet'):
+            return PARQUET_FORMAT
+        if path.endswith('.arrow') or path.endswith('.arrows'):
+            return ARROW_FORMAT
+    return TSV_FORMAT
+
+
+def iter_jsonl(stream: TextIO) -> Iterator[SAMPLE]:
+    """
+    Yield one sample per non-blank line
+    """
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_json_array(stream: TextIO, block_size: int = READ_BLOCK_SIZE) -> Iterator[SAMPLE]:
+    """
+    Yield the members of a top-level JSON array without loading the whole document
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def fill() -> bool:
+        nonlocal buf, pos, eof
+        block = stream.read(block_size)
+        if not block:
+            eof = True
+            return False
+        buf = buf[pos:] + block
+        pos = 0
+        return True
+
+    def skip_ws() -> str:
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos].isspace():
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if not fill():
+                return ''
+
+    if skip_ws() != '[':
+        raise ValueError('Expected a JSON array of samples')
+    pos += 1
+    if skip_ws() == ']':
+        return
+    while True:
+        if skip_ws() == '':
+            raise ValueError('Unterminated JSON array')
+        while True:
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+                # a number at the end of the buffer may be truncated
+                if end == len(buf) and not eof and fill():
+                    continue
+                break
+            except json.JSONDecodeError:
+                if eof or not fill():
+                    raise
+        pos = end
+        yield obj
+        c = skip_ws()
+        if c == ']':
+            return
+        if c == '':
+            raise ValueError('Unterminated JSON array')
+        if c != ',':
+            raise ValueError(f'Expected , or ] after a sample, found {c!r}')
+        pos += 1
+        if skip_ws() == ']':
+            raise ValueError('Trailing comma in JSON array')
+
+
+def read_samples(stream: TextIO, input_format: str = JSON_FORMAT) -> Iterator[SAMPLE]:
+    if input_format == JSONL_FORMAT:
+        return iter_jsonl(stream)
+    return iter_json_array(stream)
+
+
+class BlockWriter:
+    """
+    Buffers text and writes it to a stream in blocks of about block_size characters
+
+    With background=True blocks are written by a separate thread, so annotation and
+    formatting carry on while a block is being written; at most queue_blocks blocks wait
+    for the thread, which bounds memory. close() writes what is left and re-raises any
+    error from the writer thread. The stream itself is left open
+    """
+
+    def __init__(self, stream: TextIO, block_size: int = WRITE_BLOCK_SIZE, background: bool = False,
+                 queue_blocks: int = WRITE_QUEUE_BLOCKS):
+        self.stream = stream
+        self.block_size = block_size
+        self.buffer: List[str] = []
+        self.buffered = 0
+        self.closed = False
+        self.error: BaseException = None
+        self.queue = None
+        self.thread = None
+        if background:
+            self.queue = queue.Queue(maxsize=queue_blocks)
+            self.thread = threading.Thread(target=self._write_blocks, name='sample-io-writer', daemon=True)
+            self.thread.start()
+
+    def _write_blocks(self) -> None:
+        while True:
+            block = self.queue.get()
+            if block is None:
+                return
+            # after an error keep draining the queue, so the producer never blocks
+            if self.error is None:
+                try:
+                    self.stream.write(block)
+                except BaseException as e:
+                    self.error = e
+
+    def write_text(self, text: str) -> None:
+        self.buffer.append(text)
+        self.buffered += len(text)
+        if self.buffered >= self.block_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Hand buffered text to the stream (or the writer thread)
+        """
+        if self.error is not None:
+            raise self.error
+        if self.buffer:
+            block = ''.join(self.buffer)
+            self.buffer = []
+            self.buffered = 0
+            if self.queue is not None:
+                self.queue.put(block)
+            else:
+                self.stream.write(block)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.flush()
+        finally:
+            if self.thread is not None:
+                self.queue.put(None)
+                self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self) -> "BlockWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class JSONArrayWriter(BlockWriter):
+    """
+    Writes samples as a JSON array, one at a time
+
+    Output is byte-identical to json.dumps(samples, indent=4, sort_keys=True). If the
+with block exits with an error, the array is left unterminated, so that a run that
+failed part way does not look like a complete output
+    """
+
+    def __init__(self, stream: TextIO, **kwargs):
+        super().__init__(stream, **kwargs)
+        self.first = True
+        self.failed = False
+
+    def write(self, sample: SAMPLE) -> None:
+        item = json.dumps(sample, indent=4, sort_keys=True)
+        self.write_text(('[\n    ' if self.first else ',\n    ') + item.replace('\n', '\n    '))
+        self.first = False
+
+    def close(self) -> None:
+        if not self.closed and not self.failed:
+            self.write_text('[]' if self.first else '\n]')
+        super().close()
+
+    def __exit__(self, exc_type, *args) -> None:
+        self.failed = exc_type is not None
+        self.close()
+
+
+class JSONLWriter(BlockWriter):
+    """
+    Writes samples one per line
+    """
+
+    def write(self, sample: SAMPLE) -> None:
+        self.write_text(json.dumps(sample, sort_keys=True) + '\n')
+
+
+def sample_writer(stream: TextIO, output_format: str = JSON_FORMAT, **kwargs) -> BlockWriter:
+    """
+    Writer for samples in json or jsonl; kwargs are passed to BlockWriter
+    """
+    if output_format == JSONL_FORMAT:
+        return JSONLWriter(stream, **kwargs)
+    return JSONArrayWriter(stream, **kwargs)
+
+
+def write_samples(samples: Iterable[SAMPLE], stream: TextIO, output_format: str = JSON_FORMAT) -> None:
+    """
+    Write samples one at a time
+
+    In json mode the output is byte-identical to json.dumps(samples, indent=4, sort_keys=True)
+    """
+    with sample_writer(stream, output_format) as writer:
+        for sample in samples:
+            writer.write(sample)
+
+
+def report_rows(report: AnnotationReport) -> Iterator[List[Any]]:
+    for m in report.messages:
+        yield [report.sample_id, m.description, m.severity, m.field, m.was_repaired, m.category]
+
+
+class ReportTSVWriter(BlockWriter):
+    """
+    Appends report rows to a TSV stream as reports are produced
+
+    Output matches AnnotationMultiSampleReport.as_dataframe().to_csv(sep='\\t', index=False).
+    By default each row is written straight away; pass a block_size to buffer rows
+    """
+
+    def __init__(self, stream: TextIO, block_size: int = 0, **kwargs):
+        super().__init__(stream, block_size=block_size, **kwargs)
+        self.writer = csv.writer(SimpleNamespace(write=self.write_text), delimiter='\t', lineterminator='\n')
+        self.writer.writerow(REPORT_COLUMNS)
+
+    def write(self, report: AnnotationReport) -> None:
+        for row in report_rows(report):
+            self.writer.writerow(['' if v is None else v for v in row])
+
+
+def import_pyarrow():
+    """
+    pyarrow is only needed for parquet and arrow reports, so it is imported on demand
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        return pyarrow
+    except ImportError as e:
+        raise ImportError('Writing parquet or arrow reports requires pyarrow (pip install sample-annotator[arrow])') from e
+
+
+def report_schema():
+    pa = import_pyarrow()
+    dict_string = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([('sample_id', dict_string),
+                      ('description', dict_string),
+                      ('severity', pa.int8()),
+                      ('field', dict_string),
+                      ('was_repaired', pa.bool_()),
+                      ('category', dict_string)])
+
+
+def report_batch(columns: ReportColumns):
+    """
+    Arrow record batch of report columns, with strings dictionary encoded and the
+    category as its value, e.g. 'geo'
+    """
+    pa = import_pyarrow()
+    category_values = pa.array([c.value for c in CATEGORIES], type=pa.string())
+    arrays = [pa.array(columns.sample_id, type=pa.string()).dictionary_encode(),
+              pa.array(columns.description, type=pa.string()).dictionary_encode(),
+              pa.array(columns.severity, type=pa.int8()),
+              pa.array(columns.field, type=pa.string()).dictionary_encode(),
+              pa.array(columns.was_repaired, type=pa.bool_()),
+              pa.DictionaryArray.from_arrays(pa.array(columns.category, type=pa.int32()), category_values)]
+    return pa.RecordBatch.from_arrays(arrays, schema=report_schema())
+
+
+class ReportArrowWriter:
+    """
+    Appends report rows to a parquet file or an arrow IPC stream as reports are produced
+
+    Rows are buffered as columns and written every batch_size messages, as a parquet row
+    group or an arrow record batch. Arrow output uses the IPC streaming format, since
+    each batch has its own dictionaries; read it with pyarrow.ipc.open_stream
+    """
+
+    def __init__(self, path: str, fmt: str = PARQUET_FORMAT, batch_size: int = REPORT_BATCH_SIZE):
+        pa = import_pyarrow()
+        if fmt == PARQUET_FORMAT:
+            self.writer = pa.parquet.ParquetWriter(path, report_schema())
+        elif fmt == ARROW_FORMAT:
+            self.writer = pa.ipc.new_stream(path, report_schema())
+        else:
+            raise ValueError(f'Not a columnar report format: {fmt}')
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.columns = ReportColumns()
+
+    def write(self, report: AnnotationReport) -> None:
+        self.columns.add(report)
+        if len(self.columns) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if len(self.columns):
+            self.writer.write_batch(report_batch(self.columns))
+            self.columns = ReportColumns()
+
+    def close(self) -> None:
+        self.flush()
+        self.writer.close()
+
+    def __enter__(self) -> "ReportArrowWriter":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -0,0 +1,341 @@
+import json
+import logging
+import threading
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List
+from urllib.parse import urlparse
+
+import click
+
+from .parallel import make_pool, warm_pool, DEFAULT_CHUNK_SIZE
+from .report_model import AnnotationReport, SAMPLE
+from .sample_annotator import SampleAnnotator, ANNOTATION_STAGES, make_annotator
+from .sample_io import READ_BLOCK_SIZE
+from .stages import COST_CLASSES
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+JSON_TYPE = 'application/json'
+JSONL_TYPE = 'application/x-ndjson'
+
+
+def report_json(report: AnnotationReport) -> Dict[str, Any]:
+    """
+    A report as JSON: the tidied sample and its messages
+    """
+    return {'sample_id': report.sample_id,
+            'output': report.output,
+            'max_severity': report.max_severity(),
+            'messages': [dict(m.as_dict(), category=m.category.value) for m in report.messages or []]}
+
+
+def iter_chunked(stream: BinaryIO) -> Iterator[bytes]:
+    """
+    Decode a request body sent with chunked transfer encoding
+    """
+    while True:
+        size = int(stream.readline().split(b';', 1)[0], 16)
+        if size == 0:
+            # skip any trailers, up to the blank line that ends the body
+            while stream.readline() not in (b'\r\n', b'\n', b''):
+                pass
+            return
+        yield stream.read(size)
+        stream.readline()
+
+
+def iter_sized(stream: BinaryIO, length: int, block_size: int = READ_BLOCK_SIZE) -> Iterator[bytes]:
+    """
+    Read a request body of a known length in blocks
+    """
+    while length > 0:
+        block = stream.read(min(length, block_size))
+        if not block:
+            raise ValueError('Request body ended early')
+        length -= len(block)
+        yield block
+
+
+def iter_lines(blocks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Split blocks of bytes into lines
+    """
+    pending = b''
+    for block in blocks:
+        *lines, pending = (pending + block).split(b'\n')
+        yield from lines
+    if pending:
+        yield pending
+
+
+def batch_samples(body: Any) -> List[SAMPLE]:
+    """
+    Samples from a batch request: an array of sample objects, or a single one
+    """
+    if isinstance(body, dict):
+        return [body]
+    if not isinstance(body, list) or not all(isinstance(sample, dict) for sample in body):
+        raise ValueError('Expected a sample object or an array of them')
+    return body
+
+
+def stream_samples(lines: Iterable[bytes]) -> Iterator[SAMPLE]:
+    """
+    Samples from a stream request, one JSON object per non-blank line
+    """
+    for line in lines:
+        if line.strip():
+            sample = json.loads(line)
+            if not isinstance(sample, dict):
+                raise ValueError('Expected a sample object on each line')
+            yield sample
+
+
+@dataclass
+class AnnotationService:
+    """
+    Annotation for an HTTP server: a warm annotator shared by all requests and, if
+    workers > 1, a pool of worker processes that lives as long as the service
+
+    Batches of at most chunk_size samples are annotated in the server process, which for a
+    warm annotator takes milliseconds; larger batches and streams use the pool. Each
+    worker prefetches the geo lookups of its own chunks; set the geoengine's cache_dir to
+    share lookups between workers and across restarts
+
+    The annotator's caches, counters and rate limits are not thread safe, so requests
+    annotated in the server process (or using its annotation cache) take turns; those
+    sent to the pool run concurrently
+    """
+    annotator: SampleAnnotator = field(default_factory=SampleAnnotator)
+    workers: int = 1
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+    executor: Executor = None
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def start(self) -> None:
+        """
+        Load the schema and measurement parser, and start the worker pool
+        """
+        self.annotator.warm_up()
+        if self.workers > 1 and self.executor is None:
+            self.executor = make_pool(self.annotator, self.workers)
+            warm_pool(self.executor, self.workers)
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def health(self) -> Dict[str, Any]:
+        return {'status': 'ok',
+                'workers': self.workers,
+                'stages': self.annotator.active_stages()}
+
+    def in_pool(self, workers: int) -> bool:
+        """
+        Whether annotating with this many workers leaves the server process's annotator alone
+        """
+        return workers > 1 and self.executor is not None and self.annotator.annotation_cache is None
+
+    def annotate_batch(self, samples: List[SAMPLE]) -> List[AnnotationReport]:
+        workers = self.workers if len(samples) > self.chunk_size else 1
+        if self.in_pool(workers):
+            return self.annotator.annotate_all(samples, workers=workers, chunk_size=self.chunk_size,
+                                               executor=self.executor).reports
+        with self.lock:
+            return self.annotator.annotate_all(samples, workers=workers, chunk_size=self.chunk_size,
+                                               executor=self.executor).reports
+
+    def annotate_stream(self, samples: Iterable[SAMPLE]) -> Iterator[AnnotationReport]:
+        reports = self.annotator.annotate_iter(samples, workers=self.workers, chunk_size=self.chunk_size,
+                                               executor=self.executor)
+        if self.in_pool(self.workers):
+            yield from reports
+            return
+        with self.lock:
+            yield from reports
+
+    def make_server(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> "AnnotationHTTPServer":
+        return AnnotationHTTPServer((host, port), self)
+
+
+class AnnotationRequestHandler(BaseHTTPRequestHandler):
+    """
+    Endpoints:
+
+     - GET /health: status, workers and stages
+     - POST /annotate: a JSON array of samples (or one sample); responds with
+       {"reports": [...]}, one report per sample, in order
+     - POST /annotate/stream: JSON Lines of samples; responds with JSON Lines of reports,
+       each sent as soon as it is ready. Clients should read the response while sending
+       the request
+    """
+    protocol_version = 'HTTP/1.1'
+    server: "AnnotationHTTPServer"
+
+    def log_message(self, format: str, *args) -> None:
+        logging.info(f'{self.address_string()} {format % args}')
+
+    def send_json(self, body: Any, status: HTTPStatus = HTTPStatus.OK) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', JSON_TYPE)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, status: HTTPStatus, message: str) -> None:
+        # the rest of the request body may not have been read
+        self.close_connection = True
+        self.send_json({'error': message}, status=status)
+
+    def write_chunk(self, data: bytes) -> None:
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+
+    def iter_body(self) -> Iterator[bytes]:
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            return iter_chunked(self.rfile)
+        return iter_sized(self.rfile, int(self.headers.get('Content-Length', 0)))
+
+    def do_GET(self) -> None:
+        path = urlparse(self.path).path
+        if path == '/health':
+            self.send_json(self.server.service.health())
+        else:
+            self.send_error_json(HTTPStatus.NOT_FOUND, f'No such endpoint: {path}')
+
+    def do_POST(self) -> None:
+        path = urlparse(self.path).path
+        if path == '/annotate':
+            self.annotate_batch()
+        elif path == '/annotate/stream':
+            self.annotate_stream()
+        else:
+            self.send_error_json(HTTPStatus.NOT_FOUND, f'No such endpoint: {path}')
+
+    def annotate_batch(self) -> None:
+        try:
+            samples = batch_samples(json.loads(b''.join(self.iter_body())))
+        except ValueError as e:
+            self.send_error_json(HTTPStatus.BAD_REQUEST, str(e))
+            return
+        try:
+            reports = self.server.service.annotate_batch(samples)
+        except Exception as e:
+            logging.exception('Annotation failed')
+            self.send_error_json(HTTPStatus.INTERNAL_SERVER_ERROR, f'Annotation failed: {e!r}')
+            return
+        self.send_json({'reports': [report_json(report) for report in reports]})
+
+    def annotate_stream(self) -> None:
+        samples = stream_samples(iter_lines(self.iter_body()))
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', JSONL_TYPE)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        reports = self.server.service.annotate_stream(samples)
+        try:
+            for report in reports:
+                self.write_chunk(json.dumps(report_json(report)).encode() + b'\n')
+        except (ConnectionError, TimeoutError):
+            # the client has gone
+            self.close_connection = True
+            return
+        except Exception as e:
+            # bad input or a failed annotation; the status has been sent, so the error is
+            # the last line of the response
+            if isinstance(e, ValueError):
+                message = str(e)
+            else:
+                logging.exception('Annotation failed')
+                message = f'Annotation failed: {e!r}'
+            self.close_connection = True
+            self.write_chunk(json.dumps({'error': message}).encode() + b'\n')
+        finally:
+            # releases the service lock if the stream held it
+            reports.close()
+        self.write_chunk(b'')
+
+
+class AnnotationHTTPServer(ThreadingHTTPServer):
+    """
+    Serves an AnnotationService, a request per thread
+    """
+    daemon_threads = True
+
+    def __init__(self, address, service: AnnotationService):
+        super().__init__(address, AnnotationRequestHandler)
+        self.service = service
+
+
+@click.command()
+@click.option("--host", default=DEFAULT_HOST, show_default=True,
+              help="address to listen on")
+@click.option("--port", "-p", default=DEFAULT_PORT, show_default=True,
+              help="port to listen on")
+@click.option("--workers", "-w", default=1, show_default=True,
+              help="number of worker processes kept for large batches and streams")
+@click.option("--chunk-size", default=DEFAULT_CHUNK_SIZE, show_default=True,
+              help="number of samples sent to a worker at a time; smaller batches are annotated in the server")
+@click.option("--googlemaps-api-key-path", "-G",
+              help="path to file containing google maps API KEY")
+@click.option("--geo-cache-dir",
+              help="directory for a persistent cache of geolocation lookups")
+@click.option("--soil-raster", type=click.Path(exists=True),
+              help="local Zobler 540 soil type grid (.npy) to use instead of the ORNL service")
+@click.option("--elevation-tiles", type=click.Path(exists=True, file_okay=False),
+              help="directory of local DEM tiles (.npy) to use instead of the ORNL service")
+@click.option("--geo-concurrency", default=8, show_default=True,
+              help="maximum number of concurrent geolocation requests")
+@click.option("--geo-tile-size", type=float,
+              help="fetch ORNL elevation as coverage tiles of this many degrees instead of per point")
+@click.option("--google-elevation/--no-google-elevation", default=False, show_default=True,
+              help="look up elevation with the Google Maps Elevation API (requires -G)")
+@click.option("--google-qps", default=10.0, show_default=True,
+              help="maximum Google Maps Elevation API requests per second")
+@click.option("--regions", type=click.Path(exists=True),
+              help="GeoJSON of country/region polygons to check and fill in geo_loc_name with")
+@click.option("--cache-dir",
+              help="directory for a persistent cache of annotations; unchanged samples are not re-annotated")
+@click.option("--stages",
+              help=f"comma separated stages or cost classes to perform (default: all). "
+                   f"Stages: {', '.join(ANNOTATION_STAGES)}; cost classes: {', '.join(COST_CLASSES)}")
+@click.option("--skip-stages",
+              help="comma separated stages or cost classes not to perform, e.g. remote,model")
+def cli(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, workers: int = 1,
+        chunk_size: int = DEFAULT_CHUNK_SIZE, googlemaps_api_key_path: str = None,
+        geo_cache_dir: str = None, soil_raster: str = None, elevation_tiles: str = None,
+        geo_concurrency: int = 8, geo_tile_size: float = None, google_elevation: bool = False,
+        google_qps: float = 10.0, regions: str = None, cache_dir: str = None, stages: str = None, skip_stages: str = None):
+    """
+Serve annotation over HTTP, keeping the annotator, its schema indexes and geolocation
+caches loaded between requests
+
+Endpoints: GET /health; POST /annotate with a JSON array of samples; POST
+/annotate/stream with JSON Lines of samples, answered with JSON Lines of reports
+    """
+    logging.basicConfig(level=logging.INFO)
+    annotator = make_annotator(googlemaps_api_key_path=googlemaps_api_key_path, geo_cache_dir=geo_cache_dir,
+                               soil_raster=soil_raster, elevation_tiles=elevation_tiles,
+                               geo_concurrency=geo_concurrency, geo_tile_size=geo_tile_size,
+                               google_elevation=google_elevation, google_qps=google_qps, regions=regions,
+                               cache_dir=cache_dir, stages=stages, skip_stages=skip_stages)
+    service = AnnotationService(annotator, workers=workers, chunk_size=chunk_size)
+    service.start()
+    server = service.make_server(host, port)
+    logging.info(f'Serving annotation on http://{host}:{server.server_address[1]}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == '__main__':
+    cli()
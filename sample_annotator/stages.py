@@ -0,0 +1,80 @@
+from dataclasses import dataclass, field
+from typing import List, Iterable, Optional
+
+# cost classes: local checks and repairs, lookups against remote services, and
+# text mining / machine learning
+COST_FAST = 'fast'
+COST_REMOTE = 'remote'
+COST_MODEL = 'model'
+COST_CLASSES = [COST_FAST, COST_REMOTE, COST_MODEL]
+
+
+@dataclass
+class AnnotationStage:
+    """
+    A step of SampleAnnotator.annotate
+
+    name is the annotator method that performs it, called with the sample and report;
+    depends_on lists the stages that must have run before it. Stages that enrich a sample
+    depend on validate_identifier, which sets the report's sample_id
+    """
+    name: str
+    depends_on: List[str] = field(default_factory=list)
+    cost: str = COST_FAST
+
+
+# what the remote and model stages need: the sample_id, and fields under their slot names
+# with nulls removed
+ENRICHMENT_DEPENDENCIES = ['validate_identifier', 'tidy_nulls', 'tidy_keys']
+
+# in the order they are performed; enumerations and measurements are looked up by slot
+# name and parse values that are present, so they are tidied after nulls and keys
+DEFAULT_STAGES = [AnnotationStage('validate_identifier'),
+                  AnnotationStage('infer_package'),
+                  AnnotationStage('tidy_nulls'),
+                  AnnotationStage('tidy_keys'),
+                  AnnotationStage('tidy_enumerations', ['tidy_nulls', 'tidy_keys']),
+                  AnnotationStage('tidy_measurements', ['tidy_nulls', 'tidy_keys']),
+                  AnnotationStage('perform_text_mining', ENRICHMENT_DEPENDENCIES, COST_MODEL),
+                  AnnotationStage('perform_geolocation_inference', ENRICHMENT_DEPENDENCIES, COST_REMOTE),
+                  AnnotationStage('perform_inference', ENRICHMENT_DEPENDENCIES, COST_MODEL)]
+
+
+def expand_stage_names(stages: List[AnnotationStage], names: Iterable[str]) -> List[str]:
+    """
+    Stage names, with each cost class replaced by the names of the stages in it
+    """
+    known = [s.name for s in stages]
+    expanded = []
+    for name in names:
+        if name in COST_CLASSES:
+            expanded.extend(s.name for s in stages if s.cost == name)
+        elif name in known:
+            expanded.append(name)
+        else:
+            raise ValueError(f'Unknown stage: {name}; expected one of {", ".join(known + COST_CLASSES)}')
+    return expanded
+
+
+def resolve_stages(stages: List[AnnotationStage], selected: Optional[Iterable[str]] = None,
+                   skipped: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Names of the stages to run, in registry order
+
+    Starts from the selected stages (or cost classes), all of them if None, plus whatever
+    they depend on, then removes the skipped ones. Skipping a stage that a remaining stage
+    depends on is a ValueError
+    """
+    by_name = {s.name: s for s in stages}
+    wanted = set(by_name) if selected is None else set(expand_stage_names(stages, selected))
+    skip = set() if skipped is None else set(expand_stage_names(stages, skipped))
+    # registry order has dependencies first, so walking it backwards reaches them all
+    for s in reversed(stages):
+        if s.name in wanted:
+            wanted.update(s.depends_on)
+    for s in stages:
+        if s.name in wanted and s.name not in skip:
+            needed = skip.intersection(s.depends_on)
+            if needed:
+                raise ValueError(f'Cannot skip {", ".join(sorted(needed))}: {s.name} depends on it')
+    return [s.name for s in stages if s.name in wanted and s.name not in skip]
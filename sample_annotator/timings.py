@@ -0,0 +1,59 @@
+from array import array
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass
+class StageTimings:
+    """
+    Wall clock durations of annotation stages, in seconds
+
+    Every duration is kept (8 bytes each) so that percentiles are exact; timings from
+    worker processes are combined with merge. Stages are reported in the order they
+    were first recorded
+    """
+    durations: Dict[str, array] = field(default_factory=dict)
+
+    def record(self, stage: str, seconds: float) -> None:
+        durations = self.durations.get(stage, None)
+        if durations is None:
+            durations = self.durations[stage] = array('d')
+        durations.append(seconds)
+
+    def merge(self, other: "StageTimings") -> None:
+        for stage, durations in other.durations.items():
+            if stage in self.durations:
+                self.durations[stage].extend(durations)
+            else:
+                self.durations[stage] = array('d', durations)
+
+    def summary(self) -> List[Dict]:
+        """
+        count, total and percentiles of each stage, in seconds
+        """
+        rows = []
+        for stage, durations in self.durations.items():
+            values = np.frombuffer(durations, dtype=float) if len(durations) else np.zeros(1)
+            row = {'stage': stage, 'count': len(durations), 'total': float(values.sum())}
+            for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+                row[f'p{p}'] = float(v)
+            rows.append(row)
+        return rows
+
+    def as_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame(self.summary(), columns=['stage', 'count', 'total'] + [f'p{p}' for p in PERCENTILES])
+
+    def format(self) -> str:
+        """
+        Human readable table, with totals in seconds and percentiles in milliseconds
+        """
+        df = self.as_dataframe()
+        for p in PERCENTILES:
+            df[f'p{p}'] = df[f'p{p}'] * 1000
+        df = df.rename(columns={'total': 'total_s'} | {f'p{p}': f'p{p}_ms' for p in PERCENTILES})
+        return df.to_string(index=False, float_format=lambda v: f'{v:.3f}')
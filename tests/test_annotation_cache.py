@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import json
+import tempfile
+
+from sample_annotator import SampleAnnotator
+from sample_annotator.annotation_cache import AnnotationCache, canonical_digest
+from sample_annotator.timings import StageTimings
+from tests.test_parallel import load_samples
+
+"""Test the annotation result cache."""
+
+import unittest
+
+
+def report_text(reports) -> str:
+    return json.dumps([[repr(m) for m in r.messages] + [r.output, r.sample_id] for r in reports],
+                      sort_keys=True, default=str)
+
+
+class TestAnnotationCache(unittest.TestCase):
+    """annotation cache test."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_canonical_digest(self):
+        assert canonical_digest({'a': 1, 'b': [1, 2]}) == canonical_digest({'b': [1, 2], 'a': 1})
+        assert canonical_digest({'a': 1}) != canonical_digest({'a': '1'})
+
+    def test_rerun(self):
+        samples = load_samples()
+        expected = SampleAnnotator().annotate_all(samples)
+        annotator = SampleAnnotator()
+        cache = annotator.use_annotation_cache(self.tmpdir.name)
+        first = annotator.annotate_all(samples)
+        assert cache.stats()['misses'] == len(samples)
+        changed = [dict(s) for s in samples]
+        changed[1]['depth'] = '12 m'
+        second = annotator.annotate_all(changed)
+        assert cache.hits == len(samples) - 1
+        # only the changed sample went through the stages again
+        assert second.timings.summary()[-1]['count'] == 1
+        assert report_text(first.reports) == report_text(expected.reports)
+        assert report_text(second.reports[2:]) == report_text(expected.reports[2:])
+        assert second.reports[1].output['depth']['has_raw_value'] == '12 m'
+        assert second.reports[0].input is changed[0]
+
+    def test_iter(self):
+        samples = load_samples() * 3
+        annotator = SampleAnnotator()
+        cache = annotator.use_annotation_cache(self.tmpdir.name)
+        first = list(annotator.annotate_iter(samples, workers=2, chunk_size=2))
+        timings = StageTimings()
+        second = list(annotator.annotate_iter(iter(samples), timings=timings))
+        assert report_text(first) == report_text(second)
+        # repeated samples are hits from the first occurrence on
+        assert cache.misses == len(samples) // 3
+        assert timings.durations == {}
+
+    def test_invalidation(self):
+        annotator = SampleAnnotator()
+        annotator.use_annotation_cache(self.tmpdir.name)
+        annotator.annotate_all(load_samples())
+        reopened = AnnotationCache(self.tmpdir.name, namespace=annotator.cache_namespace())
+        assert reopened.stats()['size'] == len(load_samples())
+        # e.g. a different schema or annotator version
+        changed = AnnotationCache(self.tmpdir.name, namespace='something else')
+        assert changed.stats()['size'] == 0
+        assert changed.get(load_samples()[0]) is None
+        changed.set(load_samples()[0], None, reopened.get(load_samples()[0]))
+        # namespaces are kept apart, so opening one leaves the others in place
+        again = AnnotationCache(self.tmpdir.name, namespace=annotator.cache_namespace())
+        assert again.stats()['size'] == len(load_samples())
+        assert changed.stats()['size'] == 1
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import sys
+
+from sample_annotator.benchmarks.synthetic import SyntheticSampleGenerator
+from sample_annotator.benchmarks.run_benchmark import run_benchmark, compare
+
+"""Test the synthetic sample generator and benchmark runner."""
+
+import unittest
+
+
+class TestBenchmarks(unittest.TestCase):
+    """benchmark test."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.generator = SyntheticSampleGenerator(seed=1)
+
+    def test_generator(self):
+        samples = self.generator.samples(200)
+        assert samples == SyntheticSampleGenerator(seed=1, schema=self.generator.schema).samples(200)
+        assert len({s['id'] for s in samples}) == 200
+        assert all(len(s['lat_lon'].split(' ')) == 2 for s in samples)
+        enum_samples = [s for s in samples if set(s) & set(self.generator.enum_fields)]
+        assert 20 < len(enum_samples) < 100
+        plain = SyntheticSampleGenerator(seed=1, schema=self.generator.schema, alias_rate=0, null_rate=0,
+                                         enum_rate=0, measurement_rate=0)
+        seed_keys = set().union(*[s.keys() for s in plain.seeds])
+        assert all(set(s) <= seed_keys | {'id', 'lat_lon'} for s in plain.samples(50))
+
+    def test_run_benchmark(self):
+        result = run_benchmark(self.generator, 50)
+        assert result['samples'] == 50
+        assert result['samples_per_sec'] > 0
+        assert result['stages']['tidy_measurements']['count'] == 50
+        if sys.platform != 'win32':
+            assert result['peak_rss_mb'] > 0
+            assert result['children_peak_rss_mb'] >= 0
+        baseline = [dict(result, samples_per_sec=result['samples_per_sec'] * 2)]
+        assert len(compare([result], baseline, tolerance=0.2)) == 1
+        assert compare([result], [result], tolerance=0.2) == []
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+
+import numpy as np
+
+from sample_annotator import GeoEngine, SampleAnnotator
+from sample_annotator.geolocation.elevation_tiles import ElevationTiles, tile_name
+
+"""Test offline elevation lookup."""
+
+import unittest
+
+
+def make_tiles(tile_dir: str) -> None:
+    """
+    Two synthetic 120x120 tiles; elevations encode the row and column
+    """
+    rows, cols = np.mgrid[0:120, 0:120]
+    np.save(os.path.join(tile_dir, 'N27E086.npy'), (rows * 1000 + cols).astype(np.int32))
+    tile = np.full((120, 120), 5, dtype=np.int16)
+    tile[0, 0] = -32768
+    np.save(os.path.join(tile_dir, 'S01W001.npy'), tile)
+
+
+class TestElevationTiles(unittest.TestCase):
+    """offline elevation test."""
+
+    def test_tile_name(self):
+        assert tile_name((27, 86)) == 'N27E086'
+        assert tile_name((-1, -1)) == 'S01W001'
+
+    def test_lookup(self):
+        with tempfile.TemporaryDirectory() as d:
+            make_tiles(d)
+            tiles = ElevationTiles(d, max_open_tiles=1)
+            # Mt Everest: row floor((28 - 27.9881) * 120) = 1, column floor(0.93 * 120) = 111
+            assert tiles.get_elevation((27.9881, 86.9300)) == '1111'
+            latlons = [(27.9881, 86.9300), (-0.5, -0.5), (-0.001, -0.999), (50.0, 50.0), (27.0001, 86.0001)]
+            assert tiles.get_elevations(latlons) == ['1111', '5', None, None, '119000']
+            assert len(tiles.open_tiles) == 1
+            ge = GeoEngine(elevation_tiles=tiles)
+            assert ge.get_elevations(latlons[:2]) == ['1111', '5']
+
+    def test_annotate(self):
+        with tempfile.TemporaryDirectory() as d:
+            make_tiles(d)
+            annotator = SampleAnnotator()
+            annotator.geoengine.elevation_tiles = ElevationTiles(d)
+            annotator.geoengine.fetch_fao_soil_type = lambda latlon: 'Cambisols'
+            report = annotator.annotate({'id': 'TEST:1', 'lat_lon': '27.9881 86.9300'})
+            assert report.output['elev'] == {'has_unit': 'meter', 'has_numeric_value': '1111'}
+            report = annotator.annotate({'id': 'TEST:1', 'lat_lon': '50 50'})
+            assert 'elev' not in report.output
+
+    def test_digest(self):
+        with tempfile.TemporaryDirectory() as d:
+            make_tiles(d)
+            tiles = ElevationTiles(d)
+            config = GeoEngine(elevation_tiles=tiles).config()
+            assert config['elevation_tiles'] == tiles.digest()
+            # same directory, different data
+            np.save(os.path.join(d, 'S01W001.npy'), np.full((120, 120), 6, dtype=np.int16))
+            assert GeoEngine(elevation_tiles=tiles).config() != config
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import pickle
+
+from sample_annotator import SampleAnnotator
+from sample_annotator.metadata.enum_index import EnumIndex, normalize_enum_value
+from sample_annotator.metadata.sample_schema import SampleSchema
+from sample_annotator.report_model import Category
+
+"""Test enum matching."""
+
+import unittest
+
+
+class TestEnumIndex(unittest.TestCase):
+    """enum index test."""
+
+    def test_index(self):
+        assert normalize_enum_value(' Obligate-Anaerobe.') == 'obligate anaerobe'
+        index = EnumIndex.build('seq', ['454 GS', '454 GS FLX', '454 GS FLX+', 'Illumina HiSeq 2500',
+                                        'Illumina HiSeq 4000', 'Ion Torrent PGM'])
+        assert len(index) == 6
+        assert '454 GS FLX+' in index
+        assert '454 gs flx+' not in index
+        assert ['a'] not in index
+        assert index.normalized_match('ion_torrent  pgm') == 'Ion Torrent PGM'
+        # '454 GS FLX' and '454 GS FLX+' normalize alike, so neither is picked
+        assert index.normalized_match('454 gs flx') is None
+        assert index.normalized_match(5) is None
+        assert index.suggest('Illumina HiSeq 2000') == ['Illumina HiSeq 2500', 'Illumina HiSeq 4000']
+        assert index.suggest('Ion Torent') == ['Ion Torrent PGM']
+        assert index.suggest('nothing like it') == []
+        assert index.suggest(2500) == []
+
+    def test_schema_indexes(self):
+        schema = SampleSchema()
+        index = schema.get_enum_index('rel_to_oxygen_enum')
+        assert 'obligate anaerobe' in index
+        assert schema.get_enum_index('rel_to_oxygen_enum') is index
+        assert schema.get_enum_index('no_such_enum') is None
+        # not shipped to worker processes
+        assert pickle.loads(pickle.dumps(schema)).enum_indexes is None
+
+    def test_annotate(self):
+        annotator = SampleAnnotator()
+        report = annotator.annotate({'id': 'TEST:1', 'rel_to_oxygen': 'Obligate-Anaerobe'})
+        assert report.output['rel_to_oxygen'] == 'obligate anaerobe'
+        m = [m for m in report.messages if m.category == Category.ControlledVocabulary]
+        assert [x.description for x in m] == ['Enum value repaired: Obligate-Anaerobe => obligate anaerobe']
+        assert m[0].was_repaired
+        report = annotator.annotate({'id': 'TEST:1', 'rel_to_oxygen': 'aerobic'})
+        assert report.output['rel_to_oxygen'] == 'aerobic'
+        m = [m for m in report.messages if m.category == Category.ControlledVocabulary]
+        assert [x.description for x in m] == ['Value aerobic is not in enum rel_to_oxygen_enum; '
+                                              'closest: aerobe, anaerobe']
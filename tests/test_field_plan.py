@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from sample_annotator import SampleAnnotator
+
+"""Test field plans."""
+
+import unittest
+
+
+class TestFieldPlan(unittest.TestCase):
+    """field plan test."""
+
+    def test_field_plans(self):
+        annotator = SampleAnnotator()
+        plan = annotator.get_field_plan('total particulate carbon')
+        assert plan.needs_underscoring
+        assert plan.is_alias
+        assert plan.slot_name == 'tot_part_carb'
+        plan = annotator.get_field_plan('tot_part_carb')
+        assert not plan.is_alias
+        assert plan.is_measurement
+        assert not plan.is_enum
+        plan = annotator.get_field_plan('rel_to_oxygen')
+        assert plan.is_enum
+        assert 'obligate anaerobe' in plan.permissible_values
+        assert 'obligate anaerobe' in plan.as_dict()['permissible_values']
+        assert annotator.get_field_plan('no_such_field').is_unknown
+        # plans are compiled once per key and reused
+        assert annotator.get_field_plan('rel_to_oxygen') is plan
+        annotator.annotate({'id': 'TEST:1', 'rel_to_oxygen': 'aerobe', 'depth': '1 m'})
+        assert 'depth' in annotator.field_plans
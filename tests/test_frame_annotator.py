@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+
+from sample_annotator import SampleAnnotator
+from sample_annotator.benchmarks.synthetic import SyntheticSampleGenerator
+from sample_annotator.frame_annotator import frame_records
+from sample_annotator.report_model import AnnotationMultiSampleReport
+
+"""Test annotating data frames."""
+
+import unittest
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+def make_frame(n: int) -> pd.DataFrame:
+    generator = SyntheticSampleGenerator(seed=11, alias_rate=0.5, null_rate=0.3, enum_rate=0.5)
+    rows = []
+    for i, sample in enumerate(generator.iter_samples(n)):
+        if i % 3 == 0:
+            sample['Sample Depth'] = '2 m'
+        if i % 4 == 0:
+            sample['total particulate carbon'] = '5 mg'
+        if i % 8 == 0:
+            # collides with the alias above
+            sample['tot_part_carb'] = '6 mg'
+        if i % 5 == 0:
+            sample['depth'] = ' '
+        rows.append(sample)
+    return pd.DataFrame(rows)
+
+
+class TestFrameAnnotator(unittest.TestCase):
+    """frame annotator test."""
+
+    def setUp(self):
+        self.annotator = SampleAnnotator()
+        self.annotator.select_stages(skip=['remote'])
+
+    def assert_same(self, expected: AnnotationMultiSampleReport, amsr: AnnotationMultiSampleReport):
+        assert len(amsr.reports) == len(expected.reports)
+        for report, expected_report in zip(amsr.reports, expected.reports):
+            assert report.input == expected_report.input
+            # key order too
+            assert list(report.output.items()) == list(expected_report.output.items())
+            assert report.messages == expected_report.messages
+        assert amsr.as_dataframe().equals(expected.as_dataframe())
+
+    def test_same_as_annotate_all(self):
+        df = make_frame(200)
+        expected = self.annotator.annotate_all(frame_records(df))
+        amsr = self.annotator.annotate_frame(df)
+        self.assert_same(expected, amsr)
+        # each tidy stage is timed a column at a time, plus once per row tidied on its own
+        for stage in ['tidy_nulls', 'tidy_keys', 'tidy_enumerations', 'tidy_measurements']:
+            assert 1 <= len(amsr.timings.durations[stage]) < len(df)
+        assert len(amsr.timings.durations['validate_identifier']) == len(df)
+        descriptions = {m.description for r in amsr.reports for m in r.messages}
+        assert 'Key not underscored: Sample Depth' in descriptions
+        assert 'Alias used: total_particulate_carbon => tot_part_carb' in descriptions
+
+    def test_records(self):
+        df = pd.DataFrame({'id': ['TEST:1', 'TEST:2'], 'depth': ['1 m', None], 'temp': [5.0, float('nan')]})
+        assert frame_records(df) == [{'id': 'TEST:1', 'depth': '1 m', 'temp': 5.0},
+                                     {'id': 'TEST:2', 'depth': None, 'temp': None}]
+
+    def test_row_wise(self):
+        # without all the tidy stages, there is nothing to do a column at a time
+        df = make_frame(20)
+        for skip in [['tidy_measurements'], ['tidy_enumerations', 'tidy_measurements']]:
+            self.annotator.select_stages(skip=skip + ['remote', 'model'])
+            amsr = self.annotator.annotate_frame(df)
+            self.assert_same(self.annotator.annotate_all(frame_records(df)), amsr)
+            assert len(amsr.timings.durations['tidy_keys']) == len(df)
+
+    @unittest.skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_arrow(self):
+        df = make_frame(50)
+        # Arrow columns have a single type
+        df = df.astype(str).where(df.notna(), None)
+        table = pyarrow.Table.from_pandas(df, preserve_index=False)
+        self.assert_same(self.annotator.annotate_all(table.to_pylist()), self.annotator.annotate_frame(table))
+
+    @unittest.skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_arrow_nan(self):
+        table = pyarrow.table({'id': ['X:1', 'X:2'], 'depth': [float('nan'), None], 'score': [float('nan'), 2.0]})
+        assert frame_records(table) == [{'id': 'X:1', 'depth': None, 'score': None},
+                                        {'id': 'X:2', 'depth': None, 'score': 2.0}]
+        amsr = self.annotator.annotate_frame(table)
+        self.assert_same(self.annotator.annotate_all(frame_records(table)), amsr)
+        # the same as the DataFrame, where NaN is missing
+        self.assert_same(self.annotator.annotate_frame(table.to_pandas()), amsr)
+        assert 'depth' not in amsr.reports[0].output
+        assert 'score' not in amsr.reports[0].output
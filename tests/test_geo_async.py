@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from click.testing import CliRunner
+from unittest import mock
+
+from sample_annotator import SampleAnnotator, GeoEngine
+from sample_annotator.sample_annotator import cli
+
+"""Test concurrent geolocation lookups against a local stand-in for the ORNL WMS."""
+
+import unittest
+
+ELEVATION_XML = '<r><a/><b/><c/><v>{}</v></r>'
+SOIL_XML = '<r><a/><b/><c/><d/><e/><v>value: CALCIC CAMBISOL</v></r>'
+
+
+def ascii_grid(params) -> str:
+    """
+    A coverage whose value at (row, col) is 1000 * row + col
+    """
+    minx, miny, maxx, maxy = [float(x) for x in params['BBOX'][0].split(',')]
+    width = int(params['WIDTH'][0])
+    height = int(params['HEIGHT'][0])
+    lines = [f'ncols {width}', f'nrows {height}', f'xllcorner {minx}', f'yllcorner {miny}',
+             f'cellsize {(maxx - minx) / width}', 'NODATA_value -9999']
+    lines.extend(' '.join(str(1000 * row + col) for col in range(width)) for row in range(height))
+    return '\n'.join(lines)
+
+
+class StandInWMS(BaseHTTPRequestHandler):
+    """
+    Answers GetFeatureInfo requests like the ORNL services, slowly
+    """
+    requests = []
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = StandInWMS
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        cls.requests.append(params)
+        time.sleep(0.05)
+        if url.path == '/fail':
+            body = None
+            self.send_response(500)
+        elif url.path == '/garbled':
+            body = 'Service unavailable'
+            self.send_response(200)
+        elif url.path == '/short':
+            body = '<r><a/></r>'
+            self.send_response(200)
+        elif url.path == '/wcs':
+            body = ascii_grid(params)
+            self.send_response(200)
+        elif params['LAYERS'][0] == '10003_1':
+            miny = float(params['BBOX'][0].split(',')[1])
+            body = ELEVATION_XML.format(int(miny))
+            self.send_response(200)
+        else:
+            body = SOIL_XML
+            self.send_response(200)
+        self.end_headers()
+        if body:
+            self.wfile.write(body.encode('utf-8'))
+        with cls.lock:
+            cls.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestGeoAsync(unittest.TestCase):
+    """concurrent geo lookup test."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInWMS)
+        cls.url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        StandInWMS.requests = []
+        StandInWMS.max_in_flight = 0
+
+    def make_engine(self, **kwargs) -> GeoEngine:
+        urls = {'elevation_url': self.url + '/wms', 'soil_url': self.url + '/mapserv',
+                'coverage_url': self.url + '/wcs'}
+        urls.update(kwargs)
+        return GeoEngine(**urls)
+
+    def test_prefetch(self):
+        ge = self.make_engine(concurrency=4)
+        latlons = [(lat + 0.5, 10.0) for lat in range(20)] * 3
+        ge.prefetch(latlons)
+        # one request per distinct elevation cell and soil cell
+        assert len(StandInWMS.requests) == 40
+        assert 1 < StandInWMS.max_in_flight <= 4
+        assert ge.get_elevation((5.5, 10.0)) == '5'
+        assert ge.get_fao_soil_type((5.5, 10.0)) == 'Cambisols'
+        assert len(StandInWMS.requests) == 40
+
+    def test_failures_are_not_cached(self):
+        ge = self.make_engine(elevation_url=self.url + '/fail')
+        ge.prefetch([(1.0, 1.0)])
+        assert ge.get_elevation((1.0, 1.0)) == 'failed'
+        assert ge.get_fao_soil_type((1.0, 1.0)) == 'Cambisols'
+
+    def test_bad_responses(self):
+        # a response that is not the expected XML fails its cell, not the whole batch
+        ge = self.make_engine(elevation_url=self.url + '/garbled', soil_url=self.url + '/short')
+        ge.prefetch([(1.0, 1.0), (5.0, 5.0)])
+        assert len(StandInWMS.requests) == 4
+        assert ge.get_cache().stats()['size'] == 0
+        ge = self.make_engine(elevation_url=self.url + '/garbled')
+        ge.prefetch([(1.0, 1.0)])
+        assert ge.get_fao_soil_type((1.0, 1.0)) == 'Cambisols'
+        assert len(StandInWMS.requests) == 6
+
+    def test_annotate_all(self):
+        annotator = SampleAnnotator(geoengine=self.make_engine(concurrency=8))
+        samples = [{'id': f'TEST:{i}', 'lat_lon': f'{i % 10}.5 20.5'} for i in range(30)]
+        amsr = annotator.annotate_all(samples)
+        assert len(StandInWMS.requests) == 20
+        assert StandInWMS.max_in_flight > 1
+        for i, r in enumerate(amsr.reports):
+            assert r.output['elev']['has_numeric_value'] == str(i % 10)
+
+    def test_tile_mode(self):
+        ge = self.make_engine(tile_size=1.0)
+        # 100 distinct elevation cells in two 1 degree tiles
+        latlons = [(10.0 + i / 100 + 0.001, 20.0 + j / 100 + 0.001) for i in range(5) for j in range(10)]
+        latlons += [(lat, lon + 1) for lat, lon in latlons]
+        ge.prefetch(latlons)
+        wcs_requests = [r for r in StandInWMS.requests if r.get('REQUEST') == ['GetCoverage']]
+        assert len(wcs_requests) == 2
+        assert wcs_requests[0]['WIDTH'] == ['120']
+        # plus one per point request for each of the two soil cells
+        assert len(StandInWMS.requests) == 4
+        # 10.051N is in row 113 counting from the north edge of the tile; 20.011E is column 1
+        assert ge.get_elevation((10.051, 20.011)) == '113001'
+        assert ge.get_elevation((10.051, 21.011)) == '113001'
+        # a point in a cached tile but an unseen cell is read from the tile
+        assert ge.get_elevation((10.9, 20.905)) == '11108'
+        assert len(StandInWMS.requests) == 4
+        # a point in a new tile fetches that tile
+        assert ge.get_elevation((30.505, 30.505)) == '59060'
+        assert len(StandInWMS.requests) == 5
+
+    def test_cli(self):
+        # annotate-sample streams samples; each block is prefetched with concurrent requests
+        # the CLI makes its own engine, so its lookups are sent to one pointed at the stand-in
+        ge = self.make_engine()
+        fetch_elevation = GeoEngine.fetch_elevation
+        fetch_fao_soil_type = GeoEngine.fetch_fao_soil_type
+        with mock.patch.object(GeoEngine, 'fetch_elevation', lambda self, latlon: fetch_elevation(ge, latlon)), \
+                mock.patch.object(GeoEngine, 'fetch_fao_soil_type',
+                                  lambda self, latlon: fetch_fao_soil_type(ge, latlon)), \
+                tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'samples.jsonl')
+            with open(path, 'w') as stream:
+                for i in range(30):
+                    stream.write(json.dumps({'id': f'TEST:{i}', 'lat_lon': f'{i % 10}.5 20.5'}) + '\n')
+            output = os.path.join(tmp, 'out.jsonl')
+            result = CliRunner().invoke(cli, ['--geo-concurrency', '4', '--skip-stages', 'model',
+                                              '-R', os.path.join(tmp, 'report.tsv'), '-s', output, path])
+            assert result.exit_code == 0, result.output
+            with open(output) as stream:
+                samples = [json.loads(line) for line in stream]
+        # one request per distinct elevation cell and soil cell, several at a time
+        assert len(StandInWMS.requests) == 20
+        assert 1 < StandInWMS.max_in_flight <= 4
+        assert [s['elev']['has_numeric_value'] for s in samples] == [str(i % 10) for i in range(30)]
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import tempfile
+
+from sample_annotator import SampleAnnotator, GeoEngine
+
+"""Test caching of geolocation lookups."""
+
+import unittest
+
+
+class CountingGeoEngine(GeoEngine):
+    """
+    GeoEngine with the remote calls replaced by local stand-ins
+    """
+    num_calls: int = 0
+
+    def fetch_elevation(self, latlon):
+        self.num_calls += 1
+        return str(int(latlon[0]))
+
+    def fetch_fao_soil_type(self, latlon):
+        self.num_calls += 1
+        return 'Cambisols'
+
+
+class TestGeoCache(unittest.TestCase):
+    """geo cache test."""
+
+    def test_grid_cell_cache(self):
+        ge = CountingGeoEngine()
+        assert ge.get_elevation((27.9881, 86.9250)) == '27'
+        assert ge.get_elevation((27.9882, 86.9251)) == '27'
+        assert ge.get_fao_soil_type((27.9, 86.9)) == 'Cambisols'
+        assert ge.get_fao_soil_type((27.8, 86.8)) == 'Cambisols'
+        assert ge.num_calls == 2
+        assert ge.cache_stats()['hits'] == 2
+        assert ge.cache_stats()['misses'] == 2
+
+    def test_prefetch_dedup(self):
+        ge = CountingGeoEngine()
+        points = [(27.9881, 86.9250), (27.9882, 86.9251), (10.0, 10.0)] * 10
+        ge.prefetch(points)
+        # 2 elevation cells and 2 soil cells
+        assert ge.num_calls == 4
+        for p in points:
+            ge.get_elevation(p)
+            ge.get_fao_soil_type(p)
+        assert ge.num_calls == 4
+
+    def test_persistent(self):
+        with tempfile.TemporaryDirectory() as d:
+            ge = CountingGeoEngine(cache_dir=d)
+            ge.get_elevation((1.0, 2.0))
+            ge2 = CountingGeoEngine(cache_dir=d)
+            assert ge2.get_elevation((1.0, 2.0)) == '1'
+            assert ge2.num_calls == 0
+            assert ge2.cache_stats()['hits'] == 1
+
+    def test_annotate_with_geo(self):
+        annotator = SampleAnnotator(geoengine=CountingGeoEngine())
+        samples = [{'id': f'TEST:{i}', 'lat_lon': '68.3534 19.0472'} for i in range(5)]
+        amsr = annotator.annotate_all(samples)
+        assert annotator.geoengine.num_calls == 2
+        for r in amsr.reports:
+            assert r.output['elev'] == {'has_unit': 'meter', 'has_numeric_value': '68'}
+            assert 'Soil type is Cambisols' in [m.description for m in r.messages]
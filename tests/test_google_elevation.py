@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import googlemaps
+
+from sample_annotator import GeoEngine, SampleAnnotator
+from sample_annotator.geolocation.google_elevation import GoogleElevation
+
+"""Test the batched Google Maps elevation backend with a fake client."""
+
+import unittest
+
+
+class FakeClient:
+    """
+    Stands in for googlemaps.Client; the elevation of a point is its latitude times 100
+    """
+    def __init__(self):
+        self.calls = []
+
+    def elevation(self, locations):
+        self.calls.append((time.monotonic(), list(locations)))
+        return [{'elevation': lat * 100, 'location': {'lat': lat, 'lng': lon}, 'resolution': 10.0}
+                for lat, lon in locations]
+
+
+class FailingClient(FakeClient):
+    """
+    A client whose first request fails
+    """
+    def elevation(self, locations):
+        if not self.calls:
+            self.calls.append((time.monotonic(), list(locations)))
+            raise googlemaps.exceptions.ApiError('OVER_QUERY_LIMIT')
+        return super().elevation(locations)
+
+
+class TestGoogleElevation(unittest.TestCase):
+    """google elevation test."""
+
+    def test_batches(self):
+        client = FakeClient()
+        ge = GoogleElevation(client, max_locations=4, queries_per_second=0)
+        latlons = [(float(i), 1.0) for i in range(10)] * 2
+        assert ge.get_elevations(latlons) == [str(i * 100) for i in range(10)] * 2
+        # duplicates are only sent once, and at most 4 points go in each request
+        assert [len(locations) for _, locations in client.calls] == [4, 4, 2]
+        assert ge.requests_made == 3
+        assert ge.get_elevation((1.5, 2.0)) == '150'
+
+    def test_qps(self):
+        client = FakeClient()
+        ge = GoogleElevation(client, max_locations=1, queries_per_second=20)
+        ge.lookup([(1.0, 1.0), (2.0, 2.0), (3.0, 3.0)])
+        times = [t for t, _ in client.calls]
+        assert times[1] - times[0] >= 0.045
+        assert times[2] - times[1] >= 0.045
+
+    def test_qps_threads(self):
+        # threads sharing the backend share its rate limit
+        client = FakeClient()
+        ge = GoogleElevation(client, max_locations=1, queries_per_second=20)
+        threads = [threading.Thread(target=ge.lookup, args=([(float(i), 1.0)],)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        times = sorted(t for t, _ in client.calls)
+        assert ge.requests_made == 4
+        assert all(b - a >= 0.045 for a, b in zip(times, times[1:]))
+
+    def test_failure(self):
+        # a failed lookup is logged and not cached, so the point is retried
+        geoengine = GeoEngine(google_elevation=GoogleElevation(FailingClient(), queries_per_second=0))
+        assert geoengine.get_elevation((1.0, 1.0)) is None
+        assert geoengine.get_elevation((1.0, 1.0)) == '100'
+
+    def test_annotate_all(self):
+        client = FakeClient()
+        geoengine = GeoEngine(google_elevation=GoogleElevation(client, queries_per_second=0))
+        # keep soil type lookups offline
+        geoengine.get_fao_soil_type = lambda latlon: None
+        geoengine.fetch_fao_soil_type = lambda latlon: None
+        annotator = SampleAnnotator(geoengine=geoengine)
+        samples = [{'id': f'TEST:{i}', 'lat_lon': f'{i % 5}.5 20.5'} for i in range(30)]
+        amsr = annotator.annotate_all(samples)
+        # the whole batch is prefetched in one request
+        assert len(client.calls) == 1
+        assert len(client.calls[0][1]) == 5
+        for i, r in enumerate(amsr.reports):
+            assert r.output['elev']['has_numeric_value'] == str((i % 5) * 100 + 50)
+
+    def test_annotate_iter(self):
+        # the streaming path used by annotate-sample batches each block too
+        client = FakeClient()
+        google_elevation = GoogleElevation(client, queries_per_second=0)
+        geoengine = GeoEngine(google_elevation=google_elevation)
+        geoengine.get_fao_soil_type = lambda latlon: None
+        geoengine.fetch_fao_soil_type = lambda latlon: None
+        annotator = SampleAnnotator(geoengine=geoengine)
+        samples = [{'id': f'TEST:{i}', 'lat_lon': f'{i}.5 20.5'} for i in range(30)]
+        reports = list(annotator.annotate_iter(iter(samples), chunk_size=10))
+        # one request per block of 10 distinct points
+        assert google_elevation.requests_made == 3
+        assert [len(locations) for _, locations in client.calls] == [10, 10, 10]
+        for i, r in enumerate(reports):
+            assert r.output['elev']['has_numeric_value'] == str(i * 100 + 50)
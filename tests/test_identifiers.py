@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from sample_annotator.identifiers.identifiers import IdentifierEngine
+from sample_annotator.report_model import AnnotationReport
+
+"""Test identifier validation."""
+
+import unittest
+
+
+class TestIdentifiers(unittest.TestCase):
+    """identifier test."""
+
+    def test_validate(self):
+        ie = IdentifierEngine()
+        report = AnnotationReport(messages=[])
+        assert ie.validate('GOLD:Gb0108335', report) == 'gold:Gb0108335'
+        assert [m.description for m in report.messages] == ['Normalizing prefix GOLD => gold']
+        report = AnnotationReport(messages=[])
+        ie.validate('gold:0108335', report)
+        assert [m.description for m in report.messages] == ['ID gold:0108335 does not match ^[A-Z][a-z][0-9]+$']
+        report = AnnotationReport(messages=[])
+        ie.validate('TEST:1:2', report)
+        assert len(report.messages) == 2
+        report = AnnotationReport(messages=[])
+        ie.validate('abc', report)
+        assert report.messages[0].description == 'ID is not a CURIE'
+        assert 'GOLD' in ie.normalized_prefixes
+        assert 'gold' in ie.patterns
+
+    def test_validate_all(self):
+        ie = IdentifierEngine()
+        ids = ['gold:Gb0108335', 'GOLD:Gb0108336', 'biosample:SAMN00000001', 'biosample:xyz',
+               'nosuchprefix:1', 'a:b:c', 'abc']
+        batch = ie.validate_all(ids)
+        assert batch.normalized_ids()[1] == 'gold:Gb0108336'
+        assert batch.non_curies == 1
+        stats = batch.prefix_stats
+        assert stats['gold'].count == 1
+        assert stats['GOLD'].renormalized == 1
+        assert stats['biosample'].count == 2
+        assert stats['biosample'].valid == 1
+        assert stats['biosample'].pattern_mismatches == 1
+        assert stats['nosuchprefix'].normalized_prefix is None
+        assert stats['nosuchprefix'].valid == 0
+        assert stats['a'].syntax_errors == 1
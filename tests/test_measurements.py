@@ -2,7 +2,9 @@
 import os
 from tests import MODEL_DIR, INPUT_DIR, OUTPUT_DIR
 
-from sample_annotator.measurements.measurements import MeasurementEngine
+from quantulum3 import parser as q_parser
+
+from sample_annotator.measurements.measurements import MeasurementEngine, FAST_UNITS
 from sample_annotator.report_model import AnnotationReport
 
 """Test the module can be imported."""
@@ -18,5 +20,24 @@ class TestMeasurements(unittest.TestCase):
         m = MeasurementEngine()
         qv = m.repair('2cm', report=report)
         print(qv)
+        assert qv == {'has_unit': 'centimetre', 'has_numeric_value': 2.0, 'has_raw_value': '2cm'}
+        assert m.fast_path_hits == 1
+        m.repair('about two metres or so', report=report)
+        assert m.stats() == {'fast_path_hits': 1, 'fallback_parses': 1}
 
-
+    def test_fast_path_matches_quantulum(self):
+        m = MeasurementEngine()
+        values = ['10', '2.5', '-3', '.5', '0-10', '10 - 20', '1.25-3.33', '0.1 to 0.7', '20-10', '-0']
+        for surface in FAST_UNITS:
+            for fmt in ['{v}{u}', '{v} {u}', ' {v} {u} ']:
+                for v in values:
+                    text = fmt.format(v=v, u=surface)
+                    parsed = m.parse_fast(text)
+                    if parsed is None:
+                        continue
+                    qs = q_parser.parse(text)
+                    assert parsed == (qs[0].value, qs[0].unit.name), text
+        assert m.parse_fast('0-10 cm') == (5.0, 'centimetre')
+        assert m.parse_fast('25 degree Celsius') == (25.0, 'degree Celsius')
+        for text in ['20-10 m', '5 C', '1,000 m', 'two metres', '5 m depth', 5]:
+            assert m.parse_fast(text) is None
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import os
+from tests import INPUT_DIR
+
+from sample_annotator import SampleAnnotator
+
+"""Test parallel annotation."""
+
+import unittest
+import yaml
+import json
+
+TEST_DATA = os.path.join(INPUT_DIR, 'test_sample_info.yaml')
+
+
+def load_samples():
+    with open(TEST_DATA) as stream:
+        test_obj = yaml.safe_load(stream)
+    samples = []
+    for t in test_obj.get('tests'):
+        sample = dict(t.get('sample'))
+        # avoid remote geolocation calls
+        sample.pop('lat_lon', None)
+        samples.append(sample)
+    return samples
+
+
+class TestParallel(unittest.TestCase):
+    """parallel annotation test."""
+
+    def test_parallel_matches_serial(self):
+        annotator = SampleAnnotator()
+        samples = load_samples() * 5
+        serial = annotator.annotate_all(samples)
+        parallel = annotator.annotate_all(samples, workers=2, chunk_size=3)
+        assert len(parallel.reports) == len(samples)
+        assert [r.sample_id for r in parallel.reports] == [r.sample_id for r in serial.reports]
+        assert parallel.as_dataframe().to_csv(sep='\t', index=False) == \
+               serial.as_dataframe().to_csv(sep='\t', index=False)
+        assert json.dumps(parallel.all_outputs(), indent=4, sort_keys=True) == \
+               json.dumps(serial.all_outputs(), indent=4, sort_keys=True)
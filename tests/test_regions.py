@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import tempfile
+from typing import Dict
+
+import numpy as np
+
+from sample_annotator import GeoEngine, SampleAnnotator
+from sample_annotator.geolocation.regions import RegionIndex, insdc_country, points_in_ring
+
+"""Test offline reverse geocoding."""
+
+import unittest
+
+REGIONS = {
+    'type': 'FeatureCollection',
+    'features': [
+        # a 10 degree square with a hole, which is the enclave
+        {'type': 'Feature', 'properties': {'name': 'Squareland'},
+         'geometry': {'type': 'Polygon',
+                      'coordinates': [[[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]],
+                                      [[4, 4], [6, 4], [6, 6], [4, 6], [4, 4]]]}},
+        {'type': 'Feature', 'properties': {'ADMIN': 'Enclave'},
+         'geometry': {'type': 'Polygon',
+                      'coordinates': [[[4, 4], [6, 4], [6, 6], [4, 6]]]}},
+        # two triangles either side of the antimeridian
+        {'type': 'Feature', 'properties': {'name': 'Islands'},
+         'geometry': {'type': 'MultiPolygon',
+                      'coordinates': [[[[170, -20], [180, -20], [180, -10], [170, -20]]],
+                                      [[[-180, -20], [-170, -20], [-180, -10], [-180, -20]]]]}},
+    ]
+}
+
+
+def box(minx: float, miny: float, maxx: float, maxy: float) -> Dict:
+    return {'type': 'Polygon',
+            'coordinates': [[[minx, miny], [maxx, miny], [maxx, maxy], [minx, maxy], [minx, miny]]]}
+
+
+# properties as in Natural Earth admin 0 countries, whose names are not INSDC's
+COUNTRIES = {
+    'type': 'FeatureCollection',
+    'features': [
+        {'type': 'Feature', 'properties': {'ADMIN': 'United States of America', 'ISO_A3': 'USA'},
+         'geometry': box(-100, 30, -90, 40)},
+        {'type': 'Feature', 'properties': {'ADMIN': 'Vietnam', 'ISO_A3': 'VNM'},
+         'geometry': box(105, 15, 107, 20)},
+        {'type': 'Feature', 'properties': {'ADMIN': 'eSwatini', 'ISO_A3': 'SWZ'},
+         'geometry': box(31, -27, 32, -26)},
+        {'type': 'Feature', 'properties': {'ADMIN': 'France', 'ISO_A3': '-99', 'ADM0_A3': 'FRA'},
+         'geometry': box(0, 44, 5, 48)},
+    ]
+}
+
+
+class TestRegions(unittest.TestCase):
+    """reverse geocoding test."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'regions.geojson')
+        with open(self.path, 'w') as stream:
+            json.dump(REGIONS, stream)
+        self.countries_path = os.path.join(self.tmpdir.name, 'countries.geojson')
+        with open(self.countries_path, 'w') as stream:
+            json.dump(COUNTRIES, stream)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_points_in_ring(self):
+        ring = np.array([[0, 0], [2, 0], [1, 2], [0, 0]], dtype=float)
+        xs = np.array([1.0, 0.2, 1.9, 5.0])
+        ys = np.array([1.0, 1.5, 0.1, 1.0])
+        assert points_in_ring(xs, ys, ring).tolist() == [True, False, True, False]
+        # the same answer when edges are tested one at a time
+        assert points_in_ring(xs, ys, ring, block_size=1).tolist() == [True, False, True, False]
+
+    def test_lookup(self):
+        index = RegionIndex.load(self.path)
+        assert index.names == ['Squareland', 'Enclave', 'Islands']
+        latlons = [(1.0, 1.0), (5.0, 5.0), (9.5, 2.0), (-15.0, 175.0), (-15.0, -178.0),
+                   (-11.0, 171.0), (20.0, 20.0), (1.0, 1.0)]
+        assert index.lookup(latlons) == ['Squareland', 'Enclave', 'Squareland', 'Islands', 'Islands',
+                                         None, None, 'Squareland']
+        assert index.lookup([]) == []
+        assert index.get_region((5.0, 5.0)) == 'Enclave'
+
+    def test_annotate(self):
+        geoengine = GeoEngine(regions=RegionIndex.load(self.path))
+        # keep the other geo lookups offline
+        geoengine.fetch_elevation = lambda latlon: None
+        geoengine.fetch_fao_soil_type = lambda latlon: None
+        annotator = SampleAnnotator(geoengine=geoengine)
+        samples = [{'id': 'TEST:1', 'lat_lon': '1.0 1.0', 'geo_loc_name': 'Squareland: North'},
+                   {'id': 'TEST:2', 'lat_lon': '1.0 1.0', 'geo_loc_name': 'Enclave: Center'},
+                   {'id': 'TEST:3', 'lat_lon': '5.0 5.0'},
+                   {'id': 'TEST:4', 'lat_lon': '20.0 20.0', 'geo_loc_name': 'Nowhere'}]
+        amsr = annotator.annotate_all(samples)
+        geo_messages = [[m.description for m in r.messages if m.category.value == 'geo'] for r in amsr.reports]
+        assert geo_messages[0] == []
+        assert geo_messages[1] == ['geo_loc_name Enclave: Center does not match lat_lon, which is in Squareland']
+        assert geo_messages[2] == ['Filling in missing value for geo_loc_name Enclave']
+        assert amsr.reports[2].output['geo_loc_name'] == 'Enclave'
+        assert geo_messages[3] == []
+
+    def test_insdc_names(self):
+        index = RegionIndex.load(self.countries_path)
+        assert index.names == ['USA', 'Viet Nam', 'Eswatini', 'France']
+        assert insdc_country('Swaziland') == 'Eswatini'
+        assert insdc_country('viet nam') == 'Viet Nam'
+        assert insdc_country('Atlantis') == 'Atlantis'
+        geoengine = GeoEngine(regions=index)
+        geoengine.fetch_elevation = lambda latlon: None
+        geoengine.fetch_fao_soil_type = lambda latlon: None
+        annotator = SampleAnnotator(geoengine=geoengine)
+        samples = [{'id': 'TEST:1', 'lat_lon': '35.0 -95.0', 'geo_loc_name': 'USA: Oklahoma'},
+                   {'id': 'TEST:2', 'lat_lon': '17.0 106.0', 'geo_loc_name': 'Viet Nam: Quang Binh'},
+                   {'id': 'TEST:3', 'lat_lon': '-26.5 31.5', 'geo_loc_name': 'Swaziland: Hhohho'},
+                   {'id': 'TEST:4', 'lat_lon': '46.0 2.0', 'geo_loc_name': 'france'},
+                   {'id': 'TEST:5', 'lat_lon': '17.0 106.0'},
+                   {'id': 'TEST:6', 'lat_lon': '35.0 -95.0', 'geo_loc_name': 'Viet Nam: Hanoi'}]
+        amsr = annotator.annotate_all(samples)
+        geo_messages = [[m.description for m in r.messages if m.category.value == 'geo'] for r in amsr.reports]
+        assert geo_messages[:4] == [[], [], [], []]
+        assert geo_messages[4] == ['Filling in missing value for geo_loc_name Viet Nam']
+        assert amsr.reports[4].output['geo_loc_name'] == 'Viet Nam'
+        assert geo_messages[5] == ['geo_loc_name Viet Nam: Hanoi does not match lat_lon, which is in USA']
+
+    def test_cache_per_source(self):
+        # a persistent cache shared by engines with different regions keeps their lookups apart
+        cache_dir = os.path.join(self.tmpdir.name, 'geo-cache')
+        squares = GeoEngine(regions=RegionIndex.load(self.path), cache_dir=cache_dir)
+        assert squares.get_region((1.0, 1.0)) == 'Squareland'
+        countries = GeoEngine(regions=RegionIndex.load(self.countries_path), cache_dir=cache_dir)
+        assert countries.get_region((1.0, 1.0)) is None
+        countries.prefetch_regions([(5.0, 5.0), (46.0, 2.0)])
+        assert countries.get_region((5.0, 5.0)) is None
+        assert countries.get_region((46.0, 2.0)) == 'France'
+        assert squares.get_region((5.0, 5.0)) == 'Enclave'
+        assert squares.region_layer() != countries.region_layer()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+
+from sample_annotator import SampleAnnotator
+from sample_annotator.sample_io import ReportArrowWriter, PARQUET_FORMAT, ARROW_FORMAT, guess_report_format
+from tests.test_parallel import load_samples
+
+"""Test columnar report export."""
+
+import unittest
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class TestReportExport(unittest.TestCase):
+    """columnar report test."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.amsr = SampleAnnotator().annotate_all(load_samples() * 4)
+
+    def test_categorical(self):
+        df = self.amsr.as_dataframe()
+        cat = self.amsr.as_dataframe(categorical=True)
+        assert len(cat) == len(df) > 0
+        assert str(cat['category'].dtype) == 'category'
+        assert cat['category'].tolist() == [c.value for c in df['category']]
+        assert cat['description'].tolist() == df['description'].tolist()
+        assert cat['severity'].tolist() == df['severity'].tolist()
+        assert cat['was_repaired'].fillna(False).astype(bool).tolist() == [v is True for v in df['was_repaired']]
+        assert guess_report_format('r.parquet') == PARQUET_FORMAT
+        assert guess_report_format('r.tsv') == 'tsv'
+
+    @unittest.skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_write(self):
+        expected = self.amsr.as_dataframe(categorical=True)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for fmt in [PARQUET_FORMAT, ARROW_FORMAT]:
+                path = os.path.join(tmpdir, 'report.' + fmt)
+                # several batches, each with its own dictionaries
+                with ReportArrowWriter(path, fmt, batch_size=7) as writer:
+                    for r in self.amsr.reports:
+                        writer.write(r)
+                if fmt == PARQUET_FORMAT:
+                    table = pyarrow.parquet.read_table(path)
+                else:
+                    table = pyarrow.ipc.open_stream(path).read_all()
+                df = table.to_pandas()
+                assert len(df) == len(expected)
+                for col in ['sample_id', 'description', 'severity', 'field', 'category']:
+                    assert df[col].astype(object).where(df[col].notna(), None).tolist() == \
+                           expected[col].astype(object).where(expected[col].notna(), None).tolist()
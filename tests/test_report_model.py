@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import pickle
+
+from sample_annotator.report_model import AnnotationReport, Message, Category
+
+"""Test the compact message store."""
+
+import unittest
+
+
+class TestReportModel(unittest.TestCase):
+    """report model test."""
+
+    def test_message(self):
+        m = Message('Alias used: {} => {}', params=('a b', 'a_b'), was_repaired=True)
+        assert m.description == 'Alias used: a b => a_b'
+        assert m.category == Category.Unclassified
+        assert not hasattr(m, '__dict__')
+        assert m.as_dict() == {'description': 'Alias used: a b => a_b', 'severity': 1, 'was_repaired': True,
+                               'category': Category.Unclassified, 'field': None}
+        assert m == Message('Alias used: a b => a_b', was_repaired=True)
+        # parameters are formatted exactly as an f-string would
+        keys = {'x': 1}.keys()
+        assert Message('Value {} is not in enum: {}', params=(1.5, keys)).description == \
+               f'Value {1.5} is not in enum: {keys}'
+        assert Message('Parsed {}', params=((1, 2),)).description == 'Parsed (1, 2)'
+        # templates without parameters are not formatted
+        assert Message('Value {v}').description == 'Value {v}'
+        assert pickle.loads(pickle.dumps(m)) == m
+
+    def test_report(self):
+        report = AnnotationReport()
+        assert report.max_severity() == 0
+        assert report.passes()
+        report.add_message('Soil type is {}', params=('Cambisols',), severity=0)
+        assert report.passes()
+        mbc = report.messages_by_category()
+        assert [m.description for m in mbc['unclassified']] == ['Soil type is Cambisols']
+        report.add_message('Invalid field: {}', params=('foo',), severity=2, category=Category.UnknownField)
+        report.add_message('No checklist specified')
+        assert report.max_severity() == 2
+        assert not report.passes()
+        # kept up to date after the first call
+        assert len(mbc['unclassified']) == 2
+        assert len(report.messages_by_category()['unknown-field']) == 1
+        assert report.severities.tolist() == [0, 2, 1]
+
+    def test_direct_assignment(self):
+        report = AnnotationReport(messages=[Message('a', severity=3, category=Category.Geo)])
+        assert report.max_severity() == 3
+        report.messages = [Message('b', severity=0)]
+        assert report.passes()
+        report.add_message('c', category=Category.Geo)
+        assert list(report.messages_by_category()) == ['unclassified', 'geo']
+        assert pickle.loads(pickle.dumps(report)).max_severity() == 1
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import os
+import tempfile
+
+from click.testing import CliRunner
+
+from sample_annotator import SampleAnnotator
+from sample_annotator.sample_annotator import cli
+from sample_annotator.sample_io import iter_json_array, iter_jsonl, write_samples, sample_writer, ReportTSVWriter, \
+    JSONL_FORMAT
+from tests.test_parallel import load_samples
+
+"""Test streaming sample input/output."""
+
+import unittest
+
+
+class TestSampleIO(unittest.TestCase):
+    """streaming io test."""
+
+    def test_read(self):
+        samples = [{'id': 'x:1', 'depth': 1.5e10, 'tags': ['a', ']', '{"']}, {}, {'n': 12345678}]
+        text = json.dumps(samples, indent=2)
+        for block_size in [1, 3, 7, 1 << 16]:
+            assert list(iter_json_array(io.StringIO(text), block_size=block_size)) == samples
+        assert list(iter_json_array(io.StringIO(' [ ] '))) == []
+        lines = '\n'.join(json.dumps(s) for s in samples) + '\n\n'
+        assert list(iter_jsonl(io.StringIO(lines))) == samples
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.StringIO('{"id": "x:1"}')))
+        # separators are checked as strictly as json.load does
+        for bad in ['[{} {}]', '[{},]', '[,{}]', '[{},,{}]', '[{}', '[{},', '[{}}']:
+            for block_size in [1, 1 << 16]:
+                with self.assertRaises(ValueError):
+                    list(iter_json_array(io.StringIO(bad), block_size=block_size))
+
+    def test_cli(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'samples.json')
+            with open(path, 'w') as stream:
+                json.dump([{'id': 'TEST:1', 'depth': '1 m'}], stream)
+            report = os.path.join(tmp, 'report.tsv')
+            result = CliRunner().invoke(cli, ['--stages', 'fast', '-R', report, path])
+            assert result.exit_code == 0, result.output
+            assert result.output == 'Done\n'
+            # with -s, only the output file is written
+            output = os.path.join(tmp, 'out.json')
+            result = CliRunner().invoke(cli, ['--stages', 'fast', '-R', report, '-s', output, path])
+            assert result.exit_code == 0, result.output
+            assert result.output == ''
+            with open(output) as stream:
+                assert json.load(stream)[0]['id'] == 'TEST:1'
+
+    def test_write(self):
+        annotator = SampleAnnotator()
+        samples = load_samples()
+        amsr = annotator.annotate_all(samples)
+        for outputs in [amsr.all_outputs(), []]:
+            stream = io.StringIO()
+            write_samples(iter(outputs), stream)
+            assert stream.getvalue() == json.dumps(outputs, indent=4, sort_keys=True)
+        stream = io.StringIO()
+        write_samples(amsr.all_outputs(), stream, JSONL_FORMAT)
+        assert list(iter_jsonl(io.StringIO(stream.getvalue()))) == amsr.all_outputs()
+        stream = io.StringIO()
+        writer = ReportTSVWriter(stream)
+        for report in annotator.annotate_iter(samples):
+            writer.write(report)
+        assert stream.getvalue() == amsr.as_dataframe().to_csv(sep='\t', index=False)
+
+    def test_block_writers(self):
+        annotator = SampleAnnotator()
+        amsr = annotator.annotate_all(load_samples())
+        outputs = amsr.all_outputs()
+        expected_tsv = amsr.as_dataframe().to_csv(sep='\t', index=False)
+        for block_size in [1, 100, 1 << 20]:
+            for background in [False, True]:
+                stream = io.StringIO()
+                with sample_writer(stream, block_size=block_size, background=background) as writer:
+                    for output in outputs:
+                        writer.write(output)
+                assert stream.getvalue() == json.dumps(outputs, indent=4, sort_keys=True)
+                stream = io.StringIO()
+                with sample_writer(stream, JSONL_FORMAT, block_size=block_size, background=background) as writer:
+                    for output in outputs:
+                        writer.write(output)
+                assert list(iter_jsonl(io.StringIO(stream.getvalue()))) == outputs
+                stream = io.StringIO()
+                with ReportTSVWriter(stream, block_size=block_size, background=background) as writer:
+                    for report in amsr.reports:
+                        writer.write(report)
+                assert stream.getvalue() == expected_tsv
+
+    def test_block_writer_error(self):
+        class FailingStream:
+            def write(self, text):
+                raise OSError('disk full')
+
+        writer = sample_writer(FailingStream(), block_size=1, background=True, queue_blocks=1)
+        with self.assertRaises(OSError):
+            with writer:
+                for i in range(100):
+                    writer.write({'id': f'x:{i}'})
+
+    def test_interrupted_write(self):
+        # output of a run that failed part way is not a valid, complete array
+        stream = io.StringIO()
+        with self.assertRaises(RuntimeError):
+            with sample_writer(stream) as writer:
+                writer.write({'id': 'x:1'})
+                raise RuntimeError('annotation failed')
+        assert stream.getvalue() == '[\n    {\n        "id": "x:1"\n    }'
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.StringIO(stream.getvalue())))
@@ -4,10 +4,14 @@ from tests import MODEL_DIR, INPUT_DIR, OUTPUT_DIR
 
 from sample_annotator import SampleAnnotator
 from sample_annotator.metadata.sample_schema import SampleSchema
+from sample_annotator.metadata.schema_snapshot import load_compiled_schema, read_snapshot, file_digest, \
+    MAGIC, SNAPSHOT_MODE, UMASK
 
 """Test the module can be imported."""
 
 import unittest
+import json
+import tempfile
 
 
 class TestAnnotate(unittest.TestCase):
@@ -29,3 +33,52 @@ class TestAnnotate(unittest.TestCase):
         assert s is not None
         assert s.get('name') == 'tot_part_carb'
 
+
+    def test_alias_index(self):
+        schema = SampleSchema()
+        for k in ['Total Particulate Carbon', 'total-particulate_carbon', ' TOT_PART_CARB ']:
+            s = schema.get_slot(k, use_aliases=True)
+            assert s is not None
+            assert s.get('name') == 'tot_part_carb'
+        assert schema.get_slot('env_biome', use_aliases=True).get('name') == 'env_broad_scale'
+        assert schema.get_slot('env_biome') is None
+        assert schema.get_slot('no such field', use_aliases=True) is None
+        # the index agrees with a scan over all aliases
+        for slot in schema.slotdict().values():
+            for a in slot.get('aliases', []):
+                found = schema.get_slot(a, use_aliases=True)
+                assert a in found.get('aliases', []) or found.get('name') == a
+
+    def test_snapshot(self):
+        full = SampleSchema(use_snapshot=False)
+        with tempfile.TemporaryDirectory() as d:
+            schema = SampleSchema(snapshot_path=os.path.join(d, 'mixs.snapshot'))
+            s = schema.get_slot('tot_part_carb')
+            assert s.get('range') == full.get_slot('tot_part_carb').get('range')
+            assert s.get('aliases') == ['total particulate carbon']
+            assert schema.get_enumerations('rel_to_oxygen') is not None
+            assert set(schema.slotdict()) == set(full.slotdict())
+            # snapshot is rebuilt when the source schema changes
+            schema_path = os.path.join(d, 'mixs.json')
+            snapshot_path = os.path.join(d, 'test.snapshot')
+            with open(schema_path, 'w') as stream:
+                json.dump({'slots': {'a': {'name': 'a', 'range': 'string'}}, 'enums': {}}, stream)
+            assert 'a' in load_compiled_schema(schema_path, snapshot_path)['slots']
+            with open(schema_path, 'w') as stream:
+                json.dump({'slots': {'b': {'name': 'b', 'range': 'string'}}, 'enums': {}}, stream)
+            assert read_snapshot(snapshot_path, file_digest(schema_path)) is None
+            assert 'b' in load_compiled_schema(schema_path, snapshot_path)['slots']
+            assert read_snapshot(snapshot_path, file_digest(schema_path)) is not None
+            # readable by others, as far as the umask allows
+            assert os.stat(snapshot_path).st_mode & 0o777 == SNAPSHOT_MODE & ~UMASK
+            # a truncated snapshot is recompiled
+            with open(snapshot_path, 'r+b') as stream:
+                stream.truncate(os.path.getsize(snapshot_path) - 10)
+            assert read_snapshot(snapshot_path, file_digest(schema_path)) is None
+            assert 'b' in load_compiled_schema(schema_path, snapshot_path)['slots']
+            assert read_snapshot(snapshot_path, file_digest(schema_path)) is not None
+            # so is one that refers to a class or module that no longer exists
+            for payload in [b'cno_such_module\nthing\n.', b'cbuiltins\nno_such_name\n.']:
+                with open(snapshot_path, 'wb') as stream:
+                    stream.write(MAGIC + file_digest(schema_path) + payload)
+                assert read_snapshot(snapshot_path, file_digest(schema_path)) is None
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+import http.client
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+from sample_annotator import SampleAnnotator, GeoEngine
+from sample_annotator.service import AnnotationService, report_json
+from sample_annotator.stages import AnnotationStage
+from tests.test_geo_async import StandInWMS
+from tests.test_parallel import load_samples
+
+"""Test the annotation HTTP service."""
+
+import unittest
+
+
+class OverlapAnnotator(SampleAnnotator):
+    """
+    Records the most samples being annotated at once
+    """
+    in_flight = 0
+    max_in_flight = 0
+
+    def count_overlap(self, sample, report):
+        OverlapAnnotator.in_flight += 1
+        OverlapAnnotator.max_in_flight = max(OverlapAnnotator.max_in_flight, OverlapAnnotator.in_flight)
+        time.sleep(0.02)
+        OverlapAnnotator.in_flight -= 1
+
+
+def serve(service: AnnotationService):
+    server = service.make_server('127.0.0.1', 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def request(server, method: str, path: str, body=None, chunked: bool = False):
+    conn = http.client.HTTPConnection(*server.server_address[:2], timeout=60)
+    conn.request(method, path, body=body, encode_chunked=chunked,
+                 headers={'Transfer-Encoding': 'chunked'} if chunked else {})
+    response = conn.getresponse()
+    data = response.read()
+    conn.close()
+    return response, data
+
+
+class TestService(unittest.TestCase):
+    """annotation service test."""
+
+    @classmethod
+    def setUpClass(cls):
+        annotator = SampleAnnotator()
+        annotator.select_stages(skip=['remote'])
+        cls.service = AnnotationService(annotator, chunk_size=2)
+        cls.service.start()
+        cls.server = serve(cls.service)
+        cls.samples = load_samples()
+        cls.expected = [report_json(annotator.annotate(sample)) for sample in cls.samples]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.service.close()
+
+    def request(self, method: str, path: str, body=None, chunked: bool = False):
+        return request(self.server, method, path, body=body, chunked=chunked)
+
+    def test_health(self):
+        response, data = self.request('GET', '/health')
+        assert response.status == 200
+        health = json.loads(data)
+        assert health['status'] == 'ok'
+        assert 'perform_geolocation_inference' not in health['stages']
+
+    def test_batch(self):
+        response, data = self.request('POST', '/annotate', body=json.dumps(self.samples))
+        assert response.status == 200
+        # round trip through JSON, e.g. tuples become lists
+        assert json.loads(data)['reports'] == json.loads(json.dumps(self.expected))
+        response, data = self.request('POST', '/annotate', body=json.dumps(self.samples[0]))
+        assert len(json.loads(data)['reports']) == 1
+        response, data = self.request('POST', '/annotate', body='[1, 2]')
+        assert response.status == 400
+        response, data = self.request('POST', '/nowhere', body='[]')
+        assert response.status == 404
+
+    def test_stream(self):
+        body = '\n'.join(json.dumps(sample) for sample in self.samples) + '\n'
+        response, data = self.request('POST', '/annotate/stream', body=body)
+        assert response.status == 200
+        assert response.getheader('Transfer-Encoding') == 'chunked'
+        reports = [json.loads(line) for line in data.splitlines()]
+        assert reports == json.loads(json.dumps(self.expected))
+        # chunked request bodies too
+        chunks = (line.encode() + b'\n' for line in body.splitlines())
+        response, data = self.request('POST', '/annotate/stream', body=chunks, chunked=True)
+        assert [json.loads(line) for line in data.splitlines()] == reports
+        response, data = self.request('POST', '/annotate/stream', body=body + 'oops\n')
+        lines = [json.loads(line) for line in data.splitlines()]
+        # reports for the blocks before the bad line, then the error
+        assert lines[:-1] == reports[:len(lines) - 1]
+        assert 'error' in lines[-1]
+
+    def test_annotation_error(self):
+        # a non-string id fails in the identifier check
+        response, data = self.request('POST', '/annotate', body=json.dumps([{'id': 123}]))
+        assert response.status == 500
+        assert json.loads(data)['error'].startswith('Annotation failed: TypeError')
+        body = json.dumps(self.samples[0]) + '\n' + json.dumps({'id': 123}) + '\n'
+        response, data = self.request('POST', '/annotate/stream', body=body)
+        lines = [json.loads(line) for line in data.splitlines()]
+        assert lines[-1]['error'].startswith('Annotation failed: TypeError')
+        # and the server carries on
+        response, data = self.request('GET', '/health')
+        assert response.status == 200
+
+    def test_one_at_a_time(self):
+        # requests annotated in the server process do not share the annotator at once
+        annotator = OverlapAnnotator()
+        annotator.register_stage(AnnotationStage('count_overlap'))
+        annotator.select_stages(['count_overlap'])
+        service = AnnotationService(annotator, chunk_size=10)
+        server = serve(service)
+        OverlapAnnotator.max_in_flight = 0
+        try:
+            body = json.dumps([{'id': f'TEST:{i}'} for i in range(3)])
+            with ThreadPoolExecutor(4) as pool:
+                responses = list(pool.map(lambda _: request(server, 'POST', '/annotate', body=body), range(4)))
+                lines = '\n'.join(json.dumps({'id': f'TEST:{i}'}) for i in range(3))
+                responses += list(pool.map(lambda _: request(server, 'POST', '/annotate/stream', body=lines), range(4)))
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert [response.status for response, _ in responses] == [200] * 8
+        assert OverlapAnnotator.max_in_flight == 1
+
+
+class TestServicePool(unittest.TestCase):
+    """annotation service worker pool test."""
+
+    def test_geo_fetched_once(self):
+        wms = ThreadingHTTPServer(('127.0.0.1', 0), StandInWMS)
+        threading.Thread(target=wms.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{wms.server_address[1]}'
+        StandInWMS.requests = []
+        annotator = SampleAnnotator(geoengine=GeoEngine(elevation_url=url + '/wms', soil_url=url + '/mapserv'))
+        annotator.select_stages(skip=['model'])
+        service = AnnotationService(annotator, workers=2, chunk_size=2)
+        try:
+            service.start()
+            samples = [{'id': f'TEST:{i}', 'lat_lon': f'{i}.25 20.25'} for i in range(6)]
+            reports = service.annotate_batch(samples)
+        finally:
+            service.close()
+            wms.shutdown()
+            wms.server_close()
+        # one elevation and one soil request per point, made by the worker that annotates it
+        assert len(StandInWMS.requests) == 12
+        assert [r.output['elev']['has_numeric_value'] for r in reports] == [str(i) for i in range(6)]
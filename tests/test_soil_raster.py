@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+from sample_annotator import GeoEngine
+from sample_annotator.geolocation.soil_raster import ZoblerSoilRaster, ZOBLER_SHAPE, load_zobler_table
+
+"""Test offline soil type lookup."""
+
+import unittest
+
+
+def make_raster(path: str, legend_path: str = None) -> None:
+    """
+    Synthetic Zobler grid: every cell is water except the cell of the NEON TALL site
+    """
+    table = load_zobler_table()
+    codes = np.ones(ZOBLER_SHAPE, dtype=np.uint8)
+    cambisol = [i + 1 for i, (name, _) in enumerate(table) if name == 'CALCIC CAMBISOL'][0]
+    # 32.95047, -87.393259 is in row 359 - floor(122.95 / 0.5), column floor(92.6 / 0.5)
+    codes[359 - 245, 185] = cambisol
+    codes[0, 0] = 0
+    np.save(path, codes)
+
+
+class TestSoilRaster(unittest.TestCase):
+    """offline soil test."""
+
+    def test_soil_raster(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'zobler.npy')
+            make_raster(path)
+            ge = GeoEngine(soil_raster=ZoblerSoilRaster(path))
+            assert ge.get_fao_soil_type((32.95047, -87.393259)) == 'Cambisols'
+            latlons = [(32.95047, -87.393259), (0.0, 0.0), (89.9, -179.9), (-90.0, 180.0)]
+            assert ge.get_fao_soil_types(latlons) == ['Cambisols', 'Water', None, 'Water']
+            assert ge.get_fao_soil_types([]) == []
+            # workers re-map the grid
+            ge2 = pickle.loads(pickle.dumps(ge))
+            assert ge2.get_fao_soil_type((32.95047, -87.393259)) == 'Cambisols'
+            legend = os.path.join(d, 'legend.csv')
+            with open(legend, 'w') as stream:
+                stream.write('code,name\n1,WATER/OCEAN/LAKE\n')
+            raster = ZoblerSoilRaster(path, legend_path=legend)
+            assert raster.get_fao_soil_types(latlons) == [None, 'Water', None, 'Water']
+
+    def test_negative_codes(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'zobler.npy')
+            codes = np.ones(ZOBLER_SHAPE, dtype=np.int16)
+            # e.g. a grid converted with -1 as its no data value
+            codes[0, 0] = -1
+            np.save(path, codes)
+            raster = ZoblerSoilRaster(path)
+            assert raster.get_fao_soil_types([(89.9, -179.9), (0.0, 0.0)]) == [None, 'Water']
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from sample_annotator import SampleAnnotator
+from sample_annotator.geolocation.offline import OfflineGeoEngine
+from sample_annotator.sample_annotator import ANNOTATION_STAGES
+from sample_annotator.stages import AnnotationStage, DEFAULT_STAGES, resolve_stages
+from tests.test_parallel import load_samples
+
+"""Test selecting annotation stages."""
+
+import unittest
+
+
+class TestStages(unittest.TestCase):
+    """annotation stage test."""
+
+    def test_resolve(self):
+        assert resolve_stages(DEFAULT_STAGES) == ANNOTATION_STAGES
+        assert resolve_stages(DEFAULT_STAGES, skipped=['remote', 'model']) == \
+            ['validate_identifier', 'infer_package', 'tidy_nulls', 'tidy_keys', 'tidy_enumerations', 'tidy_measurements']
+        # dependencies are brought in
+        assert resolve_stages(DEFAULT_STAGES, ['perform_geolocation_inference']) == \
+            ['validate_identifier', 'tidy_nulls', 'tidy_keys', 'perform_geolocation_inference']
+        assert resolve_stages(DEFAULT_STAGES, ['model']) == \
+            ['validate_identifier', 'tidy_nulls', 'tidy_keys', 'perform_text_mining', 'perform_inference']
+        assert resolve_stages(DEFAULT_STAGES, ['fast'], ['infer_package', 'tidy_measurements']) == \
+            ['validate_identifier', 'tidy_nulls', 'tidy_keys', 'tidy_enumerations']
+        # enumerations are checked under slot names, once nulls are dropped
+        assert resolve_stages(DEFAULT_STAGES, ['tidy_enumerations']) == ['tidy_nulls', 'tidy_keys', 'tidy_enumerations']
+        with self.assertRaises(ValueError):
+            resolve_stages(DEFAULT_STAGES, ['remote'], ['tidy_keys'])
+        with self.assertRaises(ValueError):
+            resolve_stages(DEFAULT_STAGES, ['remote'], ['validate_identifier'])
+        with self.assertRaises(ValueError):
+            resolve_stages(DEFAULT_STAGES, ['no_such_stage'])
+
+    def test_select(self):
+        samples = load_samples()
+        full = SampleAnnotator(geoengine=OfflineGeoEngine()).annotate_all(samples)
+        annotator = SampleAnnotator(geoengine=OfflineGeoEngine())
+        annotator.select_stages(skip=['remote', 'model'])
+        quick = annotator.annotate_all(samples)
+        # no geolocation, and nothing prefetched for it
+        assert list(quick.timings.durations) == ['validate_identifier', 'infer_package', 'tidy_nulls', 'tidy_keys', 'tidy_enumerations', 'tidy_measurements']
+        assert annotator.geoengine.get_cache().stats()['size'] == 0
+        for r, q in zip(full.reports, quick.reports):
+            assert q.output.get('elev') == r.input.get('elev')
+            # the quick checks give the first messages of a full run
+            assert q.messages == r.messages[:len(q.messages)]
+        # enrichment on its own still identifies the samples
+        annotator.select_stages(['remote'])
+        enriched = annotator.annotate_all(samples)
+        assert [e.sample_id for e in enriched.reports] == [r.sample_id for r in full.reports]
+        assert any(e.sample_id is not None for e in enriched.reports)
+
+    def test_register(self):
+        class CountingAnnotator(SampleAnnotator):
+            def count_fields(self, sample, report):
+                report.add_message('{} fields', params=(len(sample),), severity=0)
+
+        annotator = CountingAnnotator()
+        annotator.register_stage(AnnotationStage('count_fields', ['tidy_nulls']))
+        assert annotator.select_stages(['count_fields']) == ['tidy_nulls', 'count_fields']
+        report = annotator.annotate({'id': 'TEST:1', 'depth': '1 m', 'elev': ''})
+        assert report.messages[-1].description == '2 fields'
+        with self.assertRaises(ValueError):
+            annotator.register_stage(AnnotationStage('no_such_method'))
+        with self.assertRaises(ValueError):
+            annotator.register_stage(AnnotationStage('count_fields', ['no_such_stage']))
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from sample_annotator import SampleAnnotator
+from sample_annotator.sample_annotator import ANNOTATION_STAGES
+from sample_annotator.timings import StageTimings
+from tests.test_parallel import load_samples
+
+"""Test per-stage timing."""
+
+import unittest
+
+
+class TestTimings(unittest.TestCase):
+    """stage timing test."""
+
+    def test_summary(self):
+        timings = StageTimings()
+        for i in range(1, 101):
+            timings.record('a', i / 1000)
+        other = StageTimings()
+        other.record('b', 2.0)
+        other.record('a', 1.0)
+        timings.merge(other)
+        rows = {row['stage']: row for row in timings.summary()}
+        assert list(rows) == ['a', 'b']
+        assert rows['a']['count'] == 101
+        assert abs(rows['a']['total'] - 6.05) < 1e-9
+        assert abs(rows['a']['p50'] - 0.051) < 1e-9
+        assert rows['a']['p99'] > rows['a']['p95'] > rows['a']['p50']
+        assert rows['b']['count'] == 1
+        assert 'p99_ms' in timings.format()
+
+    def test_annotate_all(self):
+        annotator = SampleAnnotator()
+        samples = load_samples() * 3
+        for workers in [1, 2]:
+            amsr = annotator.annotate_all(samples, workers=workers, chunk_size=4)
+            rows = {row['stage']: row for row in amsr.timings.summary()}
+            assert list(rows) == ['geo_prefetch'] + ANNOTATION_STAGES
+            # with workers, each chunk is prefetched by the worker that annotates it
+            assert rows['geo_prefetch']['count'] == (1 if workers == 1 else (len(samples) + 3) // 4)
+            for stage in ANNOTATION_STAGES:
+                assert rows[stage]['count'] == len(samples)
+                assert rows[stage]['total'] >= 0
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from sample_annotator.geolocation.wms_tiles import parse_ascii_grid, plan_tiles, tile_bbox, coverage_params
+
+"""Test tile planning and coverage parsing."""
+
+import unittest
+
+GRID = """ncols 3
+nrows 2
+xllcorner 10.0
+yllcorner 20.0
+cellsize 0.5
+NODATA_value -9999
+1 2 3
+4 -9999 6
+"""
+
+
+class TestWMSTiles(unittest.TestCase):
+    """tile planning test."""
+
+    def test_parse_ascii_grid(self):
+        tile = parse_ascii_grid(GRID)
+        assert tile.values.shape == (2, 3)
+        lats = np.array([20.9, 20.1, 20.1, 20.1, 25.0])
+        lons = np.array([10.1, 10.1, 10.7, 11.4, 10.1])
+        values = tile.sample(lats, lons)
+        assert values[:2].tolist() == [1, 4]
+        # no data and outside the tile
+        assert np.isnan(values[2])
+        assert values[3] == 6
+        assert np.isnan(values[4])
+
+    def test_plan_tiles(self):
+        latlons = [(10.2, 20.2), (10.8, 20.9), (-0.5, -0.5), (10.5, 21.1)]
+        plan = plan_tiles(latlons, 1.0)
+        assert plan == {(20, 10): [0, 1], (-1, -1): [2], (21, 10): [3]}
+        assert tile_bbox((-1, -1), 1.0) == (-1.0, -1.0, 0.0, 0.0)
+        params = coverage_params('10003_1', tile_bbox((20, 10), 2.0), 0.008333333333333)
+        assert params['BBOX'] == '40.0,20.0,42.0,22.0'
+        assert params['WIDTH'] == '240'
+        assert params['HEIGHT'] == '240'